@@ -0,0 +1,132 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class HashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many logins in progress, please retry shortly.'
+    default_code = 'hashing_busy'
+    # Sent as Retry-After by DRF's exception handler
+    wait = 1
+
+
+class HashingPool:
+    """
+    Runs password hashes on a bounded set of threads (AUTH_HASHING_WORKERS).
+
+    At most ``workers`` hashes run at once and at most ``queue`` more wait for
+    a thread; callers beyond that get HashingBusy straight away. A login storm
+    therefore ties up at most ``workers + queue`` request threads, and the
+    others keep serving token refreshes and health checks. Argon2 and PBKDF2
+    release the GIL while hashing, so the workers use separate cores. With
+    ``workers = 0`` hashes run on the calling thread.
+    """
+
+    def __init__(self, workers=2, queue=2):
+        self.workers = workers
+        self.queue = queue
+        self._local = threading.local()
+        self._forget_executor()
+        self.hashed = 0
+        self.rejected = 0
+        # A forked worker doesn't inherit the parent's threads. Reset them on
+        # fork rather than comparing pids on every hash.
+        os.register_at_fork(after_in_child=self._forget_executor)
+
+    def run(self, func, *args):
+        # PBKDF2 verifies by encoding, which is already on a pool thread then
+        if self._slots is None or getattr(self._local, 'worker', False):
+            return func(*args)
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingBusy()
+        try:
+            with self._lock:
+                self.in_flight += 1
+            result = self._get_executor().submit(func, *args).result()
+            with self._lock:
+                self.hashed += 1
+            return result
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue': self.queue,
+                'in_flight': self.in_flight,
+                'hashed': self.hashed,
+                'rejected': self.rejected,
+            }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix='hashing', initializer=self._init_worker,
+                )
+            return self._executor
+
+    def _forget_executor(self):
+        # Also the slots and lock, which the parent's in-flight hashes may hold
+        self._slots = threading.BoundedSemaphore(self.workers + self.queue) if self.workers else None
+        self._lock = threading.Lock()
+        self._executor = None
+        self.in_flight = 0
+
+    def _init_worker(self):
+        self._local.worker = True
+
+
+hashing_pool = HashingPool(workers=settings.AUTH_HASHING_WORKERS, queue=settings.AUTH_HASHING_QUEUE)
+
+
+class PooledHasherMixin:
+    """Hash and verify on hashing_pool rather than the request thread."""
+
+    def encode(self, password, salt, *args):
+        return hashing_pool.run(super().encode, password, salt, *args)
+
+    def verify(self, password, encoded):
+        return hashing_pool.run(super().verify, password, encoded)
+
+
+class Argon2PasswordHasher(PooledHasherMixin, hashers.Argon2PasswordHasher):
+    """
+    Argon2id with the costs of the AUTH_ARGON2_* settings. Hashes made with
+    other costs are rehashed on the next successful login.
+    """
+
+    @property
+    def time_cost(self):
+        return settings.AUTH_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.AUTH_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.AUTH_ARGON2_PARALLELISM
+
+
+class PBKDF2PasswordHasher(PooledHasherMixin, hashers.PBKDF2PasswordHasher):
+    """
+    PBKDF2-SHA256 with AUTH_PBKDF2_ITERATIONS iterations, Django's default
+    when unset. Hashes made with another count are rehashed on the next
+    successful login.
+    """
+
+    @property
+    def iterations(self):
+        return settings.AUTH_PBKDF2_ITERATIONS or hashers.PBKDF2PasswordHasher.iterations
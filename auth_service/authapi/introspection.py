@@ -0,0 +1,72 @@
+from django.conf import settings
+from django.contrib.auth.models import User
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from .token_cache import TokenCache
+from .revocation import denylist
+from .tokens import AccessToken
+
+INVALID = {'valid': False}
+
+# Results of valid tokens, so gateways re-checking the same token skip the
+# signature check
+token_cache = TokenCache(
+    max_entries=settings.JWT_INTROSPECTION_CACHE_SIZE,
+    max_ttl=settings.JWT_INTROSPECTION_CACHE_TTL,
+)
+
+
+def introspect(tokens):
+    """
+    Check access tokens and return, in the same order, ``{'valid': True,
+    'user_id', 'username', 'exp'}`` or ``{'valid': False}`` for each one.
+
+    Tokens are verified locally (signature, type and expiry) and the identity
+    comes from their claims, so no query is made except one shared lookup for
+    tokens issued without the username claim. Users deleted since a token was
+    issued are only noticed for those. Revoked tokens are invalid, including
+    ones already cached.
+    """
+    results = {}
+    unnamed = {}
+    jtis = {}
+    for token in dict.fromkeys(tokens):
+        cached = token_cache.get(token)
+        if cached is not None:
+            jti, result = cached
+            # Revoked since it was cached
+            if jti in denylist:
+                result = INVALID
+        else:
+            jti, result = decode(token)
+            if result.get('username') is not None:
+                token_cache.set(token, (jti, result), result['exp'])
+            elif result['valid']:
+                jtis[token] = jti
+                unnamed.setdefault(result['user_id'], []).append(token)
+        results[token] = result
+
+    if unnamed:
+        usernames = dict(User.objects.filter(id__in=unnamed).values_list('id', 'username'))
+        for user_id, user_tokens in unnamed.items():
+            for token in user_tokens:
+                if user_id not in usernames:
+                    results[token] = INVALID
+                    continue
+                result = results[token] = {**results[token], 'username': usernames[user_id]}
+                token_cache.set(token, (jtis[token], result), result['exp'])
+    return [results[token] for token in tokens]
+
+
+def decode(token):
+    # (jti, result); verifying the token also checks it wasn't revoked
+    try:
+        claims = AccessToken(token).payload
+    except TokenError:
+        return None, INVALID
+    user_id = claims.get(api_settings.USER_ID_CLAIM)
+    if user_id is None:
+        return None, INVALID
+    result = {'valid': True, 'user_id': user_id, 'username': claims.get('username'), 'exp': claims['exp']}
+    return claims.get(api_settings.JTI_CLAIM), result
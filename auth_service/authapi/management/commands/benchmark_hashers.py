@@ -0,0 +1,93 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.core.management.base import BaseCommand
+
+from authapi.hashers import HashingPool
+
+PASSWORD = 'S3cure-pass!'
+
+
+def argon2(time_cost, memory_cost, parallelism):
+    hasher = hashers.Argon2PasswordHasher()
+    hasher.time_cost, hasher.memory_cost, hasher.parallelism = time_cost, memory_cost, parallelism
+    return hasher
+
+
+def pbkdf2(iterations):
+    hasher = hashers.PBKDF2PasswordHasher()
+    hasher.iterations = iterations
+    return hasher
+
+
+class Command(BaseCommand):
+    help = (
+        'Report how many logins per second one core verifies under each password '
+        "hashing policy: Django's default PBKDF2 and Argon2 costs, and the ones "
+        'configured by AUTH_PBKDF2_ITERATIONS and AUTH_ARGON2_*. Logins are also '
+        'run from concurrent clients through a hashing pool to show how it scales.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=3, help='Time spent on each measurement')
+        parser.add_argument('--threads', type=int, default=os.cpu_count(),
+                            help='Hashing pool workers (and concurrent clients) for the pooled runs')
+
+    def handle(self, *args, **options):
+        default_pbkdf2 = hashers.PBKDF2PasswordHasher.iterations
+        default_argon2 = hashers.Argon2PasswordHasher
+        policies = [
+            ('pbkdf2 (Django)', pbkdf2(default_pbkdf2)),
+            ('pbkdf2 (settings)', pbkdf2(settings.AUTH_PBKDF2_ITERATIONS or default_pbkdf2)),
+            ('argon2 (Django)', argon2(default_argon2.time_cost, default_argon2.memory_cost,
+                                       default_argon2.parallelism)),
+            ('argon2 (settings)', argon2(settings.AUTH_ARGON2_TIME_COST, settings.AUTH_ARGON2_MEMORY_COST,
+                                         settings.AUTH_ARGON2_PARALLELISM)),
+        ]
+
+        threads = options['threads']
+        self.stdout.write(f"{'policy':<18} {'parameters':<24} {'ms/login':>9} {'logins/s/core':>14} "
+                          f"{f'logins/s x{threads}':>15}")
+        for name, hasher in policies:
+            encoded = hasher.encode(PASSWORD, hasher.salt())
+            # A successful login: verify, then check whether the hash needs an upgrade
+            login = lambda: hasher.verify(PASSWORD, encoded) and not hasher.must_update(encoded)
+            wall_ms, per_core = self.measure(login, options['seconds'])
+            pooled = self.measure_pooled(login, threads, options['seconds'])
+            self.stdout.write(f'{name:<18} {self.parameters(hasher):<24} {wall_ms:>9.1f} {per_core:>14.1f} '
+                              f'{pooled:>15.1f}')
+
+    def parameters(self, hasher):
+        if isinstance(hasher, hashers.Argon2PasswordHasher):
+            return f'm={hasher.memory_cost},t={hasher.time_cost},p={hasher.parallelism}'
+        return f'{hasher.iterations} iterations'
+
+    def measure(self, login, seconds):
+        # CPU time rather than wall time: Argon2 spreads lanes over threads
+        logins, started, cpu_started = 0, time.perf_counter(), time.process_time()
+        while time.perf_counter() - started < seconds:
+            assert login()
+            logins += 1
+        wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+        return wall / logins * 1000, logins / cpu
+
+    def measure_pooled(self, login, threads, seconds):
+        pool = HashingPool(workers=threads, queue=0)
+        deadline = time.perf_counter() + seconds
+        counts = [0] * threads
+
+        def client(index):
+            while time.perf_counter() < deadline:
+                assert pool.run(login)
+                counts[index] += 1
+
+        clients = [threading.Thread(target=client, args=(index,)) for index in range(threads)]
+        started = time.perf_counter()
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        return sum(counts) / (time.perf_counter() - started)
@@ -1,3 +1,15 @@
 from django.db import models
 
-# Create your models here. 
\ No newline at end of file
+
+class RevokedToken(models.Model):
+    """
+    The revocation log: one entry per revoked token, kept until the token
+    expires. Services follow it by id (/revocations/) to keep their
+    denylists current.
+    """
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,61 @@
+import threading
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone as django_timezone
+from rest_framework_simplejwt.settings import api_settings
+
+from core.denylist import Denylist
+
+from .models import RevokedToken
+
+
+class DatabaseDenylist(Denylist):
+    """Denylist that follows the revocation log straight from the database."""
+
+    def fetch(self, after):
+        return log_entries(after)
+
+    def start(self):
+        try:
+            super().start()
+        finally:
+            # Started before the worker serves requests; its connection isn't needed
+            connection.close()
+
+    def sync(self):
+        try:
+            return super().sync()
+        finally:
+            # The poller doesn't hold a connection between polls
+            if threading.current_thread() is self._thread:
+                connection.close()
+
+
+denylist = DatabaseDenylist(poll_interval=settings.JWT_REVOCATION_POLL_INTERVAL)
+
+
+def log_entries(after):
+    """The unexpired revocations logged after id ``after``, oldest first."""
+    entries = (
+        RevokedToken.objects
+        .filter(id__gt=after, expires_at__gt=django_timezone.now())
+        .order_by('id')
+        .values_list('id', 'jti', 'expires_at')
+    )[:settings.JWT_REVOCATION_PAGE_SIZE]
+    return [{'id': id, 'jti': jti, 'exp': int(expires_at.timestamp())} for id, jti, expires_at in entries]
+
+
+def revoke(token):
+    """
+    Revoke a verified simplejwt token until it expires. It is refused by
+    this process at once and by the others at their next poll.
+    """
+    jti, exp = token[api_settings.JTI_CLAIM], token['exp']
+    RevokedToken.objects.get_or_create(
+        jti=jti, defaults={'expires_at': datetime.fromtimestamp(exp, tz=timezone.utc)},
+    )
+    denylist.add(jti, exp)
+    # Expired tokens are rejected anyway, so the log only keeps live ones
+    RevokedToken.objects.filter(expires_at__lte=django_timezone.now()).delete()
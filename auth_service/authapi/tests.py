@@ -0,0 +1,397 @@
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import addModuleCleanup, mock
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ed25519, rsa
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, identify_hasher, make_password
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from core.throttling import buckets, take_token
+
+from .hashers import HashingBusy, HashingPool, hashing_pool
+from .introspection import token_cache
+from .models import RevokedToken
+from .revocation import DatabaseDenylist, denylist
+from . import tokens
+from .tokens import RefreshToken as UsernameRefreshToken, load_signing_keys
+
+
+def setUpModule():
+    # The tests sync revocations themselves rather than from a poller thread
+    poller = mock.patch.object(denylist, '_ensure_poller')
+    poller.start()
+    addModuleCleanup(poller.stop)
+    # Only ThrottleTests enforce rate limits
+    rates = throttle_rates()
+    rates.enable()
+    addModuleCleanup(rates.disable)
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates})
+
+
+class TokenClaimsTests(APITestCase):
+    def test_register_embeds_username(self):
+        response = self.client.post('/register/', {'username': 'alice', 'password': 'S3cure-pass!'})
+        self.assertEqual(response.status_code, 201)
+
+        access = AccessToken(response.data['access'])
+        self.assertEqual(access['username'], 'alice')
+        self.assertEqual(access['user_id'], User.objects.get(username='alice').id)
+
+    def test_login_and_refresh_embed_username(self):
+        User.objects.create_user(username='bob', password='S3cure-pass!')
+        response = self.client.post('/login/', {'username': 'bob', 'password': 'S3cure-pass!'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(AccessToken(response.data['access'])['username'], 'bob')
+        self.assertEqual(RefreshToken(response.data['refresh'])['username'], 'bob')
+
+        response = self.client.post('/token/refresh/', {'refresh': response.data['refresh']})
+        self.assertEqual(AccessToken(response.data['access'])['username'], 'bob')
+
+
+PBKDF2_FIRST = ['authapi.hashers.PBKDF2PasswordHasher', 'authapi.hashers.Argon2PasswordHasher']
+
+
+class PasswordHashingTests(APITestCase):
+    def login(self, password='S3cure-pass!'):
+        return self.client.post('/login/', {'username': 'bob', 'password': password})
+
+    def test_new_passwords_use_the_policy(self):
+        self.client.post('/register/', {'username': 'alice', 'password': 'S3cure-pass!'})
+        self.assertTrue(User.objects.get().password.startswith('argon2$argon2id$v=19$m=19456,t=2,p=1$'))
+
+        with override_settings(PASSWORD_HASHERS=PBKDF2_FIRST, AUTH_PBKDF2_ITERATIONS=1000):
+            self.assertTrue(make_password('S3cure-pass!').startswith('pbkdf2_sha256$1000$'))
+
+    def test_login_rehashes_to_the_current_policy(self):
+        with override_settings(PASSWORD_HASHERS=PBKDF2_FIRST):
+            User.objects.create_user(username='bob', password='S3cure-pass!')
+        self.assertEqual(identify_hasher(User.objects.get().password).algorithm, 'pbkdf2_sha256')
+
+        # A failed login leaves the hash alone
+        self.assertEqual(self.login('wrong').status_code, 401)
+        self.assertTrue(User.objects.get().password.startswith('pbkdf2_sha256$'))
+
+        self.assertEqual(self.login().status_code, 200)
+        self.assertTrue(User.objects.get().password.startswith('argon2$argon2id$v=19$m=19456,t=2,p=1$'))
+
+        with override_settings(AUTH_ARGON2_MEMORY_COST=8192, AUTH_ARGON2_TIME_COST=3):
+            self.assertEqual(self.login().status_code, 200)
+        self.assertTrue(User.objects.get().password.startswith('argon2$argon2id$v=19$m=8192,t=3,p=1$'))
+        self.assertTrue(check_password('S3cure-pass!', User.objects.get().password))
+
+    def test_saturated_pool_sheds_logins(self):
+        User.objects.create_user(username='bob', password='S3cure-pass!')
+        slots = hashing_pool.workers + hashing_pool.queue
+        for _ in range(slots):
+            hashing_pool._slots.acquire()
+        try:
+            response = self.login()
+            registered = self.client.post('/register/', {'username': 'carol', 'password': 'S3cure-pass!'})
+        finally:
+            for _ in range(slots):
+                hashing_pool._slots.release()
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertEqual(registered.status_code, 503)
+        self.assertFalse(User.objects.filter(username='carol').exists())
+        self.assertEqual(self.login().status_code, 200)
+
+
+class HashingPoolTests(SimpleTestCase):
+    def test_runs_on_pool_threads(self):
+        pool = HashingPool(workers=1, queue=0)
+        self.assertTrue(pool.run(lambda: threading.current_thread().name).startswith('hashing'))
+        # Nested calls (PBKDF2 verify -> encode) run inline instead of deadlocking
+        self.assertEqual(pool.run(pool.run, lambda: 'nested'), 'nested')
+
+    def test_rejects_beyond_workers_and_queue(self):
+        pool = HashingPool(workers=1, queue=1)
+        started, release = threading.Event(), threading.Event()
+
+        def hash_slowly():
+            started.set()
+            release.wait(5)
+
+        threads = [threading.Thread(target=pool.run, args=(hash_slowly,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        started.wait(5)
+        with self.assertRaises(HashingBusy):
+            pool.run(hash_slowly)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(pool.stats()['rejected'], 1)
+        self.assertEqual(pool.run(lambda: 'done'), 'done')
+
+    def test_inline_without_workers(self):
+        pool = HashingPool(workers=0)
+        self.assertEqual(pool.run(lambda: threading.current_thread()), threading.current_thread())
+
+    def test_only_completed_hashes_are_counted(self):
+        pool = HashingPool(workers=1, queue=0)
+        with self.assertRaises(ValueError):
+            pool.run(int, 'not a number')
+        self.assertEqual(pool.run(int, '1'), 1)
+        self.assertEqual(pool.stats()['hashed'], 1)
+        self.assertEqual(pool.stats()['in_flight'], 0)
+
+    def test_forked_workers_start_their_own_threads(self):
+        pool = HashingPool(workers=1, queue=0)
+        pool.run(lambda: None)
+        executor = pool._get_executor()
+        # What a forked worker runs
+        pool._forget_executor()
+        self.assertIsNot(pool._get_executor(), executor)
+        self.assertEqual(pool.run(lambda: 'done'), 'done')
+        executor.shutdown()
+
+
+class IntrospectionTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.alice = User.objects.create_user(username='alice', password='S3cure-pass!')
+        self.bob = User.objects.create_user(username='bob', password='S3cure-pass!')
+
+    def access(self, user):
+        return UsernameRefreshToken.for_user(user).access_token
+
+    def introspect(self, tokens):
+        response = self.client.post('/introspect/', {'tokens': tokens}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_batch_is_checked_without_queries(self):
+        alice, bob = self.access(self.alice), self.access(self.bob)
+        expired = self.access(self.alice)
+        expired.set_exp(lifetime=-timedelta(seconds=1))
+        refresh = str(UsernameRefreshToken.for_user(self.bob))
+        tokens = [str(alice), str(bob), str(expired), refresh, 'garbage', str(alice)]
+
+        with self.assertNumQueries(0):
+            results = self.introspect(tokens)
+        self.assertEqual(results, [
+            {'valid': True, 'user_id': self.alice.id, 'username': 'alice', 'exp': alice['exp']},
+            {'valid': True, 'user_id': self.bob.id, 'username': 'bob', 'exp': bob['exp']},
+            {'valid': False}, {'valid': False}, {'valid': False},
+            {'valid': True, 'user_id': self.alice.id, 'username': 'alice', 'exp': alice['exp']},
+        ])
+
+        self.introspect(tokens)
+        self.assertEqual(token_cache.stats()['size'], 2)
+        self.assertEqual(token_cache.stats()['hits'], 2)
+
+    def test_tokens_without_username_share_one_query(self):
+        tokens = [str(AccessToken.for_user(user)) for user in (self.alice, self.bob)]
+        self.bob.delete()
+        with self.assertNumQueries(1):
+            results = self.introspect(tokens)
+        self.assertEqual(results[0]['username'], 'alice')
+        self.assertEqual(results[1], {'valid': False})
+        with self.assertNumQueries(0):
+            self.introspect(tokens[:1])
+
+    def test_rejects_bad_input(self):
+        for body in ({}, {'tokens': []}, {'tokens': 'abc'}, {'tokens': [1]}, {'tokens': ['abc'] * 101}, ['abc'], 'abc'):
+            with self.subTest(body=body):
+                self.assertEqual(self.client.post('/introspect/', body, format='json').status_code, 400)
+
+    def test_verify_token_checks_the_posted_token(self):
+        token = str(self.access(self.alice))
+        # The caller's own Authorization header plays no part
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer garbage')
+        response = self.client.post('/verify-token/', {'token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'valid': True, 'user_id': self.alice.id, 'username': 'alice'})
+        self.assertEqual(self.client.post('/verify-token/', {'token': 'garbage'}).status_code, 401)
+        self.assertEqual(self.client.post('/verify-token/', {}).status_code, 400)
+        self.assertEqual(self.client.post('/verify-token/', [token], format='json').status_code, 400)
+
+
+class AsymmetricSigningTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        User.objects.create_user(username='bob', password='S3cure-pass!')
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def key_files(self, algorithm):
+        if algorithm == 'RS256':
+            key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        else:
+            key = ed25519.Ed25519PrivateKey.generate()
+        private, public = tempfile.mkstemp(dir=self.directory.name)[1], tempfile.mkstemp(dir=self.directory.name)[1]
+        with open(private, 'wb') as f:
+            f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                      serialization.NoEncryption()))
+        with open(public, 'wb') as f:
+            f.write(key.public_key().public_bytes(serialization.Encoding.PEM,
+                                                  serialization.PublicFormat.SubjectPublicKeyInfo))
+        return private, public
+
+    def signing_with(self, backend):
+        for token_class in (tokens.AccessToken, tokens.RefreshToken):
+            patcher = mock.patch.object(token_class, '_token_backend', backend)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_tokens_name_their_published_key(self):
+        for algorithm in ('RS256', 'EdDSA'):
+            with self.subTest(algorithm=algorithm):
+                backend, document = load_signing_keys(algorithm, private_key_file=self.key_files(algorithm)[0])
+                self.signing_with(backend)
+                response = self.client.post('/login/', {'username': 'bob', 'password': 'S3cure-pass!'})
+                access, refresh = response.data['access'], response.data['refresh']
+
+                header = jwt.get_unverified_header(access)
+                published, = document['keys']
+                self.assertEqual((header['alg'], header['kid']), (algorithm, published['kid']))
+                claims = jwt.decode(access, jwt.PyJWK(published).key, algorithms=[algorithm])
+                self.assertEqual(claims['username'], 'bob')
+
+                self.assertTrue(self.client.post('/verify-token/', {'token': access}).data['valid'])
+                refreshed = self.client.post('/token/refresh/', {'refresh': refresh})
+                self.assertEqual(refreshed.status_code, 200)
+                self.assertEqual(jwt.get_unverified_header(refreshed.data['access'])['kid'], published['kid'])
+
+    def test_retired_keys_verify_until_unpublished(self):
+        old_private, old_public = self.key_files('RS256')
+        new_private, _ = self.key_files('RS256')
+        old_backend, _ = load_signing_keys('RS256', private_key_file=old_private)
+        self.signing_with(old_backend)
+        token = str(tokens.AccessToken.for_user(User.objects.get()))
+
+        rolled, document = load_signing_keys('RS256', private_key_file=new_private, public_key_files=[old_public])
+        self.assertEqual(len(document['keys']), 2)
+        self.assertEqual(rolled.decode(token)['user_id'], User.objects.get().id)
+        unpublished, _ = load_signing_keys('RS256', private_key_file=new_private)
+        with self.assertRaises(TokenBackendError):
+            unpublished.decode(token)
+
+    def test_shared_secret_tokens_are_rejected(self):
+        backend, _ = load_signing_keys('RS256', private_key_file=self.key_files('RS256')[0])
+        self.signing_with(backend)
+        hs256 = AccessToken.for_user(User.objects.get())
+        self.assertEqual(self.client.post('/verify-token/', {'token': str(hs256)}).status_code, 401)
+
+    def test_jwks_endpoint(self):
+        _, document = load_signing_keys('EdDSA', private_key_file=self.key_files('EdDSA')[0])
+        with mock.patch.object(tokens, 'jwks', document):
+            response = self.client.get('/.well-known/jwks.json')
+        self.assertEqual(response.json(), document)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=300')
+        self.assertEqual(set(document['keys'][0]), {'kty', 'crv', 'x', 'kid', 'alg', 'use'})
+
+
+class RevocationTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.alice = User.objects.create_user(username='alice', password='S3cure-pass!')
+        tokens = self.client.post('/login/', {'username': 'alice', 'password': 'S3cure-pass!'}).data
+        self.access, self.refresh = tokens['access'], tokens['refresh']
+
+    def logout(self, access, body=None):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        return self.client.post('/logout/', body or {})
+
+    def test_logout_revokes_the_tokens(self):
+        # Cached as valid first
+        self.assertTrue(self.client.post('/verify-token/', {'token': self.access}).data['valid'])
+
+        self.assertEqual(self.logout(self.access, {'refresh': self.refresh}).status_code, 205)
+        self.assertEqual(RevokedToken.objects.count(), 2)
+        self.assertEqual(self.client.post('/verify-token/', {'token': self.access}).status_code, 401)
+        self.assertEqual(self.client.post('/token/refresh/', {'refresh': self.refresh}).status_code, 401)
+        self.assertEqual(self.logout(self.access).status_code, 401)
+
+    def test_refresh_token_must_be_the_users(self):
+        bob = User.objects.create_user(username='bob', password='S3cure-pass!')
+        for refresh in ('garbage', str(UsernameRefreshToken.for_user(bob))):
+            with self.subTest(refresh=refresh):
+                self.assertEqual(self.logout(self.access, {'refresh': refresh}).status_code, 400)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        self.assertEqual(self.client.post('/logout/', [self.refresh], format='json').status_code, 400)
+        self.assertFalse(RevokedToken.objects.exists())
+
+    def test_other_processes_follow_the_log(self):
+        other = DatabaseDenylist()
+        other._ensure_poller = mock.Mock()
+        self.assertTrue(other.sync())
+        self.assertNotIn(AccessToken(self.access)['jti'], other)
+
+        self.logout(self.access)
+        other.sync()
+        self.assertIn(AccessToken(self.access)['jti'], other)
+        self.assertEqual(other.stats()['cursor'], RevokedToken.objects.get().id)
+        self.assertEqual(self.client.get('/revocations/', {'after': other.stats()['cursor']}).data,
+                         {'revocations': []})
+        self.assertEqual(self.client.get('/revocations/', {'after': 'x'}).status_code, 400)
+
+        # Expired tokens are dropped from the denylist and the log
+        other.prune(now=AccessToken(self.access)['exp'])
+        self.assertEqual(len(other), 0)
+        RevokedToken.objects.update(expires_at=timezone.now())
+        self.assertEqual(self.client.get('/revocations/').data, {'revocations': []})
+
+
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        buckets.clear()
+        User.objects.create_user(username='bob', password='S3cure-pass!')
+
+    def login(self, username, password='wrong'):
+        return self.client.post('/login/', {'username': username, 'password': password})
+
+    def test_logins_are_limited_per_username(self):
+        with throttle_rates(login='10/min', login_username='3/min'):
+            for _ in range(3):
+                self.assertEqual(self.login('bob').status_code, 401)
+            response = self.login('bob', 'S3cure-pass!')
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '20')
+            # Other usernames have their own bucket, up to the per-address rate
+            self.assertEqual(self.login('alice').status_code, 401)
+            # Bodies that aren't objects aren't counted against a username
+            self.assertEqual(self.client.post('/login/', ['bob'], format='json').status_code, 400)
+
+    def test_logins_and_registrations_are_limited_per_address(self):
+        with throttle_rates(login='2/min', register='1/hour'):
+            self.assertEqual(self.login('bob').status_code, 401)
+            self.assertEqual(self.login('alice').status_code, 401)
+            self.assertEqual(self.login('carol').status_code, 429)
+            # Behind the ingress, the client address is the last forwarded one
+            response = self.client.post('/login/', {'username': 'bob', 'password': 'wrong'},
+                                        HTTP_X_FORWARDED_FOR='10.0.0.1, 10.0.0.2')
+            self.assertEqual(response.status_code, 401)
+
+            self.assertEqual(self.client.post('/register/', {'username': 'dave', 'password': 'pw'}).status_code, 201)
+            self.assertEqual(self.client.post('/register/', {'username': 'erin', 'password': 'pw'}).status_code, 429)
+
+    def test_introspection_is_limited_per_address(self):
+        with throttle_rates(introspect='1/min'):
+            self.assertEqual(self.client.post('/introspect/', {'tokens': ['abc']}, format='json').status_code, 200)
+            self.assertEqual(self.client.post('/introspect/', {'tokens': ['abc']}, format='json').status_code, 429)
+
+    def test_buckets_refill_continuously(self):
+        # 2 per second, bursts of 2
+        state, wait = take_token(None, 2, 2.0, now=100)
+        state, wait = take_token(state, 2, 2.0, now=100)
+        self.assertEqual((state, wait), ((0, 100), 0))
+        self.assertEqual(take_token(state, 2, 2.0, now=100.25), ((0.5, 100.25), 0.25))
+        self.assertEqual(take_token(state, 2, 2.0, now=100.5), ((0, 100.5), 0))
+        # Never more than the burst
+        self.assertEqual(take_token(state, 2, 2.0, now=200), ((1, 200), 0))
@@ -0,0 +1,31 @@
+import hashlib
+from collections.abc import Mapping
+
+from core.throttling import IPThrottle, TokenBucketThrottle
+
+
+class LoginThrottle(IPThrottle):
+    scope = 'login'
+
+
+class LoginUsernameThrottle(TokenBucketThrottle):
+    """Counts login attempts by the username tried, whatever address they come from."""
+    scope = 'login_username'
+
+    def get_key(self, request, view):
+        # The view itself rejects bodies that aren't objects
+        if not isinstance(request.data, Mapping):
+            return None
+        username = request.data.get('username')
+        if not isinstance(username, str) or not username:
+            return None
+        # Cache keys must stay short and printable
+        return hashlib.sha256(username.encode('utf-8')).hexdigest()
+
+
+class RegisterThrottle(IPThrottle):
+    scope = 'register'
+
+
+class IntrospectThrottle(IPThrottle):
+    scope = 'introspect'
@@ -0,0 +1,70 @@
+from cryptography.hazmat.primitives.serialization import load_pem_private_key, load_pem_public_key
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from core.jwks import KeySet, KeySetTokenBackend, public_jwk
+
+from .revocation import denylist
+
+
+def load_signing_keys(algorithm, secret=None, private_key_file=None, public_key_files=()):
+    """
+    The token backend and the published JWKS document for ``algorithm``.
+
+    HS256 signs with the shared secret and publishes nothing. RS256 and EdDSA
+    sign with the PEM private key in ``private_key_file`` and publish its
+    public key, plus the retired public keys in ``public_key_files`` so the
+    tokens they signed verify until they expire.
+    """
+    if algorithm == 'HS256':
+        return KeySetTokenBackend(algorithm, secret), {'keys': []}
+
+    with open(private_key_file, 'rb') as f:
+        private_key = load_pem_private_key(f.read(), password=None)
+    published = [public_jwk(private_key.public_key(), algorithm)]
+    for path in public_key_files:
+        with open(path, 'rb') as f:
+            published.append(public_jwk(load_pem_public_key(f.read()), algorithm))
+    backend = KeySetTokenBackend(algorithm, private_key, key_set=KeySet(keys=published), kid=published[0]['kid'])
+    return backend, {'keys': published}
+
+
+token_backend, jwks = load_signing_keys(
+    settings.JWT_ALGORITHM,
+    secret=settings.JWT_SECRET_KEY,
+    private_key_file=settings.JWT_PRIVATE_KEY_FILE,
+    public_key_files=settings.JWT_PUBLIC_KEY_FILES,
+)
+
+
+class RevocableTokenMixin:
+    """Refuse tokens revoked with revocation.revoke()."""
+
+    def verify(self):
+        super().verify()
+        if self.payload.get(api_settings.JTI_CLAIM) in denylist:
+            raise TokenError(_('Token has been revoked'))
+
+
+class AccessToken(RevocableTokenMixin, tokens.AccessToken):
+    _token_backend = token_backend
+
+
+class RefreshToken(RevocableTokenMixin, tokens.RefreshToken):
+    """
+    Refresh token that also carries the username.
+
+    Access tokens copy their claims from the refresh token, so services can
+    build the request principal from the token alone.
+    """
+    _token_backend = token_backend
+    access_token_class = AccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['username'] = user.username
+        return token
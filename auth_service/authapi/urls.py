@@ -1,11 +1,19 @@
 from django.urls import path
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 from . import views
+from .serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from .throttling import LoginThrottle, LoginUsernameThrottle
 
 urlpatterns = [
     path('register/', views.register, name='register'),
-    path('login/', TokenObtainPairView.as_view(), name='login'),
-    path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path('login/', TokenObtainPairView.as_view(
+        serializer_class=TokenObtainPairSerializer, throttle_classes=[LoginThrottle, LoginUsernameThrottle],
+    ), name='login'),
+    path('token/refresh/', TokenRefreshView.as_view(serializer_class=TokenRefreshSerializer), name='token_refresh'),
+    path('logout/', views.logout, name='logout'),
     path('verify-token/', views.verify_token, name='verify_token'),
+    path('introspect/', views.introspect_tokens, name='introspect'),
+    path('revocations/', views.revocations, name='revocations'),
+    path('.well-known/jwks.json', views.jwks, name='jwks'),
     path('health/', views.health_check, name='health_check'),
 ] 
\ No newline at end of file
@@ -1,16 +1,28 @@
 from django.shortcuts import render
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, authentication_classes, permission_classes, throttle_classes
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from django.conf import settings
+from django.utils.cache import patch_cache_control
 from django.contrib.auth.models import User
+from core.health import database_status
+from core.shedding import load_shedder
+from .hashers import HashingBusy, hashing_pool
+from .introspection import introspect
+from .revocation import denylist, log_entries, revoke
+from .throttling import IntrospectThrottle, LoginThrottle, LoginUsernameThrottle, RegisterThrottle
+from . import tokens
+from .tokens import RefreshToken
 import logging
 
 logger = logging.getLogger(__name__)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([RegisterThrottle])
 def register(request):
     try:
         username = request.data.get('username')
@@ -33,12 +45,15 @@ def register(request):
             'access': str(refresh.access_token),
         }, status=status.HTTP_201_CREATED)
 
+    except HashingBusy:
+        raise
     except Exception as e:
         logger.error('Error during registration: %s', str(e))
         return Response({'detail': 'An error occurred during registration. Please try again later.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes([LoginThrottle, LoginUsernameThrottle])
 def login(request):
     try:
         username = request.data.get('username')
@@ -64,34 +79,105 @@ def login(request):
             'access': str(refresh.access_token),
         })
 
+    except HashingBusy:
+        raise
     except Exception as e:
         return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['POST'])
+@authentication_classes([])
 @permission_classes([AllowAny])
 def verify_token(request):
     """
-    Verify the provided JWT token and return user information if valid.
-    This can be used by other services to validate authentication.
+    Verify the posted access token and return the user it was issued to.
+    This can be used by other services to validate authentication;
+    /introspect/ checks many tokens in one call.
+    """
+    token = request.data.get('token') if isinstance(request.data, dict) else None
+    if not token or not isinstance(token, str):
+        return Response({'detail': 'Token is required'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    result, = introspect([token])
+    if not result['valid']:
+        return Response({'valid': False, 'detail': 'Invalid token'},
+                        status=status.HTTP_401_UNAUTHORIZED)
+    return Response({
+        'valid': True,
+        'user_id': result['user_id'],
+        'username': result['username'],
+    })
+
+@api_view(['POST'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+@throttle_classes([IntrospectThrottle])
+def introspect_tokens(request):
+    """
+    Check a batch of access tokens in one call: POST {"tokens": [...]} returns
+    {"results": [...]} in the same order, each with valid, user_id, username
+    and exp, or just valid: false.
+    """
+    tokens = request.data.get('tokens') if isinstance(request.data, dict) else None
+    if not isinstance(tokens, list) or not tokens or not all(isinstance(token, str) for token in tokens):
+        return Response({'detail': 'tokens must be a non-empty list of tokens'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    if len(tokens) > settings.JWT_INTROSPECTION_MAX_TOKENS:
+        return Response({'detail': f'At most {settings.JWT_INTROSPECTION_MAX_TOKENS} tokens per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response({'results': introspect(tokens)})
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def logout(request):
+    """
+    Revoke the access token the request is made with and, when posted, the
+    user's refresh token. Every service refuses them within a few seconds.
+    """
+    if not isinstance(request.data, dict):
+        return Response({'detail': 'Request body must be an object'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    refresh = request.data.get('refresh')
+    if refresh is not None:
+        try:
+            refresh = RefreshToken(refresh)
+        except TokenError:
+            return Response({'detail': 'Invalid refresh token'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if refresh.get(api_settings.USER_ID_CLAIM) != request.user.id:
+            return Response({'detail': 'Invalid refresh token'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        revoke(refresh)
+    revoke(request.auth)
+    return Response(status=status.HTTP_205_RESET_CONTENT)
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def revocations(request):
+    """
+    The revocation log after ?after=<id>, oldest first: {"revocations":
+    [{"id", "jti", "exp"}, ...]}. Services poll it to keep their denylist of
+    revoked tokens current.
     """
     try:
-        token = request.data.get('token')
-        if not token:
-            return Response({'detail': 'Token is required'}, 
-                          status=status.HTTP_400_BAD_REQUEST)
-            
-        # The authentication middleware will validate the token
-        # If we reach here, the token is valid
-        return Response({
-            'valid': True,
-            'user_id': request.user.id,
-            'username': request.user.username
-        })
-    except Exception as e:
-        return Response({
-            'valid': False,
-            'detail': str(e)
-        }, status=status.HTTP_401_UNAUTHORIZED)
+        after = int(request.query_params.get('after', 0))
+    except ValueError:
+        return Response({'detail': 'after must be an integer'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    return Response({'revocations': log_entries(after)})
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def jwks(request):
+    """
+    The public keys that verify access tokens, as a JWKS document. Tokens
+    name their key with the kid header; the list is empty with HS256.
+    """
+    response = Response(tokens.jwks)
+    patch_cache_control(response, public=True, max_age=settings.JWT_JWKS_MAX_AGE)
+    return response
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
@@ -99,7 +185,21 @@ def health_check(request):
     """
     Health check endpoint for the auth service.
     """
+    database = database_status()
+    if not database['connected']:
+        return Response({
+            'status': 'unhealthy',
+            'service': 'auth_service',
+            'database': database,
+            'hashing': hashing_pool.stats(),
+            'revocations': denylist.stats(),
+            'shedding': load_shedder.stats(),
+        }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     return Response({
         'status': 'healthy',
-        'service': 'auth_service'
-    }, status=status.HTTP_200_OK) 
\ No newline at end of file
+        'service': 'auth_service',
+        'database': database,
+        'hashing': hashing_pool.stats(),
+        'revocations': denylist.stats(),
+        'shedding': load_shedder.stats(),
+    }, status=status.HTTP_200_OK)
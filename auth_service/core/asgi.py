@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Tells the settings the process serves ASGI (see CONN_MAX_AGE)
+os.environ.setdefault('DJANGO_ASGI', 'True')
 
 application = get_asgi_application()
@@ -0,0 +1,19 @@
+from django.db import DatabaseError, connection
+
+from .pgpool import pool_stats
+
+
+def database_status():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connected = True
+    except DatabaseError:
+        connected = False
+    return {
+        'connected': connected,
+        'vendor': connection.vendor,
+        'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+        'pool': pool_stats().get(connection.alias),
+    }
+
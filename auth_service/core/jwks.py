@@ -0,0 +1,219 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import jwt
+import requests
+from django.utils.translation import gettext_lazy as _
+from jwt import algorithms
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+logger = logging.getLogger(__name__)
+
+# Members of each key type that identify it (RFC 7638)
+THUMBPRINT_MEMBERS = {'RSA': ('e', 'kty', 'n'), 'OKP': ('crv', 'kty', 'x'), 'EC': ('crv', 'kty', 'x', 'y')}
+
+
+def thumbprint(jwk):
+    """The RFC 7638 SHA-256 thumbprint of a public JWK, used as its kid."""
+    members = {name: jwk[name] for name in THUMBPRINT_MEMBERS[jwk['kty']]}
+    digest = hashlib.sha256(json.dumps(members, separators=(',', ':'), sort_keys=True).encode('utf-8')).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+def public_jwk(public_key, algorithm):
+    """The JWKS entry of a public key that verifies ``algorithm`` signatures."""
+    jwk = json.loads(algorithms.get_default_algorithms()[algorithm].to_jwk(public_key))
+    jwk.update(kid=thumbprint(jwk), alg=algorithm, use='sig')
+    return jwk
+
+
+class KeySet:
+    """
+    Public keys that verify tokens, by ``kid``.
+
+    Keys are given up front, or loaded from the JWKS document at ``source``,
+    a URL or a file path. A loaded document is fetched by a background
+    thread, started with start() when the process boots, and refreshed every
+    ``refresh_interval`` seconds. A token whose kid isn't known yet (a key
+    that was just rolled out) wakes the thread to reload it at once, at most
+    every ``retry_interval`` seconds; a synchronous caller waits up to
+    ``timeout`` seconds for that reload, while a caller on an event loop is
+    refused straight away rather than block it. Lookups never fetch the
+    document themselves, and a failed reload keeps the previous keys.
+    """
+
+    def __init__(self, source=None, keys=(), refresh_interval=300, retry_interval=30, timeout=5):
+        self.source = source
+        self.refresh_interval = refresh_interval
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self._keys = self.parse({'keys': list(keys)})
+        self._attempted_at = None
+        self._loaded_at = None
+        self._attempts = 0
+        self._forget_refresher()
+        self.loads = 0
+        self.failures = 0
+        if source is not None:
+            # A forked worker doesn't inherit the parent's thread
+            os.register_at_fork(after_in_child=self._forget_refresher)
+
+    def start(self):
+        """Load the keys in the background and keep them fresh."""
+        if self.source is not None:
+            self._ensure_refresher()
+
+    def get(self, kid):
+        """The key for kid, or None if the key set doesn't have it."""
+        if self._thread is None:
+            self.start()
+        key = self._keys.get(kid)
+        if key is None and self.source is not None:
+            with self._lock:
+                # Concurrent misses share one reload, e.g. the first one at startup
+                if not self._reloading:
+                    if self._attempted_at is not None and time.monotonic() - self._attempted_at < self.retry_interval:
+                        return None
+                    self._wakeup.set()
+                if in_event_loop():
+                    return None
+                attempts = self._attempts
+                self._reloaded.wait_for(lambda: self._attempts != attempts, self.timeout)
+            key = self._keys.get(kid)
+        return key
+
+    def reload(self):
+        with self._lock:
+            # Misses up to now are answered by this reload
+            self._wakeup.clear()
+            self._reloading = True
+            self._attempted_at = time.monotonic()
+        try:
+            keys = self.parse(self.fetch())
+        except Exception:
+            keys = None
+            logger.exception('Loading the JWKS from %s failed', self.source)
+        with self._lock:
+            self._reloading = False
+            self._attempts += 1
+            if keys is None:
+                self.failures += 1
+            else:
+                self._keys = keys
+                self._loaded_at = time.monotonic()
+                self.loads += 1
+            self._reloaded.notify_all()
+        return keys is not None
+
+    def fetch(self):
+        if self.source.startswith(('http://', 'https://')):
+            response = requests.get(self.source, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        with open(self.source, 'rb') as f:
+            return json.load(f)
+
+    def parse(self, document):
+        keys = {}
+        for jwk in document['keys']:
+            try:
+                keys[jwk['kid']] = jwt.PyJWK(jwk).key
+            except (KeyError, jwt.PyJWTError):
+                logger.warning('Skipping unusable JWKS key %s', jwk.get('kid'))
+        return keys
+
+    def stats(self):
+        return {
+            'source': self.source,
+            'keys': sorted(self._keys),
+            'loads': self.loads,
+            'failures': self.failures,
+            'age': None if self._loaded_at is None else time.monotonic() - self._loaded_at,
+        }
+
+    def _ensure_refresher(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='jwks-refresh', daemon=True)
+            self._thread.start()
+
+    def _forget_refresher(self):
+        self._thread = None
+        self._reloading = False
+        self._lock = threading.Lock()
+        self._reloaded = threading.Condition(self._lock)
+        self._wakeup = threading.Event()
+
+    def _run(self):
+        # Keys inherited from the parent process are still fresh
+        wait = 0 if self._loaded_at is None else self.refresh_interval
+        while True:
+            self._wakeup.wait(wait)
+            # Retry sooner while reloading fails
+            wait = self.refresh_interval if self.reload() else self.retry_interval
+
+
+def in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+class KeySetTokenBackend(TokenBackend):
+    """
+    simplejwt token backend for asymmetric keys that roll by ``kid``.
+
+    Tokens are signed with ``signing_key`` and carry its ``kid`` in their
+    header, and each one is verified with the key of ``key_set`` named by its
+    kid, so tokens signed by a retired key stay valid while it is still
+    published. With HS256 it works like simplejwt's own backend: one shared
+    secret and no kid.
+    """
+    supported_algorithms = {'HS256', 'RS256', 'EdDSA'}
+
+    def __init__(self, algorithm, signing_key=None, key_set=None, kid=None):
+        super().__init__(algorithm, signing_key, audience=api_settings.AUDIENCE,
+                         issuer=api_settings.ISSUER, leeway=api_settings.LEEWAY)
+        self.key_set = key_set
+        self.kid = kid
+
+    def _validate_algorithm(self, algorithm):
+        if algorithm not in self.supported_algorithms:
+            raise TokenBackendError(_("Unrecognized algorithm type '{}'").format(algorithm))
+        if algorithm in algorithms.requires_cryptography and not algorithms.has_crypto:
+            raise TokenBackendError(_('You must have cryptography installed to use {}.').format(algorithm))
+
+    def get_verifying_key(self, token):
+        if self.algorithm.startswith('HS'):
+            return self.signing_key
+        try:
+            kid = jwt.get_unverified_header(token).get('kid')
+        except jwt.PyJWTError as ex:
+            raise TokenBackendError(_('Token is invalid or expired')) from ex
+        key = self.key_set.get(kid) if kid is not None and self.key_set is not None else None
+        if key is None:
+            raise TokenBackendError(_('Token is invalid or expired'))
+        return key
+
+    def encode(self, payload):
+        payload = payload.copy()
+        if self.audience is not None:
+            payload['aud'] = self.audience
+        if self.issuer is not None:
+            payload['iss'] = self.issuer
+        return jwt.encode(
+            payload, self.signing_key, algorithm=self.algorithm,
+            headers={'kid': self.kid} if self.kid else None,
+            json_encoder=getattr(self, 'json_encoder', None),
+        )
@@ -0,0 +1,47 @@
+from django.db.backends.postgresql import base, creation
+
+from .pool import PoolTimeout, close_pools, get_pool
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the test database in use
+        close_pools()
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that borrows connections from a per-process pool.
+
+    Django still opens and closes a connection around each request (use it with
+    CONN_MAX_AGE = 0), but closing hands the connection back to the pool instead
+    of tearing it down, so later requests skip the TCP and authentication
+    handshake. Pool limits come from the ``POOL`` entry of the database settings.
+    """
+    creation_class = DatabaseCreation
+
+    def get_new_connection(self, conn_params):
+        # Keyed by the connection parameters too, so that switching databases
+        # (e.g. to the test database) never reuses a connection to the old one
+        key = (self.alias, repr(sorted(conn_params.items())))
+        self.pool = get_pool(key, self.settings_dict.get('POOL', {}))
+        try:
+            return self.pool.checkout(lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        except PoolTimeout as e:
+            raise self.Database.OperationalError(str(e)) from e
+
+    def _close(self):
+        if self.connection is None:
+            return
+        connection = self.connection
+        reusable = not self.in_atomic_block and not connection.closed
+        if reusable:
+            try:
+                # Never hand out a connection with an open transaction
+                connection.rollback()
+            except self.Database.Error:
+                reusable = False
+        # Connections closed inside atomic() stay referenced by this wrapper
+        # until the rollback, so they can't go back to the pool
+        self.pool.checkin(connection, reusable=reusable)
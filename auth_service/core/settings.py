@@ -63,6 +63,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    # Before the rest of the stack, so shed requests cost next to nothing
+    'core.shedding.LoadSheddingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -103,9 +105,66 @@ DATABASES = {
         'PASSWORD': os.environ.get('SQL_PASSWORD', 'postgres'),
         'HOST': os.environ.get('SQL_HOST', 'db'),
         'PORT': os.environ.get('SQL_PORT', '5432'),
+        # Keep connections open across requests instead of reconnecting every
+        # time, and check a reused connection is still alive before using it
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DATABASE_CONN_HEALTH_CHECKS', 'True').lower() in ('1', 'true'),
     }
 }
 
+# Under ASGI each request's ORM calls run on a thread of their own, so
+# persistent connections would pile up one per thread instead of being
+# reused; there connections are only reused through the pool below
+if os.environ.get('DJANGO_ASGI', 'False').lower() in ('1', 'true'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Optional per-process connection pool for PostgreSQL (see core/pgpool). Each
+# gunicorn worker holds at most DATABASE_POOL_SIZE + DATABASE_POOL_OVERFLOW
+# connections, so the service needs HPA maxReplicas x GUNICORN_WORKERS x that
+# many slots of the server's max_connections.
+if (os.environ.get('DATABASE_POOL', 'False').lower() in ('1', 'true')
+        and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'):
+    DATABASES['default'].update({
+        'ENGINE': 'core.pgpool',
+        # Django hands the connection back to the pool at the end of each request
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'size': int(os.environ.get('DATABASE_POOL_SIZE', 4)),
+            'overflow': int(os.environ.get('DATABASE_POOL_OVERFLOW', 0)),
+            'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+            'recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', 300)),
+        },
+    })
+
+
+# Password hashing policy. New passwords are hashed with the hasher picked by
+# AUTH_PASSWORD_HASHER ('argon2' for Argon2id or 'pbkdf2'); the other one only
+# verifies existing hashes, which are rehashed with the policy (and its current
+# costs) on the next successful login.
+AUTH_PASSWORD_HASHER = os.environ.get('AUTH_PASSWORD_HASHER', 'argon2')
+_PASSWORD_HASHERS = {
+    'argon2': 'authapi.hashers.Argon2PasswordHasher',
+    'pbkdf2': 'authapi.hashers.PBKDF2PasswordHasher',
+}
+if AUTH_PASSWORD_HASHER not in _PASSWORD_HASHERS:
+    raise Exception(f"AUTH_PASSWORD_HASHER must be one of {', '.join(_PASSWORD_HASHERS)}")
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[AUTH_PASSWORD_HASHER]] + [
+    hasher for policy, hasher in _PASSWORD_HASHERS.items() if policy != AUTH_PASSWORD_HASHER
+]
+# Argon2id costs: passes, memory in KiB and lanes. The defaults are OWASP's
+# recommended minimum (19 MiB, 2 passes, 1 lane), a few times cheaper than
+# Django's 100 MiB / 8 lanes per login
+AUTH_ARGON2_TIME_COST = int(os.environ.get('AUTH_ARGON2_TIME_COST', 2))
+AUTH_ARGON2_MEMORY_COST = int(os.environ.get('AUTH_ARGON2_MEMORY_COST', 19456))
+AUTH_ARGON2_PARALLELISM = int(os.environ.get('AUTH_ARGON2_PARALLELISM', 1))
+# PBKDF2 iterations, Django's default when unset
+AUTH_PBKDF2_ITERATIONS = int(os.environ.get('AUTH_PBKDF2_ITERATIONS', 0)) or None
+# Hashes run on AUTH_HASHING_WORKERS threads per gunicorn worker, with up to
+# AUTH_HASHING_QUEUE more waiting; further logins get a 503 with Retry-After.
+# Keep workers + queue below GUNICORN_THREADS so some threads stay free for
+# other requests. 0 workers hashes on the request thread.
+AUTH_HASHING_WORKERS = int(os.environ.get('AUTH_HASHING_WORKERS', 2))
+AUTH_HASHING_QUEUE = int(os.environ.get('AUTH_HASHING_QUEUE', 1))
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -155,22 +214,100 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.AllowAny',
     ],
+    # Same JSON as DRF's renderer and parser, encoded and decoded with orjson
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'core.renderers.ORJSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    # Token-bucket rates ('<requests>/<second|minute|hour|day>') of the login,
+    # register and introspection throttles; an empty rate turns one off
+    'DEFAULT_THROTTLE_RATES': {
+        'login': os.environ.get('THROTTLE_LOGIN_RATE', '30/min') or None,
+        'login_username': os.environ.get('THROTTLE_LOGIN_USERNAME_RATE', '10/min') or None,
+        'register': os.environ.get('THROTTLE_REGISTER_RATE', '20/hour') or None,
+        'introspect': os.environ.get('THROTTLE_INTROSPECT_RATE', '600/min') or None,
+    },
+    # Client addresses are read from X-Forwarded-For, as set by the ingress
+    'NUM_PROXIES': int(os.environ.get('THROTTLE_NUM_PROXIES', 1)),
 }
 
+# Rate limiting (DEFAULT_THROTTLE_RATES, core/throttling.py). Token buckets are
+# kept in each worker process, for at most THROTTLE_LOCAL_SIZE clients, unless
+# THROTTLE_CACHE_ALIAS=throttle and THROTTLE_CACHE_BACKEND/LOCATION point the
+# throttle cache at a store shared by every pod (e.g.
+# django.core.cache.backends.redis.RedisCache, which needs the redis package).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': os.environ.get('THROTTLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION', 'throttle'),
+    },
+}
+THROTTLE_CACHE_ALIAS = os.environ.get('THROTTLE_CACHE_ALIAS') or None
+THROTTLE_LOCAL_SIZE = int(os.environ.get('THROTTLE_LOCAL_SIZE', 100000))
+
+# Load shedding (core/shedding.py): a worker process answers 503 with
+# Retry-After: SHED_RETRY_AFTER rather than take on more work once
+# SHED_MAX_CONCURRENCY requests are in flight, when a request already waited
+# SHED_MAX_QUEUE_TIME seconds behind the proxy (X-Request-Start: t=<seconds>),
+# or while recent requests average more than SHED_MAX_LATENCY seconds.
+# 0 disables a limit.
+SHED_MAX_CONCURRENCY = int(os.environ.get('SHED_MAX_CONCURRENCY', 0))
+SHED_MAX_QUEUE_TIME = float(os.environ.get('SHED_MAX_QUEUE_TIME', 2))
+# Off by default: one hung request keeps the average up while everything
+# else is turned away
+SHED_MAX_LATENCY = float(os.environ.get('SHED_MAX_LATENCY', 0))
+SHED_RETRY_AFTER = int(os.environ.get('SHED_RETRY_AFTER', 1))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': False,
-    'BLACKLIST_AFTER_ROTATION': True,
+    # Tokens are revoked through authapi/revocation.py, not the blacklist app
+    'BLACKLIST_AFTER_ROTATION': False,
     'SIGNING_KEY': JWT_SECRET_KEY,  # Use the dedicated variable
     'VERIFYING_KEY': None,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Signed and verified with the keys below (authapi/tokens.py)
+    'AUTH_TOKEN_CLASSES': ('authapi.tokens.AccessToken',),
 }
 
+# Token signing. HS256 signs with the shared JWT_SECRET_KEY, which every
+# service then needs. RS256 and EdDSA sign with the PEM private key in
+# JWT_PRIVATE_KEY_FILE and publish its public key at /.well-known/jwks.json,
+# where the other services fetch it (JWT_JWKS_URL). To roll a key, sign with
+# the new one and list the old public key in JWT_PUBLIC_KEY_FILES
+# (comma-separated PEM files) until the tokens it signed have expired.
+JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+JWT_PRIVATE_KEY_FILE = os.environ.get('JWT_PRIVATE_KEY_FILE')
+JWT_PUBLIC_KEY_FILES = [path for path in os.environ.get('JWT_PUBLIC_KEY_FILES', '').split(',') if path]
+if JWT_ALGORITHM != 'HS256' and not JWT_PRIVATE_KEY_FILE:
+    raise Exception(f"JWT_PRIVATE_KEY_FILE is required to sign tokens with {JWT_ALGORITHM}")
+# Cache lifetime of the JWKS document for the services and proxies fetching it
+JWT_JWKS_MAX_AGE = int(os.environ.get('JWT_JWKS_MAX_AGE', 300))
+
+# Token introspection (/introspect/, /verify-token/): at most
+# JWT_INTROSPECTION_MAX_TOKENS tokens per call, and valid results are cached
+# in-process until the token's exp, capped at JWT_INTROSPECTION_CACHE_TTL
+# seconds (0 entries disables the cache)
+JWT_INTROSPECTION_MAX_TOKENS = int(os.environ.get('JWT_INTROSPECTION_MAX_TOKENS', 100))
+JWT_INTROSPECTION_CACHE_SIZE = int(os.environ.get('JWT_INTROSPECTION_CACHE_SIZE', 10000))
+JWT_INTROSPECTION_CACHE_TTL = int(os.environ.get('JWT_INTROSPECTION_CACHE_TTL', 3600))
+
+# Token revocation (/logout/): revoked tokens are logged in the database until
+# they expire and served from /revocations/ at most JWT_REVOCATION_PAGE_SIZE
+# at a time. Each process reloads the log every JWT_REVOCATION_POLL_INTERVAL
+# seconds.
+JWT_REVOCATION_POLL_INTERVAL = float(os.environ.get('JWT_REVOCATION_POLL_INTERVAL', 2))
+JWT_REVOCATION_PAGE_SIZE = int(os.environ.get('JWT_REVOCATION_PAGE_SIZE', 1000))
+
 # CORS settings - only needed for internal services and gateway
 CORS_ALLOWED_ORIGINS = [
     "http://ingress-nginx-controller.ingress-nginx.svc.cluster.local",
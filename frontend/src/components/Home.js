@@ -12,7 +12,7 @@ import {
   Chip
 } from '@mui/material';
 import { useAuth } from '../contexts/AuthContext';
-import { PostService } from '../services/api';
+import { PostService, getNextCursor } from '../services/api';
 import PostList from './posts/PostList';
 import QuickPostForm from './posts/QuickPostForm';
 import {
@@ -28,7 +28,7 @@ const Home = () => {
   const [posts, setPosts] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
-  const [page, setPage] = useState(1);
+  const [nextCursor, setNextCursor] = useState(null);
   const [hasMore, setHasMore] = useState(true);
   
   // Load initial filter states from cookies
@@ -140,16 +140,16 @@ const Home = () => {
   // Add a ref to track if data is already loaded
   const dataFetchedRef = useRef(false);
 
-  const fetchPosts = useCallback(async (pageToFetch = 1) => {
+  const fetchPosts = useCallback(async (cursor = null) => {
     try {
       setLoading(true);
       setError('');
       
-      const response = await PostService.getAllPosts(pageToFetch);
+      const response = await PostService.getAllPosts(cursor);
       const responseData = response.data;
       const fetchedPosts = responseData.results || [];
       
-      if (pageToFetch === 1) {
+      if (!cursor) {
         setPosts(fetchedPosts);
         applyFilters(fetchedPosts);
       } else {
@@ -159,7 +159,7 @@ const Home = () => {
       }
       
       setHasMore(!!responseData.next);
-      setPage(pageToFetch);
+      setNextCursor(getNextCursor(responseData.next));
     } catch (err) {
       setError('Failed to load posts');
     } finally {
@@ -176,12 +176,12 @@ const Home = () => {
 
   const fetchMoreData = () => {
     if (!hasMore) return;
-    fetchPosts(page + 1);
+    fetchPosts(nextCursor);
   };
 
   const handlePostCreated = () => {
     dataFetchedRef.current = false;
-    fetchPosts(1);
+    fetchPosts();
   };
 
   return (
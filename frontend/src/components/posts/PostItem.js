@@ -140,13 +140,11 @@ const PostItem = ({ post, showAuthor = true, forceAuthor = false, onPostDeleted
 
   const handleLike = async () => {
     try {
-      if (liked) {
-        await PostService.unlikePost(post.id);
-      } else {
-        await PostService.likePost(post.id);
-      }
-      setLiked(!liked);
-      setLikeCount(liked ? likeCount - 1 : likeCount + 1);
+      const response = liked
+        ? await PostService.unlikePost(post.id)
+        : await PostService.likePost(post.id);
+      setLiked(response.data.liked);
+      setLikeCount(response.data.like_count);
     } catch (error) {
       setCommentError('Failed to update like status');
     }
@@ -156,7 +154,7 @@ const PostItem = ({ post, showAuthor = true, forceAuthor = false, onPostDeleted
     setLoadingComments(true);
     try {
       const response = await PostService.getPostComments(post.id);
-      setComments(response.data);
+      setComments(response.data.results);
     } catch (err) {
       setCommentError('Failed to load comments');
     } finally {
@@ -375,7 +373,7 @@ const PostItem = ({ post, showAuthor = true, forceAuthor = false, onPostDeleted
                 onClick={handleExpandClick}
               >
                 <Badge 
-                  badgeContent={post.comments ? post.comments.length : 0} 
+                  badgeContent={post.comment_count || 0} 
                   color="primary"
                 >
                   <Comment />
@@ -216,6 +216,12 @@ export const AuthProvider = ({ children }) => {
   };
 
   const logout = () => {
+    const accessToken = getSecureToken('access_token');
+    const refreshToken = getSecureToken('refresh_token');
+    if (accessToken) {
+      // Best effort: the local tokens are cleared either way
+      AuthService.logout(accessToken, refreshToken).catch(() => {});
+    }
     clearAuthData();
   };
 
@@ -122,6 +122,12 @@ const AuthService = {
     // Using authApi without token headers
     return authApi.post('/token/refresh/', { refresh: refreshToken });
   },
+  logout: (accessToken, refreshToken) => {
+    // Revokes both tokens on the server
+    return authApi.post('/logout/', { refresh: refreshToken }, {
+      headers: { Authorization: `Bearer ${accessToken}` },
+    });
+  },
   verifyToken: (token) => {
     // Manually add the token for verification
     return authApi.post('/verify-token/', { token });
@@ -142,15 +148,24 @@ const UserService = {
   getUserById: (userId) => {
     return usersApi.get(`/api/users/${userId}/`);
   },
+  getUsersByIds: (userIds) => {
+    return usersApi.get('/api/users/batch/', { params: { ids: userIds.join(',') } });
+  },
 };
 
 // Posts service
+// Extract the cursor from a paginated response's `next` link
+const getNextCursor = (nextUrl) => {
+  if (!nextUrl) return null;
+  return new URL(nextUrl).searchParams.get('cursor');
+};
+
 const PostService = {
-  getAllPosts: (page = 1) => {
-    return postsApi.get(`/api/posts/?page=${page}`);
+  getAllPosts: (cursor = null) => {
+    return postsApi.get('/api/posts/', { params: cursor ? { cursor } : {} });
   },
   getPostsByUser: (userId) => {
-    return postsApi.get(`/api/posts/?author=${userId}&page=1`);
+    return postsApi.get('/api/posts/', { params: { author: userId } });
   },
   getPost: (id) => {
     return postsApi.get(`/api/posts/${id}/`);
@@ -173,8 +188,8 @@ const PostService = {
   getPostLikes: (postId) => {
     return postsApi.get(`/api/posts/${postId}/likes/`);
   },
-  getPostComments: (postId) => {
-    return postsApi.get(`/api/posts/${postId}/comments/`);
+  getPostComments: (postId, cursor = null) => {
+    return postsApi.get(`/api/posts/${postId}/comments/`, { params: cursor ? { cursor } : {} });
   },
   addComment: (postId, commentData) => {
     return postsApi.post(`/api/posts/${postId}/comment/`, commentData);
@@ -187,4 +202,4 @@ const PostService = {
   },
 };
 
-export { AuthService, UserService, PostService }; 
\ No newline at end of file
+export { AuthService, UserService, PostService, getNextCursor }; 
\ No newline at end of file
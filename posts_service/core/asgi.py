@@ -12,5 +12,9 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Tells the settings the process serves ASGI (see CONN_MAX_AGE)
+os.environ.setdefault('DJANGO_ASGI', 'True')
+# Serve the hot post endpoints with the async views under an ASGI server
+os.environ.setdefault('POSTS_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application() 
\ No newline at end of file
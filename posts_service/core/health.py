@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.db import DatabaseError, connection
+from django.http import JsonResponse
+
+from posts.like_buffer import like_buffer
+from posts.tokens import denylist, key_set
+
+from .pgpool import pool_stats
+from .shedding import load_shedder
+
+
+def database_status():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connected = True
+    except DatabaseError:
+        connected = False
+    return {
+        'connected': connected,
+        'vendor': connection.vendor,
+        'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+        'pool': pool_stats().get(connection.alias),
+    }
+
+
+def health_check(request):
+    database = database_status()
+    return JsonResponse({
+        'status': 'healthy' if database['connected'] else 'unhealthy',
+        'service': 'posts_service',
+        'database': database,
+        'jwks': key_set.stats() if key_set else None,
+        'revocations': denylist.stats() if denylist else None,
+        'shedding': load_shedder.stats(),
+        'like_buffer': like_buffer.stats() if settings.POSTS_LIKE_BUFFER else None,
+    }, status=200 if database['connected'] else 503)
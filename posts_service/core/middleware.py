@@ -1,17 +1,18 @@
-class SecurityHeadersMiddleware:
-    def __init__(self, get_response):
-        self.get_response = get_response
+from django.utils.deprecation import MiddlewareMixin
 
-    def __call__(self, request):
-        response = self.get_response(request)
-        
+
+# MiddlewareMixin makes this usable from both sync and async (ASGI) requests
+class SecurityHeadersMiddleware(MiddlewareMixin):
+    def process_response(self, request, response):
         # Add security headers
         response['X-Content-Type-Options'] = 'nosniff'
         response['X-Frame-Options'] = 'DENY'
         response['X-XSS-Protection'] = '1; mode=block'
         response['Referrer-Policy'] = 'strict-origin-when-cross-origin'
-        response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        response['Pragma'] = 'no-cache'
+        # Views that opt into caching set their own Cache-Control
+        if not response.has_header('Cache-Control'):
+            response['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
+            response['Pragma'] = 'no-cache'
         
         # Only allow internal connections from the gateway
         # The external CSP is handled by the ingress gateway
@@ -0,0 +1 @@
+from .pool import pool_stats  # noqa: F401
@@ -35,6 +35,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     # Third party apps
     'rest_framework',
     'rest_framework_simplejwt',
@@ -47,6 +48,8 @@ MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    # Before the rest of the stack, so shed requests cost next to nothing
+    'core.shedding.LoadSheddingMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -85,16 +88,120 @@ DATABASES = {
         'PASSWORD': os.environ.get('SQL_PASSWORD', 'postgres'),
         'HOST': os.environ.get('SQL_HOST', 'db'),
         'PORT': os.environ.get('SQL_PORT', '5432'),
+        # Keep connections open across requests instead of reconnecting every
+        # time, and check a reused connection is still alive before using it
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DATABASE_CONN_HEALTH_CHECKS', 'True').lower() in ('1', 'true'),
     }
 }
 
+# Under ASGI each request's ORM calls run on a thread of their own, so
+# persistent connections would pile up one per thread instead of being
+# reused; there connections are only reused through the pool below
+if os.environ.get('DJANGO_ASGI', 'False').lower() in ('1', 'true'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Optional per-process connection pool for PostgreSQL (see core/pgpool). Each
+# gunicorn worker holds at most DATABASE_POOL_SIZE + DATABASE_POOL_OVERFLOW
+# connections, so the service needs HPA maxReplicas x GUNICORN_WORKERS x that
+# many slots of the server's max_connections.
+if (os.environ.get('DATABASE_POOL', 'False').lower() in ('1', 'true')
+        and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'):
+    DATABASES['default'].update({
+        'ENGINE': 'core.pgpool',
+        # Django hands the connection back to the pool at the end of each request
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'size': int(os.environ.get('DATABASE_POOL_SIZE', 4)),
+            'overflow': int(os.environ.get('DATABASE_POOL_OVERFLOW', 0)),
+            'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+            'recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', 300)),
+        },
+    })
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
         'posts.authentication.JWTAuthentication',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    'DEFAULT_PAGINATION_CLASS': 'posts.pagination.KeysetPagination',
     'PAGE_SIZE': 10,
+    # Same JSON as DRF's renderer and parser, encoded and decoded with orjson
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    # Token-bucket rates ('<requests>/<second|minute|hour|day>') of post,
+    # comment and like writes per user and per client address; an empty rate
+    # turns one off
+    'DEFAULT_THROTTLE_RATES': {
+        'posts_write': os.environ.get('THROTTLE_WRITE_RATE', '60/min') or None,
+        'posts_write_ip': os.environ.get('THROTTLE_WRITE_IP_RATE', '300/min') or None,
+    },
+    # Client addresses are read from X-Forwarded-For, as set by the ingress
+    'NUM_PROXIES': int(os.environ.get('THROTTLE_NUM_PROXIES', 1)),
+}
+
+# Rate limiting (DEFAULT_THROTTLE_RATES, core/throttling.py). Token buckets are
+# kept in each worker process, for at most THROTTLE_LOCAL_SIZE clients, unless
+# THROTTLE_CACHE_ALIAS=throttle and THROTTLE_CACHE_BACKEND/LOCATION point the
+# throttle cache at a store shared by every pod (e.g.
+# django.core.cache.backends.redis.RedisCache, which needs the redis package).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'throttle': {
+        'BACKEND': os.environ.get('THROTTLE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('THROTTLE_CACHE_LOCATION', 'throttle'),
+    },
 }
+THROTTLE_CACHE_ALIAS = os.environ.get('THROTTLE_CACHE_ALIAS') or None
+THROTTLE_LOCAL_SIZE = int(os.environ.get('THROTTLE_LOCAL_SIZE', 100000))
+
+# Load shedding (core/shedding.py): a worker process answers 503 with
+# Retry-After: SHED_RETRY_AFTER rather than take on more work once
+# SHED_MAX_CONCURRENCY requests are in flight, when a request already waited
+# SHED_MAX_QUEUE_TIME seconds behind the proxy (X-Request-Start: t=<seconds>),
+# or while recent requests average more than SHED_MAX_LATENCY seconds.
+# 0 disables a limit.
+SHED_MAX_CONCURRENCY = int(os.environ.get('SHED_MAX_CONCURRENCY', 0))
+SHED_MAX_QUEUE_TIME = float(os.environ.get('SHED_MAX_QUEUE_TIME', 2))
+# Off by default: one hung request keeps the average up while everything
+# else is turned away
+SHED_MAX_LATENCY = float(os.environ.get('SHED_MAX_LATENCY', 0))
+SHED_RETRY_AFTER = int(os.environ.get('SHED_RETRY_AFTER', 1))
+
+# Number of most recent comments embedded in each post of the feed
+POSTS_COMMENT_PREVIEW_SIZE = int(os.environ.get('POSTS_COMMENT_PREVIEW_SIZE', 3))
+
+# Route posts to the async viewset (list, timeline, retrieve, likes, comments,
+# like and unlike as coroutines). core/asgi.py turns this on; WSGI keeps the sync views.
+POSTS_ASYNC_VIEWS = os.environ.get('POSTS_ASYNC_VIEWS', 'False').lower() in ('1', 'true')
+
+# Write-behind likes: like/unlike are buffered in memory per (post, user) and
+# flushed to the database in batches every POSTS_LIKE_BUFFER_INTERVAL seconds,
+# or as soon as POSTS_LIKE_BUFFER_MAX_BATCH events are pending
+POSTS_LIKE_BUFFER = os.environ.get('POSTS_LIKE_BUFFER', 'False').lower() in ('1', 'true')
+POSTS_LIKE_BUFFER_INTERVAL = float(os.environ.get('POSTS_LIKE_BUFFER_INTERVAL', 0.5))
+POSTS_LIKE_BUFFER_MAX_BATCH = int(os.environ.get('POSTS_LIKE_BUFFER_MAX_BATCH', 1000))
+
+# Home timelines: a new post is copied into the timeline of each of its
+# author's followers, unless there are more than POSTS_TIMELINE_FANOUT_LIMIT,
+# in which case followers read it from the author's posts instead. Following
+# someone copies their last POSTS_TIMELINE_BACKFILL posts.
+POSTS_TIMELINE_FANOUT_LIMIT = int(os.environ.get('POSTS_TIMELINE_FANOUT_LIMIT', 1000))
+POSTS_TIMELINE_BACKFILL = int(os.environ.get('POSTS_TIMELINE_BACKFILL', 50))
+
+# Search queries shorter than this are matched by trigram similarity to post
+# titles instead of full-text search. Only the POSTS_SEARCH_MAX_CANDIDATES most
+# recent matches of a query are ranked.
+POSTS_SEARCH_SHORT_QUERY_LENGTH = int(os.environ.get('POSTS_SEARCH_SHORT_QUERY_LENGTH', 4))
+POSTS_SEARCH_MAX_CANDIDATES = int(os.environ.get('POSTS_SEARCH_MAX_CANDIDATES', 1000))
 
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
@@ -103,8 +210,38 @@ SIMPLE_JWT = {
     'BLACKLIST_AFTER_ROTATION': True,
     'SIGNING_KEY': JWT_SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Verified with the keys below (posts/tokens.py)
+    'AUTH_TOKEN_CLASSES': ('posts.tokens.AccessToken',),
 }
 
+# Token verification. HS256 checks tokens with the shared JWT_SECRET_KEY.
+# RS256 and EdDSA check them with the auth service's public keys, read from
+# the JWKS document at JWT_JWKS_URL (a URL or a file path) and refreshed every
+# JWT_JWKS_REFRESH_INTERVAL seconds; a token signed by a key not seen yet
+# reloads it, at most every JWT_JWKS_RETRY_INTERVAL seconds.
+JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+JWT_JWKS_URL = os.environ.get('JWT_JWKS_URL')
+JWT_JWKS_REFRESH_INTERVAL = int(os.environ.get('JWT_JWKS_REFRESH_INTERVAL', 300))
+JWT_JWKS_RETRY_INTERVAL = int(os.environ.get('JWT_JWKS_RETRY_INTERVAL', 30))
+if JWT_ALGORITHM != 'HS256' and not JWT_JWKS_URL:
+    raise Exception(f"JWT_JWKS_URL is required to verify tokens signed with {JWT_ALGORITHM}")
+
+# Token revocation. The ids of revoked tokens are followed from the auth
+# service's revocation log at JWT_REVOCATION_URL, reloaded every
+# JWT_REVOCATION_POLL_INTERVAL seconds, and refused until they expire.
+# Unset, revoked tokens stay valid here until they expire.
+JWT_REVOCATION_URL = os.environ.get('JWT_REVOCATION_URL')
+JWT_REVOCATION_POLL_INTERVAL = float(os.environ.get('JWT_REVOCATION_POLL_INTERVAL', 2))
+
+# In-process cache of verified access tokens (0 entries disables it).
+# Entries live until the token's exp, capped at JWT_AUTH_CACHE_TTL seconds.
+JWT_AUTH_CACHE_SIZE = int(os.environ.get('JWT_AUTH_CACHE_SIZE', 10000))
+JWT_AUTH_CACHE_TTL = int(os.environ.get('JWT_AUTH_CACHE_TTL', 300))
+
+# Build request.user from the token claims (user_id, username) instead of
+# loading the User row on every request
+JWT_AUTH_CLAIMS_ONLY = os.environ.get('JWT_AUTH_CLAIMS_ONLY', 'False').lower() in ('1', 'true')
+
 # CORS settings - only needed for internal services and gateway
 CORS_ALLOWED_ORIGINS = [
     "http://ingress-nginx-controller.ingress-nginx.svc.cluster.local",
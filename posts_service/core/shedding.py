@@ -0,0 +1,116 @@
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import JsonResponse
+
+
+class LoadShedder:
+    """
+    Turns requests away while this worker process is overloaded, so the ones
+    it accepts still finish quickly instead of everyone queueing.
+
+    A request is rejected when ``max_concurrency`` requests are already in
+    flight, when it waited more than ``max_queue_time`` seconds before
+    reaching the process (from the proxy's X-Request-Start header), or when
+    the recent average latency exceeds ``max_latency`` seconds while another
+    request is in flight; one request at a time always gets through, so the
+    average keeps following the real latency. A limit of 0 is off.
+    """
+
+    def __init__(self, max_concurrency=0, max_queue_time=0, max_latency=0, retry_after=1, smoothing=0.1):
+        self.max_concurrency = max_concurrency
+        self.max_queue_time = max_queue_time
+        self.max_latency = max_latency
+        self.retry_after = retry_after
+        self.smoothing = smoothing
+        self.in_flight = 0
+        self.latency = 0.0
+        self.served = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def admit(self, request):
+        queue_time = self.max_queue_time and request_queue_time(request)
+        with self._lock:
+            if (self.max_concurrency and self.in_flight >= self.max_concurrency) \
+                    or (queue_time and queue_time > self.max_queue_time) \
+                    or (self.max_latency and self.in_flight and self.latency > self.max_latency):
+                self.shed += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, elapsed):
+        with self._lock:
+            self.in_flight -= 1
+            self.served += 1
+            # Exponentially weighted, so it recovers within a few requests
+            self.latency += self.smoothing * (elapsed - self.latency)
+
+    def reject(self):
+        response = JsonResponse({'detail': 'The service is overloaded, please retry shortly.'}, status=503)
+        response['Retry-After'] = str(self.retry_after)
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'latency': self.latency,
+                'served': self.served,
+                'shed': self.shed,
+            }
+
+
+def request_queue_time(request):
+    # X-Request-Start: t=<unix time in seconds, with milliseconds>
+    start = request.headers.get('X-Request-Start', '')
+    try:
+        return time.time() - float(start.removeprefix('t='))
+    except ValueError:
+        return None
+
+
+load_shedder = LoadShedder(
+    max_concurrency=settings.SHED_MAX_CONCURRENCY,
+    max_queue_time=settings.SHED_MAX_QUEUE_TIME,
+    max_latency=settings.SHED_MAX_LATENCY,
+    retry_after=settings.SHED_RETRY_AFTER,
+)
+
+
+class LoadSheddingMiddleware:
+    """Answers 503 with Retry-After while load_shedder rejects requests. Health checks always go through."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if request.path.endswith('/health/'):
+            return self.get_response(request)
+        if not load_shedder.admit(request):
+            return load_shedder.reject()
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            load_shedder.release(time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if request.path.endswith('/health/'):
+            return await self.get_response(request)
+        if not load_shedder.admit(request):
+            return load_shedder.reject()
+        started = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            load_shedder.release(time.perf_counter() - started)
@@ -0,0 +1,124 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'<requests>/<period>' as (capacity, tokens per second), e.g. '10/min'."""
+    requests, period = rate.split('/')
+    return int(requests), int(requests) / PERIODS[period[0]]
+
+
+def take_token(state, capacity, refill_rate, now):
+    """
+    Take one token from a bucket in ``state`` ((tokens, updated_at), or None
+    for a full one) and return its new state and 0, or the seconds until a
+    token is available when it is empty.
+    """
+    tokens, updated_at = state or (capacity, now)
+    tokens = min(capacity, tokens + (now - updated_at) * refill_rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0
+    return (tokens, now), (1 - tokens) / refill_rate
+
+
+class LocalBuckets:
+    """Token buckets kept in this process; the least recently used are dropped past ``max_entries``."""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, refill_rate):
+        with self._lock:
+            state, wait = take_token(self._buckets.pop(key, None), capacity, refill_rate, time.monotonic())
+            self._buckets[key] = state
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class CacheBuckets:
+    """
+    Token buckets in a Django cache shared by every process. The read and
+    write aren't atomic, so concurrent requests of one client can now and then
+    both take the last token.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, key, capacity, refill_rate):
+        cache = caches[self.alias]
+        state, wait = take_token(cache.get(key), capacity, refill_rate, time.time())
+        # An untouched bucket refills completely, the same as a missing one
+        cache.set(key, state, timeout=math.ceil(capacity / refill_rate))
+        return wait
+
+    def clear(self):
+        caches[self.alias].clear()
+
+
+# Shared between processes when THROTTLE_CACHE_ALIAS names a cache
+buckets = CacheBuckets(settings.THROTTLE_CACHE_ALIAS) if settings.THROTTLE_CACHE_ALIAS \
+    else LocalBuckets(settings.THROTTLE_LOCAL_SIZE)
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Limits each client to the rate of ``scope`` in DEFAULT_THROTTLE_RATES as
+    a token bucket: '10/min' allows bursts of 10 requests, refilled at one
+    every 6 seconds. Throttled requests get 429 with Retry-After. A scope
+    without a rate isn't limited.
+    """
+    scope = None
+
+    def __init__(self):
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        self.capacity, self.refill_rate = parse_rate(rate) if rate else (None, None)
+        self.retry_after = None
+
+    def get_key(self, request, view):
+        """The client the request counts against, or None to let it through."""
+        raise NotImplementedError('.get_key() must be overridden')
+
+    def allow_request(self, request, view):
+        if self.capacity is None:
+            return True
+        key = self.get_key(request, view)
+        if key is None:
+            return True
+        self.retry_after = buckets.take(f'throttle:{self.scope}:{key}', self.capacity, self.refill_rate)
+        return self.retry_after == 0
+
+    def wait(self):
+        return self.retry_after
+
+
+class IPThrottle(TokenBucketThrottle):
+    """Counts requests by client address (X-Forwarded-For behind NUM_PROXIES proxies)."""
+
+    def get_key(self, request, view):
+        return self.get_ident(request)
+
+
+class UserThrottle(TokenBucketThrottle):
+    """Counts requests by authenticated user; anonymous ones aren't limited."""
+
+    def get_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            return request.user.pk
+        return None
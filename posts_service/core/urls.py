@@ -1,5 +1,8 @@
 from django.urls import path, include
 
+from . import health
+
 urlpatterns = [
+    path('health/', health.health_check, name='health_check'),
     path('api/', include('posts.urls')),
 ] 
\ No newline at end of file
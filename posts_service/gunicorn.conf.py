@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+
+# Production server profile. Every setting can be tuned from the environment so
+# the same image serves docker-compose, Kubernetes and local load tests.
+
+
+def env_flag(name, default='False'):
+    return os.environ.get(name, default).lower() in ('1', 'true')
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '9001')}"
+
+# core.wsgi:application with sync/gthread workers, or core.asgi:application
+# with GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker
+wsgi_app = os.environ.get('GUNICORN_APP', 'core.wsgi:application')
+
+# Pre-forked worker processes; defaults to 2 x CPUs + 1, capped so a pod with a
+# generous CPU limit doesn't exhaust database connections
+workers = int(os.environ.get('GUNICORN_WORKERS', os.environ.get(
+    'WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8))))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Keep idle client/ingress connections open between requests
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Time given to in-flight requests on SIGTERM/SIGHUP before workers are killed
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers periodically to bound memory growth; the jitter stops them
+# all restarting at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+# Import the app once in the master so workers fork with it already loaded;
+# disabled when reloading on code changes in development
+reload = env_flag('GUNICORN_RELOAD')
+preload_app = not reload and env_flag('GUNICORN_PRELOAD', 'True')
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    # Load the auth service's keys and revoked tokens from the worker's start
+    # rather than from its first request (AppConfig.ready mustn't do I/O)
+    from posts.tokens import denylist, key_set
+    if key_set is not None:
+        key_set.start()
+    if denylist is not None:
+        denylist.start()
@@ -0,0 +1,85 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from rest_framework import exceptions
+
+
+class AsyncViewSetMixin:
+    """
+    Asynchronous dispatch for DRF viewsets, which DRF 3.14 only runs synchronously.
+
+    Under ASGI the view is a coroutine: handlers written with ``async def`` are
+    awaited on the event loop, so a request waiting on the database doesn't
+    hold a worker thread. Handlers left synchronous run in a thread through
+    ``sync_to_async``. Authenticators may provide an ``aauthenticate``
+    coroutine; otherwise ``authenticate`` also runs in a thread.
+    """
+    view_is_async = True
+
+    @classmethod
+    def as_view(cls, actions=None, **initkwargs):
+        return markcoroutinefunction(super().as_view(actions, **initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await self.aperform_authentication(request)
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            if iscoroutinefunction(handler):
+                response = await handler(request, *args, **kwargs)
+            else:
+                response = await sync_to_async(handler)(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def aperform_authentication(self, request):
+        # Same as Request._authenticate; initial() then finds request.user resolved
+        for authenticator in request.authenticators:
+            authenticate = getattr(authenticator, 'aauthenticate', None)
+            if authenticate is None:
+                authenticate = sync_to_async(authenticator.authenticate)
+            try:
+                user_auth_tuple = await authenticate(request)
+            except exceptions.APIException:
+                request._not_authenticated()
+                raise
+
+            if user_auth_tuple is not None:
+                request._authenticator = authenticator
+                request.user, request.auth = user_auth_tuple
+                return
+
+        request._not_authenticated()
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        try:
+            obj = await queryset.aget(**filter_kwargs)
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def apaginate_queryset(self, queryset):
+        if self.paginator is None:
+            return None
+        if hasattr(self.paginator, 'apaginate_queryset'):
+            return await self.paginator.apaginate_queryset(queryset, self.request, view=self)
+        return await sync_to_async(self.paginate_queryset)(queryset)
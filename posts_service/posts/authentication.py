@@ -1,30 +1,153 @@
+import copy
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import IntegrityError
 from rest_framework import authentication
 from rest_framework import exceptions
-from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth.models import User
 
+from .token_cache import TokenCache
+from .tokens import AccessToken, denylist
+
+# Verified tokens and their users, so repeat requests skip the signature check
+# and the user query
+token_cache = TokenCache(
+    max_entries=settings.JWT_AUTH_CACHE_SIZE,
+    max_ttl=settings.JWT_AUTH_CACHE_TTL,
+)
+
+class ClaimsUser:
+    """
+    Request principal built straight from verified token claims.
+
+    ``id`` and ``username`` come from the token; any other attribute loads the
+    User row on first access and is served from it afterwards.
+    """
+    __slots__ = ('id', 'username', '_user')
+
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, claims):
+        self.id = claims['user_id']
+        # Tokens issued before the username claim fall back to the database
+        if 'username' in claims:
+            self.username = claims['username']
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_user(self):
+        try:
+            return object.__getattribute__(self, '_user')
+        except AttributeError:
+            self._user = User.objects.get(id=self.id)
+            return self._user
+
+    def __getattr__(self, name):
+        # Only called for attributes the claims don't carry
+        if name.startswith('__') or name == '_user':
+            raise AttributeError(name)
+        return getattr(self.get_user(), name)
+
+    def __eq__(self, other):
+        if isinstance(other, (ClaimsUser, User)):
+            return self.id == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return self.username
+
+@contextmanager
+def require_existing_user(user):
+    """
+    Fail authentication with "User not found" when a write by ``user`` breaks
+    the foreign key to their User row. With JWT_AUTH_CLAIMS_ONLY, or while the
+    token cache holds them, a deleted user's token still authenticates. The
+    user is only looked up once the write has failed.
+    """
+    try:
+        yield
+    except IntegrityError:
+        if not User.objects.filter(pk=user.id).exists():
+            raise exceptions.AuthenticationFailed('User not found')
+        raise
+
 class JWTAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
+        token = self.get_token(request)
+        if token is None:
             return None
 
-        if not auth_header.startswith('Bearer '):
-            raise exceptions.AuthenticationFailed('Invalid token header. Token should begin with Bearer')
+        try:
+            claims, user = self.get_claims(token)
+            if user is None and not settings.JWT_AUTH_CLAIMS_ONLY:
+                try:
+                    user = User.objects.get(id=claims['user_id'])
+                except User.DoesNotExist:
+                    raise exceptions.AuthenticationFailed('User not found')
+                token_cache.set(token, (claims, user), claims['exp'])
+            return self.get_principal(claims, user)
+
+        except TokenError as e:
+            raise exceptions.AuthenticationFailed('Invalid token')
+        except Exception as e:
+            raise exceptions.AuthenticationFailed('Authentication failed')
+
+    async def aauthenticate(self, request):
+        # authenticate() for async views: the user lookup is awaited instead of
+        # blocking the event loop
+        token = self.get_token(request)
+        if token is None:
+            return None
 
         try:
-            token = auth_header.split(' ')[1]
-            access_token = AccessToken(token)
-            user_id = access_token['user_id']
-            
-            try:
-                user = User.objects.get(id=user_id)
-                return (user, None)
-            except User.DoesNotExist:
-                raise exceptions.AuthenticationFailed('User not found')
-                
+            claims, user = self.get_claims(token)
+            if user is None and not settings.JWT_AUTH_CLAIMS_ONLY:
+                try:
+                    user = await User.objects.aget(id=claims['user_id'])
+                except User.DoesNotExist:
+                    raise exceptions.AuthenticationFailed('User not found')
+                token_cache.set(token, (claims, user), claims['exp'])
+            return self.get_principal(claims, user)
+
         except TokenError as e:
             raise exceptions.AuthenticationFailed('Invalid token')
         except Exception as e:
-            raise exceptions.AuthenticationFailed('Authentication failed') 
\ No newline at end of file
+            raise exceptions.AuthenticationFailed('Authentication failed')
+
+    def get_token(self, request):
+        auth_header = request.headers.get('Authorization')
+        if not auth_header:
+            return None
+
+        if not auth_header.startswith('Bearer '):
+            raise exceptions.AuthenticationFailed('Invalid token header. Token should begin with Bearer')
+        return auth_header.split(' ')[1]
+
+    def get_claims(self, token):
+        # Returns (claims, user); user is None unless a full user was cached
+        cached = token_cache.get(token)
+        if cached is None:
+            claims = AccessToken(token).payload
+            cached = (claims, None)
+            if settings.JWT_AUTH_CLAIMS_ONLY:
+                token_cache.set(token, cached, claims['exp'])
+
+        # Checked on every request: a cached token may have been revoked since
+        if denylist is not None and cached[0].get(api_settings.JTI_CLAIM) in denylist:
+            raise TokenError('Token has been revoked')
+        return cached
+
+    def get_principal(self, claims, user):
+        if settings.JWT_AUTH_CLAIMS_ONLY:
+            return (ClaimsUser(claims), None)
+        # Hand out a copy so request-level changes never leak into the cache
+        return (copy.copy(user), None)
@@ -0,0 +1,182 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+
+from .like_buffer import like_buffer
+from .models import Comment, Post
+
+# Responses depend on the caller (is_liked), so shared caches must not store
+# them; browsers keep a copy and revalidate it with If-None-Match.
+CACHE_POLICY = {'private': True, 'no_cache': True}
+
+
+def make_etag(*parts):
+    return '"%s"' % hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def apply_cache_policy(response):
+    patch_cache_control(response, **CACHE_POLICY)
+    patch_vary_headers(response, ('Authorization',))
+    return response
+
+
+def conditional_view(etag_func):
+    """
+    Decorate a viewset method with ETag validation and the private
+    revalidation cache policy. A matching If-None-Match header short-circuits
+    the view with a 304. There is no Last-Modified: renamed authors change the
+    response without changing any of the post's timestamps.
+    """
+    def decorator(view_method):
+        conditioned = method_decorator(condition(etag_func=etag_func))(view_method)
+
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            return apply_cache_policy(conditioned(self, request, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def aconditional_view(etag_func):
+    """
+    conditional_view for ``async def`` detail methods. The post state and
+    comments the validator reads are loaded asynchronously up front, so it
+    never touches the database from the event loop.
+    """
+    def decorator(view_method):
+        conditioned = method_decorator(condition(etag_func=etag_func))(view_method)
+
+        @wraps(view_method)
+        async def wrapper(self, request, *args, **kwargs):
+            await apost_state(request, kwargs['pk'])
+            await apost_comments(request, kwargs['pk'])
+            return apply_cache_policy(await conditioned(self, request, *args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def not_modified(request, etag):
+    # 304 for list responses whose ETag is computed from the fetched page
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        apply_cache_policy(response)
+    return response
+
+
+def post_id(pk):
+    # The pk URL segment as an id, or None when it can't name a post (the view then 404s)
+    try:
+        return int(pk)
+    except (TypeError, ValueError):
+        return None
+
+
+def post_state_queryset(pk):
+    # The columns that change whenever the rendered post does, and the
+    # author's username, which a rename changes without touching the post
+    return Post.objects.filter(pk=pk).values('updated_at', 'last_activity_at', 'author__username')
+
+
+def post_state(request, pk):
+    states = getattr(request, '_post_states', None)
+    if states is None:
+        states = request._post_states = {}
+    pk = post_id(pk)
+    if pk is None:
+        return None
+    if pk not in states:
+        states[pk] = post_state_queryset(pk).first()
+    return states[pk]
+
+
+async def apost_state(request, pk):
+    states = getattr(request, '_post_states', None)
+    if states is None:
+        states = request._post_states = {}
+    pk = post_id(pk)
+    if pk is None:
+        return None
+    if pk not in states:
+        states[pk] = await post_state_queryset(pk).afirst()
+    return states[pk]
+
+
+def post_comments_queryset(request, pk):
+    # The comments a post detail embeds: all of them with ?expand=comments
+    # (only their authors, the detail prefetches them in full), otherwise the
+    # previews, which the view reuses. None when neither is rendered.
+    view = request.parser_context['view']
+    if view.embeds_comments():
+        return Comment.objects.filter(post_id=pk).select_related('author').only('id', 'author__username')
+    if view.renders('recent_comments'):
+        return view.recent_comments_queryset([Post(pk=pk)])
+    return None
+
+
+def post_comments(request, pk):
+    comments = getattr(request, '_post_comments', None)
+    if comments is None:
+        comments = request._post_comments = {}
+    pk = post_id(pk)
+    if pk is None:
+        return None
+    if pk not in comments:
+        queryset = post_comments_queryset(request, pk)
+        comments[pk] = list(queryset) if queryset is not None else None
+    return comments[pk]
+
+
+async def apost_comments(request, pk):
+    comments = getattr(request, '_post_comments', None)
+    if comments is None:
+        comments = request._post_comments = {}
+    pk = post_id(pk)
+    if pk is None:
+        return None
+    if pk not in comments:
+        queryset = post_comments_queryset(request, pk)
+        comments[pk] = [comment async for comment in queryset] if queryset is not None else None
+    return comments[pk]
+
+
+def post_etag(request, pk):
+    state = post_state(request, pk)
+    if state is None:
+        return None
+    # Buffered likes aren't in last_activity_at until flushed, but the viewer sees their own
+    return make_etag(pk, state['updated_at'].isoformat(), state['last_activity_at'].isoformat(),
+                     state['author__username'], request.user.id,
+                     like_buffer.pending(post_id(pk), request.user.id), request.get_full_path(),
+                     *(f'{comment.pk}/{comment.author.username}' for comment in post_comments(request, pk) or ()))
+
+
+def rendered_usernames(post):
+    # Usernames live in auth_user, so a rename changes the response but not the post
+    if Post.author.is_cached(post):
+        yield post.author.username
+    comments = getattr(post, '_prefetched_objects_cache', {}).get('comments')
+    if comments is None:
+        comments = getattr(post, 'recent_comments', ())
+    for comment in comments:
+        yield f'{comment.pk}/{comment.author.username}'
+
+
+def page_etag(request, posts):
+    # Computed once the previews and embedded comments are attached
+    return make_etag(request.user.id, request.get_full_path(), *(
+        f'{post.pk}/{post.updated_at.isoformat()}/{post.last_activity_at.isoformat()}/'
+        f'{like_buffer.pending(post.pk, request.user.id)}/{"/".join(rendered_usernames(post))}'
+        for post in posts
+    ))
+
+
+def comments_page_etag(request, comments):
+    return make_etag(request.get_full_path(), *(
+        f'{comment.pk}/{comment.updated_at.isoformat()}/'
+        f'{comment.author.username if Comment.author.is_cached(comment) else ""}'
+        for comment in comments
+    ))
@@ -0,0 +1,180 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Like, Post
+
+logger = logging.getLogger(__name__)
+
+
+class LikeBuffer:
+    """
+    Write-behind buffer for like/unlike events (POSTS_LIKE_BUFFER).
+
+    Events are kept in memory, one per (post, user) with the latest state
+    winning, and a background thread flushes them every ``interval`` seconds,
+    or sooner once ``max_batch`` are pending. A flush is one transaction: a
+    single insert of the new likes and delete of the unliked ones, and one
+    like_count update per distinct change, adding the rows each statement
+    actually inserted or deleted for the post. A viral post's row is then
+    written once per flush instead of once per click.
+
+    ``pending`` exposes the uncommitted state, so responses can overlay a
+    user's own like until it is in the database. Events still buffered when
+    the process dies without exiting cleanly are lost.
+    """
+
+    def __init__(self, interval=0.5, max_batch=1000):
+        self.interval = interval
+        self.max_batch = max_batch
+        # (post_id, user_id) -> (liked, recorded_at)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._reset_stats()
+        # A forked worker doesn't inherit the parent's thread. Reset it on
+        # fork rather than comparing pids on every record().
+        os.register_at_fork(after_in_child=self._forget_flusher)
+        # Commit what is still buffered when the process exits cleanly
+        atexit.register(self.flush)
+
+    def record(self, post_id, user_id, liked):
+        with self._lock:
+            key = (post_id, user_id)
+            # Keep the first timestamp so lag measures the oldest unflushed event
+            recorded_at = self._pending[key][1] if key in self._pending else time.monotonic()
+            self._pending[key] = (liked, recorded_at)
+            self.events += 1
+            full = len(self._pending) >= self.max_batch
+        if self._thread is None:
+            self._ensure_flusher()
+        if full:
+            self._wakeup.set()
+
+    def pending(self, post_id, user_id):
+        """The buffered like state of a user for a post, or None if there is none."""
+        entry = self._pending.get((post_id, user_id))
+        return None if entry is None else entry[0]
+
+    def flush(self):
+        with self._flush_lock:
+            # The batch stays pending, and visible to pending(), until it is committed
+            with self._lock:
+                batch = dict(self._pending)
+            if not batch:
+                return 0
+
+            started = time.monotonic()
+            with transaction.atomic():
+                # Likes of posts or users deleted meanwhile are dropped
+                touched = set(Post.objects.filter(
+                    id__in={post_id for post_id, _ in batch}
+                ).values_list('id', flat=True))
+                users = set(User.objects.filter(
+                    id__in={user_id for _, user_id in batch}
+                ).values_list('id', flat=True))
+
+                liked, unliked = [], []
+                for (post_id, user_id), (state, _) in batch.items():
+                    if post_id in touched and user_id in users:
+                        (liked if state else unliked).append((post_id, user_id))
+
+                # Only the rows actually inserted or deleted count, so likes
+                # that already existed or unlikes of missing ones are no-ops
+                added, removed = Like.objects.like_many(liked), Like.objects.unlike_many(unliked)
+                by_delta = defaultdict(list)
+                for post_id in touched:
+                    by_delta[added[post_id] - removed[post_id]].append(post_id)
+                now = timezone.now()
+                for delta, post_ids in by_delta.items():
+                    Post.objects.filter(id__in=post_ids).update(
+                        like_count=Greatest(F('like_count') + delta, 0), last_activity_at=now,
+                    )
+
+            with self._lock:
+                # Events recorded during the flush replaced their entry and stay pending
+                for key, entry in batch.items():
+                    if self._pending.get(key) is entry:
+                        del self._pending[key]
+
+            finished = time.monotonic()
+            with self._lock:
+                self.flushes += 1
+                self.flushed += len(batch)
+                self.last_batch_size = len(batch)
+                self.max_batch_size = max(self.max_batch_size, len(batch))
+                self.last_flush_ms = (finished - started) * 1000
+                self.max_flush_ms = max(self.max_flush_ms, self.last_flush_ms)
+                self.last_lag_ms = (finished - min(at for _, at in batch.values())) * 1000
+                self.max_lag_ms = max(self.max_lag_ms, self.last_lag_ms)
+            return len(batch)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': len(self._pending),
+                'events': self.events,
+                'flushes': self.flushes,
+                'flushed': self.flushed,
+                'last_batch_size': self.last_batch_size,
+                'max_batch_size': self.max_batch_size,
+                'last_flush_ms': self.last_flush_ms,
+                'max_flush_ms': self.max_flush_ms,
+                'last_lag_ms': self.last_lag_ms,
+                'max_lag_ms': self.max_lag_ms,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._pending.clear()
+            self._reset_stats()
+
+    def _reset_stats(self):
+        self.events = self.flushes = self.flushed = 0
+        self.last_batch_size = self.max_batch_size = 0
+        self.last_flush_ms = self.max_flush_ms = 0.0
+        self.last_lag_ms = self.max_lag_ms = 0.0
+
+    def _ensure_flusher(self):
+        if not self.interval:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='like-buffer', daemon=True)
+            self._thread.start()
+
+    def _forget_flusher(self):
+        self._thread = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Flushing buffered likes failed')
+            finally:
+                # Don't hold a database connection between flushes
+                close_old_connections()
+
+
+like_buffer = LikeBuffer(
+    interval=settings.POSTS_LIKE_BUFFER_INTERVAL,
+    max_batch=settings.POSTS_LIKE_BUFFER_MAX_BATCH,
+)
@@ -0,0 +1,81 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        'Load a running posts service with concurrent GETs and report throughput '
+        'and latency per concurrency level. Run it once against the WSGI server '
+        '(gunicorn gthread workers) and once against the ASGI one '
+        '(GUNICORN_APP=core.asgi:application, uvicorn workers) with the same '
+        'worker count to compare how each holds up as clients are added.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Endpoint to request, e.g. http://localhost:9001/api/posts/')
+        parser.add_argument('--token', help='Access token sent as a Bearer Authorization header')
+        parser.add_argument('--concurrency', default='1,10,50,100',
+                            help='Comma-separated numbers of concurrent clients')
+        parser.add_argument('--requests', type=int, default=500,
+                            help='Requests issued at each concurrency level')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError('--concurrency must be a comma-separated list of integers')
+        headers = {'Authorization': f"Bearer {options['token']}"} if options['token'] else {}
+
+        self.stdout.write(f"{'clients':>8} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for level in levels:
+            result = self.run_level(options['url'], headers, level, options['requests'], options['timeout'])
+            self.stdout.write(
+                f"{level:>8} {result['throughput']:>9.1f} {result['p50']:>8.1f} "
+                f"{result['p95']:>8.1f} {result['p99']:>8.1f} {result['errors']:>7}"
+            )
+
+    def run_level(self, url, headers, clients, total, timeout):
+        local = threading.local()
+        latencies = []
+        errors = 0
+        lock = threading.Lock()
+
+        def fetch(_):
+            nonlocal errors
+            # One keep-alive connection per client thread
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            started = time.perf_counter()
+            try:
+                ok = session.get(url, headers=headers, timeout=timeout).status_code < 400
+            except requests.RequestException:
+                ok = False
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                errors += not ok
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as executor:
+            list(executor.map(fetch, range(total)))
+        wall = time.perf_counter() - started
+
+        return {
+            'throughput': total / wall,
+            'p50': statistics.median(latencies),
+            'p95': percentile(latencies, 0.95),
+            'p99': percentile(latencies, 0.99),
+            'errors': errors,
+        }
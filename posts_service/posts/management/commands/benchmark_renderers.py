@@ -0,0 +1,53 @@
+import timeit
+from io import BytesIO
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer
+from posts.models import Post
+from posts.views import PostViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare DRF's stdlib JSON renderer and parser with the orjson ones on a "
+        'real feed page, as served by PostViewSet from the posts in the database, '
+        'and check that both render the same bytes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Id of the viewer (defaults to the first user)')
+        parser.add_argument('--expand', action='store_true', help='Embed every comment (?expand=comments)')
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(pk=options['user']).first() if options['user'] else User.objects.first()
+        if user is None or not Post.objects.exists():
+            raise CommandError('Needs at least one user and one post in the database')
+
+        url = '/api/posts/?expand=comments' if options['expand'] else '/api/posts/'
+        request = APIRequestFactory().get(url)
+        force_authenticate(request, user=user)
+        data = PostViewSet.as_view({'get': 'list'})(request).data
+
+        stdlib, fast = JSONRenderer(), ORJSONRenderer()
+        body = stdlib.render(data)
+        if fast.render(data) != body:
+            raise CommandError('The renderers disagree on this payload')
+
+        iterations = options['iterations']
+        self.stdout.write(f'{len(data["results"])} posts, {len(body)} bytes, {iterations} iterations')
+        self.stdout.write(f"{'':>8} {'stdlib us':>10} {'orjson us':>10} {'speedup':>8}")
+        self.report('render', iterations, lambda: stdlib.render(data), lambda: fast.render(data))
+        self.report('parse', iterations,
+                    lambda: JSONParser().parse(BytesIO(body)), lambda: ORJSONParser().parse(BytesIO(body)))
+
+    def report(self, name, iterations, baseline, candidate):
+        before = timeit.timeit(baseline, number=iterations) / iterations * 1e6
+        after = timeit.timeit(candidate, number=iterations) / iterations * 1e6
+        self.stdout.write(f'{name:>8} {before:>10.1f} {after:>10.1f} {before / after:>7.1f}x')
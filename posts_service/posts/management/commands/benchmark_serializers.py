@@ -0,0 +1,62 @@
+import timeit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from posts.models import Comment, Like, Post
+from posts.serializers import (
+    CommentReadSerializer, CommentSerializer, LikeReadSerializer, LikeSerializer, PostSerializer,
+)
+from posts.views import PostViewSet
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the per-item cost of the ModelSerializers and the read serializers '
+        'on posts, comments and likes from the database, loaded the way the list '
+        'endpoints load them, and check that both produce the same JSON.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Id of the viewer (defaults to the first user)')
+        parser.add_argument('--items', type=int, default=10, help='Objects serialized per call (a page)')
+        parser.add_argument('--expand', action='store_true', help='Embed every comment (?expand=comments)')
+        parser.add_argument('--iterations', type=int, default=500)
+
+    def handle(self, *args, **options):
+        user = User.objects.filter(pk=options['user']).first() if options['user'] else User.objects.first()
+        if user is None or not Post.objects.exists():
+            raise CommandError('Needs at least one user and one post in the database')
+
+        view = PostViewSet()
+        url = '/api/posts/?expand=comments' if options['expand'] else '/api/posts/'
+        view.request = Request(APIRequestFactory().get(url))
+        view.request.user = user
+        view.format_kwarg, view.action, view.kwargs = None, 'list', {}
+
+        items = options['items']
+        posts = list(view.annotate_for_serializer(Post.objects.all())[:items])
+        view.attach_recent_comments(posts)
+        context = view.get_serializer_context()
+        comments = list(Comment.objects.select_related('author')[:items])
+        likes = list(Like.objects.all()[:items])
+
+        self.stdout.write(f"{'':>9} {'items':>6} {'model us/item':>14} {'read us/item':>13} {'speedup':>8}")
+        self.compare('posts', posts, lambda: PostSerializer(posts, many=True, context=context).data,
+                     lambda: view.get_read_serializer().serialize(posts), options['iterations'])
+        self.compare('comments', comments, lambda: CommentSerializer(comments, many=True).data,
+                     lambda: CommentReadSerializer().serialize(comments), options['iterations'])
+        self.compare('likes', likes, lambda: LikeSerializer(likes, many=True).data,
+                     lambda: LikeReadSerializer().serialize(likes), options['iterations'])
+
+    def compare(self, name, objects, model, read, iterations):
+        if not objects:
+            return
+        if JSONRenderer().render(model()) != JSONRenderer().render(read()):
+            raise CommandError(f'The {name} serializers disagree')
+        before = timeit.timeit(model, number=iterations) / iterations / len(objects) * 1e6
+        after = timeit.timeit(read, number=iterations) / iterations / len(objects) * 1e6
+        self.stdout.write(f'{name:>9} {len(objects):>6} {before:>14.1f} {after:>13.1f} {before / after:>7.1f}x')
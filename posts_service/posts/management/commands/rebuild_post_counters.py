@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.models import Post, Like, Comment, related_count
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized like_count and comment_count columns on posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of posts updated per transaction')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        last_id = 0
+        updated = 0
+
+        # Walk the primary key so each batch is an indexed range and a short transaction
+        while True:
+            ids = list(
+                Post.objects.filter(id__gt=last_id).order_by('id').values_list('id', flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            with transaction.atomic():
+                updated += Post.objects.filter(id__in=ids).update(
+                    like_count=related_count(Like),
+                    comment_count=related_count(Comment),
+                )
+            last_id = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt counters for {updated} posts'))
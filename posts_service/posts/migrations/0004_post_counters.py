@@ -0,0 +1,40 @@
+# Generated by Django 5.0.3 on 2026-10-18 04:46
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_counters(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Like = apps.get_model('posts', 'Like')
+    Comment = apps.get_model('posts', 'Comment')
+
+    def count_of(model):
+        counts = model.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+            total=Count('id')
+        ).values('total')
+        return Coalesce(Subquery(counts), 0)
+
+    Post.objects.update(like_count=count_of(Like), comment_count=count_of(Comment))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_like'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
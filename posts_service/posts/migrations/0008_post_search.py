@@ -0,0 +1,64 @@
+# Generated by Django 5.0.3 on 2026-10-18 05:17
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+# The trigger keeps search_vector in step with title and content on every
+# INSERT and on UPDATEs that set either column, whatever issues the write
+CREATE_SEARCH = """
+CREATE FUNCTION posts_post_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(NEW.content, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER posts_post_search_vector
+BEFORE INSERT OR UPDATE OF title, content ON posts_post
+FOR EACH ROW EXECUTE FUNCTION posts_post_search_vector();
+
+-- Fill existing rows through the trigger
+UPDATE posts_post SET title = title;
+
+CREATE INDEX post_search_idx ON posts_post USING gin (search_vector);
+CREATE INDEX post_title_trgm_idx ON posts_post USING gin (title gin_trgm_ops);
+"""
+
+DROP_SEARCH = """
+DROP INDEX IF EXISTS post_title_trgm_idx;
+DROP INDEX IF EXISTS post_search_idx;
+DROP TRIGGER IF EXISTS posts_post_search_vector ON posts_post;
+DROP FUNCTION IF EXISTS posts_post_search_vector();
+"""
+
+
+def create_search(apps, schema_editor):
+    # GIN indexes and triggers are PostgreSQL only; other databases search
+    # with a substring match instead
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_SEARCH)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0007_follow_timeline'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
@@ -1,48 +1,350 @@
-from django.db import models
+from collections import Counter, defaultdict
+
+from django.db import connections, models, transaction
+from django.utils import timezone
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField, TrigramWordSimilarity
+from django.db.models import Count, F, OuterRef, Q, Subquery, Value, Window
+from django.db.models.functions import Cast, Coalesce, Greatest, RowNumber
 from django.contrib.auth.models import User
 
+def related_count(model):
+    # Number of `model` rows pointing at each post, for Post.objects.update()
+    counts = model.objects.filter(post=OuterRef('pk')).order_by().values('post').annotate(
+        total=Count('id')
+    ).values('total')
+    return Coalesce(Subquery(counts), 0)
+
+# Text search configuration of Post.search_vector; must match the trigger
+# that fills it (migration 0008_post_search)
+SEARCH_CONFIG = 'english'
+
+class PostQuerySet(models.QuerySet):
+    def search(self, query, short_query_length, max_candidates):
+        """
+        Posts matching ``query``, annotated with a ``rank`` (higher is better).
+
+        On PostgreSQL the query, in websearch syntax, is matched against the
+        GIN-indexed search_vector and ranked with ts_rank. Queries shorter than
+        ``short_query_length`` characters, often partial words that stemming
+        misses, are matched by trigram word similarity to the title instead,
+        using its trigram index. Only the ``max_candidates`` most recent
+        matches are ranked, so a query matching most posts costs about the same
+        as a selective one. Other databases fall back to an unranked substring
+        match.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return self.filter(Q(title__icontains=query) | Q(content__icontains=query)).annotate(rank=Value(0.0))
+        if len(query) < short_query_length:
+            matches = self.filter(title__trigram_word_similar=query)
+            rank = TrigramWordSimilarity(query, 'title')
+        else:
+            search = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+            matches = self.filter(search_vector=search)
+            rank = SearchRank(F('search_vector'), search)
+        candidates = matches.order_by('-created_at', '-id').values('id')[:max_candidates]
+        # Both ranks are computed as real; cast to double precision they
+        # round-trip exactly through the pagination cursor
+        return self.filter(id__in=candidates).annotate(rank=Cast(rank, models.FloatField()))
+
 class Post(models.Model):
     title = models.CharField(max_length=200)
     content = models.TextField()
-    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
+    # Indexed by post_author_created_id_idx
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts', db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters, kept in sync by the views and rebuilt with
+    # the rebuild_post_counters management command
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Bumped whenever likes or comments change, so HTTP validators only need this row
+    last_activity_at = models.DateTimeField(default=timezone.now)
+    # Whether the post was copied into its readers' timelines when created.
+    # Posts of very followed authors aren't, and are merged in at read time.
+    fanned_out = models.BooleanField(default=False)
+    # Weighted title and content lexemes, maintained by a database trigger on
+    # PostgreSQL and indexed with GIN there (not set on other databases)
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
-        ordering = ['-created_at']
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Backs keyset pagination of the feed
+            models.Index(fields=['-created_at', '-id'], name='post_created_id_idx'),
+            # Backs ?author=
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_created_id_idx'),
+            # Backs the fan-out-on-read part of home timelines, which only
+            # needs the few posts that weren't fanned out
+            models.Index(fields=['-created_at', '-id'], name='post_pull_created_id_idx',
+                         condition=Q(fanned_out=False)),
+        ]
 
     def __str__(self):
         return self.title
-    
-    @property
-    def like_count(self):
-        return self.likes.count()
+
+    @classmethod
+    def adjust_counter(cls, pk, field, delta):
+        # Atomic UPDATE ... SET field = field + delta, never going below zero
+        return cls.objects.filter(pk=pk).update(
+            **{field: Greatest(F(field) + delta, 0)},
+            last_activity_at=timezone.now(),
+        )
+
+    @classmethod
+    def touch(cls, pk):
+        return cls.objects.filter(pk=pk).update(last_activity_at=timezone.now())
     
     @property
     def liked_by(self):
-        return [like.user.id for like in self.likes.all()]
+        return list(self.likes.values_list('user_id', flat=True))
+
+class LikeQuerySet(models.QuerySet):
+    """
+    Idempotent like/unlike that keep Post.like_count in step with the Like rows.
+
+    Both return ``(changed, like_count)``, or None if the post doesn't exist.
+    On PostgreSQL each is a single statement: the insert or delete and the
+    counter update run in one data-modifying CTE, so a click costs one round
+    trip, and concurrent or repeated clicks are absorbed by the unique
+    (post, user) constraint rather than raising IntegrityError.
+    """
+
+    def like(self, post_id, user_id):
+        if self._connection.vendor == 'postgresql':
+            return self._apply(f"""
+                WITH changed AS (
+                    INSERT INTO {self._likes} (post_id, user_id, created_at)
+                    SELECT %(post)s, %(user)s, now()
+                    WHERE EXISTS (SELECT 1 FROM {self._posts} WHERE id = %(post)s)
+                    ON CONFLICT (post_id, user_id) DO NOTHING
+                    RETURNING post_id
+                ), counted AS (
+                    UPDATE {self._posts} SET like_count = like_count + 1, last_activity_at = now()
+                    WHERE id IN (SELECT post_id FROM changed)
+                    RETURNING like_count
+                )
+            """, post_id, user_id)
+
+        with transaction.atomic(using=self.db):
+            if not Post.objects.filter(pk=post_id).exists():
+                return None
+            _, created = self.get_or_create(post_id=post_id, user_id=user_id)
+            if created:
+                Post.adjust_counter(post_id, 'like_count', 1)
+            return created, Post.objects.values_list('like_count', flat=True).get(pk=post_id)
+
+    def unlike(self, post_id, user_id):
+        if self._connection.vendor == 'postgresql':
+            return self._apply(f"""
+                WITH changed AS (
+                    DELETE FROM {self._likes} WHERE post_id = %(post)s AND user_id = %(user)s
+                    RETURNING post_id
+                ), counted AS (
+                    UPDATE {self._posts} SET like_count = GREATEST(like_count - 1, 0), last_activity_at = now()
+                    WHERE id IN (SELECT post_id FROM changed)
+                    RETURNING like_count
+                )
+            """, post_id, user_id)
+
+        with transaction.atomic(using=self.db):
+            deleted, _ = self.filter(post_id=post_id, user_id=user_id).delete()
+            if deleted:
+                Post.adjust_counter(post_id, 'like_count', -1)
+            like_count = Post.objects.filter(pk=post_id).values_list('like_count', flat=True).first()
+            return None if like_count is None else (bool(deleted), like_count)
+
+    def like_many(self, pairs):
+        """
+        Add the likes in ``pairs`` ((post_id, user_id)) that don't exist yet
+        and return how many were added to each post, for the counters.
+        """
+        if not pairs:
+            return Counter()
+        if self._connection.vendor == 'postgresql':
+            post_ids, user_ids = zip(*pairs)
+            with self._connection.cursor() as cursor:
+                cursor.execute(f"""
+                    INSERT INTO {self._likes} (post_id, user_id, created_at)
+                    SELECT post_id, user_id, now() FROM unnest(%s::bigint[], %s::bigint[]) AS pairs (post_id, user_id)
+                    ON CONFLICT (post_id, user_id) DO NOTHING
+                    RETURNING post_id
+                """, [list(post_ids), list(user_ids)])
+                return Counter(post_id for post_id, in cursor.fetchall())
+
+        # Elsewhere the existing likes are read first, which is exact as long
+        # as the caller's transaction keeps concurrent writers out
+        existing = set(self.filter(
+            post_id__in={post_id for post_id, _ in pairs}, user_id__in={user_id for _, user_id in pairs},
+        ).values_list('post_id', 'user_id'))
+        added = [Like(post_id=post_id, user_id=user_id) for post_id, user_id in pairs
+                 if (post_id, user_id) not in existing]
+        self.bulk_create(added, ignore_conflicts=True)
+        return Counter(like.post_id for like in added)
+
+    def unlike_many(self, pairs):
+        """Delete the likes in ``pairs`` and return how many were removed from each post."""
+        if not pairs:
+            return Counter()
+        if self._connection.vendor == 'postgresql':
+            post_ids, user_ids = zip(*pairs)
+            with self._connection.cursor() as cursor:
+                cursor.execute(f"""
+                    DELETE FROM {self._likes} AS likes
+                    USING unnest(%s::bigint[], %s::bigint[]) AS pairs (post_id, user_id)
+                    WHERE likes.post_id = pairs.post_id AND likes.user_id = pairs.user_id
+                    RETURNING likes.post_id
+                """, [list(post_ids), list(user_ids)])
+                return Counter(post_id for post_id, in cursor.fetchall())
+
+        by_post = defaultdict(list)
+        for post_id, user_id in pairs:
+            by_post[post_id].append(user_id)
+        removed = Counter()
+        for post_id, user_ids in by_post.items():
+            removed[post_id], _ = self.filter(post_id=post_id, user_id__in=user_ids).delete()
+        return removed
+
+    @property
+    def _connection(self):
+        return connections[self.db]
+
+    @property
+    def _likes(self):
+        return self._connection.ops.quote_name(Like._meta.db_table)
+
+    @property
+    def _posts(self):
+        return self._connection.ops.quote_name(Post._meta.db_table)
+
+    def _apply(self, changes, post_id, user_id):
+        # The counter is only updated when a row actually changed; otherwise
+        # the current value is read from the statement's snapshot
+        sql = f"""{changes}
+            SELECT EXISTS (SELECT 1 FROM changed),
+                   COALESCE((SELECT like_count FROM counted),
+                            (SELECT like_count FROM {self._posts} WHERE id = %(post)s))
+        """
+        with self._connection.cursor() as cursor:
+            cursor.execute(sql, {'post': post_id, 'user': user_id})
+            changed, like_count = cursor.fetchone()
+        return None if like_count is None else (changed, like_count)
 
 class Like(models.Model):
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes')
+    # Indexed by the (post, user) unique constraint
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes', db_index=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes')
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = LikeQuerySet.as_manager()
+
     class Meta:
+        # Its index also answers "has the viewer liked this post" from the
+        # index alone
         unique_together = ('post', 'user')
         ordering = ['-created_at']
+        indexes = [
+            # Backs the likes of a post, newest first
+            models.Index(fields=['post', '-created_at'], name='like_post_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.user.username} likes {self.post.title}'
 
+class CommentQuerySet(models.QuerySet):
+    def latest_per_post(self, post_ids, size):
+        # The `size` most recent comments of each post, in one window-function query
+        return self.filter(post_id__in=post_ids).annotate(
+            position=Window(
+                RowNumber(),
+                partition_by=F('post_id'),
+                order_by=[F('created_at').desc(), F('id').desc()],
+            )
+        ).filter(position__lte=size)
+
 class Comment(models.Model):
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
+    # Indexed by comment_post_created_id_idx
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', db_index=False)
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments')
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = CommentQuerySet.as_manager()
+
     class Meta:
+        ordering = ['-created_at', '-id']
+        indexes = [
+            # Backs keyset pagination of a post's comment thread
+            models.Index(fields=['post', '-created_at', '-id'], name='comment_post_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f'Comment by {self.author.username} on {self.post.title}'
+
+
+class FollowQuerySet(models.QuerySet):
+    def fan_out_targets(self, user_id, limit):
+        """
+        Ids of the followers of ``user_id`` whose timelines get a copy of
+        their new posts, or None if there are more than ``limit``.
+        """
+        # Never reads more than limit + 1 rows, however followed the author is
+        followers = list(self.filter(followee_id=user_id).values_list('follower_id', flat=True)[:limit + 1])
+        return None if len(followers) > limit else followers
+
+class Follow(models.Model):
+    follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
+    followee = models.ForeignKey(User, on_delete=models.CASCADE, related_name='followers')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = FollowQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('follower', 'followee')
         ordering = ['-created_at']
 
     def __str__(self):
-        return f'Comment by {self.author.username} on {self.post.title}' 
\ No newline at end of file
+        return f'{self.follower.username} follows {self.followee.username}'
+
+class TimelineEntryQuerySet(models.QuerySet):
+    def fan_out(self, post, owner_ids):
+        # The author sees their own posts on their timeline too
+        owner_ids = {post.author_id, *owner_ids}
+        return self.bulk_create([
+            TimelineEntry(owner_id=owner_id, post=post, author_id=post.author_id, created_at=post.created_at)
+            for owner_id in owner_ids
+        ], batch_size=1000)
+
+    def backfill(self, owner_id, author_id, size):
+        # Recent fanned-out posts of a newly followed author; the others are
+        # merged in at read time anyway
+        posts = Post.objects.filter(author_id=author_id, fanned_out=True).values_list('id', 'created_at')
+        return self.bulk_create([
+            TimelineEntry(owner_id=owner_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for post_id, created_at in posts[:size]
+        ], ignore_conflicts=True)
+
+class TimelineEntry(models.Model):
+    """
+    A post materialized in a user's home timeline (fan-out-on-write).
+
+    author and created_at are copied from the post, so a page of a timeline
+    is one range read of the (owner, created_at, post) index and unfollowing
+    deletes by (owner, author).
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False)
+    created_at = models.DateTimeField()
+
+    objects = TimelineEntryQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        ordering = ['-created_at', '-post_id']
+        indexes = [
+            models.Index(fields=['owner', '-created_at', '-post'], name='timeline_owner_created_idx'),
+            models.Index(fields=['owner', 'author'], name='timeline_owner_author_idx'),
+        ]
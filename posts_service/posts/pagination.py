@@ -0,0 +1,168 @@
+import base64
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination over (created_at, id), newest first.
+
+    Each page is a single indexed range read: the cursor carries the position of
+    the last item returned and the next page starts strictly after it, so deep
+    pages cost the same as the first one and rows created in the meantime never
+    shift the window. No total count is computed.
+
+    Requests that pass ``?page=`` are served by PageNumberPagination so existing
+    clients keep working.
+    """
+    page_size = api_settings.PAGE_SIZE
+    cursor_query_param = 'cursor'
+    legacy_query_param = 'page'
+    invalid_cursor_message = 'Invalid cursor'
+    # (timestamp, unique tiebreaker) fields the cursor positions on
+    position_fields = ('created_at', 'id')
+
+    @property
+    def ordering(self):
+        return tuple(f'-{field}' for field in self.position_fields)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.seek(queryset, request)
+        if self.legacy is not None:
+            return self.legacy.paginate_queryset(queryset, request, view)
+        # Fetch one extra row to know whether there is a next page
+        return self.trim(list(queryset[:self.page_size + 1]))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        queryset = self.seek(queryset, request)
+        if self.legacy is not None:
+            return await sync_to_async(self.legacy.paginate_queryset)(queryset, request, view)
+        return self.trim([obj async for obj in queryset[:self.page_size + 1]])
+
+    def seek(self, queryset, request):
+        self.request = request
+        queryset = queryset.order_by(*self.ordering)
+
+        if self.legacy_query_param and self.legacy_query_param in request.query_params:
+            self.legacy = PageNumberPagination()
+            return queryset
+        self.legacy = None
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            value, pk = position
+            field, tiebreaker = self.position_fields
+            # The redundant bound on the first field lets the planner turn the
+            # seek into an index range scan on (created_at, id)
+            queryset = queryset.filter(**{f'{field}__lte': value}).filter(
+                Q(**{f'{field}__lt': value}) | Q(**{field: value, f'{tiebreaker}__lt': pk})
+            )
+        return queryset
+
+    def trim(self, page):
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.last = page[-1] if page else None
+        return page
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        if self.legacy_query_param:
+            url = remove_query_param(url, self.legacy_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def position(self, obj):
+        return tuple(getattr(obj, field) for field in self.position_fields)
+
+    def encode_cursor(self, obj):
+        value, pk = self.position(obj)
+        position = f'{self.format_position(value)}|{pk}'
+        return base64.urlsafe_b64encode(position.encode('ascii')).decode('ascii')
+
+    def format_position(self, value):
+        return value.isoformat()
+
+    def parse_position(self, value):
+        return datetime.fromisoformat(value)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            value, pk = position.rsplit('|', 1)
+            return self.parse_position(value), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+
+class TimelinePagination(KeysetPagination):
+    """
+    Keyset pagination of a home timeline merged from several sources.
+
+    Every source is positioned on (created_at, post_id), so one cursor seeks
+    into each of them: the materialized timeline entries and the posts of
+    followed authors that were not fanned out. Each source contributes at most
+    one page plus one row, and the merged rows are cut back to a page.
+    """
+    legacy_query_param = None
+    position_fields = ('created_at', 'post_id')
+
+    def paginate_sources(self, querysets, request, view=None):
+        rows = []
+        for queryset in querysets:
+            rows.extend(self.seek(queryset, request)[:self.page_size + 1])
+        return self.merge(rows)
+
+    async def apaginate_sources(self, querysets, request, view=None):
+        rows = []
+        for queryset in querysets:
+            rows.extend([row async for row in self.seek(queryset, request)[:self.page_size + 1]])
+        return self.merge(rows)
+
+    def merge(self, rows):
+        return self.trim(sorted(rows, key=self.position, reverse=True))
+
+
+class SearchPagination(KeysetPagination):
+    """
+    Keyset pagination of search results, best match first.
+
+    The cursor carries the rank of the last result instead of a timestamp;
+    ranks are recomputed identically for every page, so the seek is exact.
+    """
+    legacy_query_param = None
+    position_fields = ('rank', 'id')
+
+    def format_position(self, value):
+        return repr(value)
+
+    def parse_position(self, value):
+        return float(value)
@@ -1,7 +1,67 @@
-from rest_framework import serializers
-from .models import Post, Comment, Like
+from operator import attrgetter
 
-class CommentSerializer(serializers.ModelSerializer):
+from django.conf import settings
+from rest_framework import permissions, serializers
+from rest_framework.settings import api_settings
+from .models import Post, Comment, Like, Follow
+
+
+def sparse_fieldset(request, serializer_class):
+    """
+    The names of the serializer_class fields a GET asks for with ``?fields=``
+    (only these) or ``?omit=`` (all but these), comma-separated, or None when
+    it asks for neither. Writes always get every field.
+    """
+    if request.method not in permissions.SAFE_METHODS:
+        return None
+    only, omit = request.query_params.get('fields'), request.query_params.get('omit')
+    if only is None and omit is None:
+        return None
+    if only is not None and omit is not None:
+        raise serializers.ValidationError({'fields': 'Use either fields or omit, not both.'})
+
+    param = 'fields' if only is not None else 'omit'
+    names = {name.strip() for name in request.query_params[param].split(',')} - {''}
+    available = serializer_class.Meta.fields
+    unknown = names.difference(available)
+    if unknown:
+        raise serializers.ValidationError({param: f"Unknown fields: {', '.join(sorted(unknown))}."})
+    if param == 'fields':
+        if not names:
+            raise serializers.ValidationError({'fields': 'Name at least one field.'})
+        return frozenset(names)
+    return frozenset(available).difference(names)
+
+
+class SparseFieldsetMixin:
+    """
+    Renders only the fields in the ``fields`` context entry (as returned by
+    sparse_fieldset), when it is set. Nested serializers always render in full.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if selected is None or parent is not None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
+
+    @classmethod
+    def sparse_columns(cls, names):
+        """The ``only()`` paths of the model columns read by the named fields."""
+        model_fields = {field.name for field in cls.Meta.model._meta.concrete_fields}
+        columns = []
+        for name in names:
+            declared = cls._declared_fields.get(name)
+            path = ((declared.source if declared is not None else None) or name).replace('.', '__')
+            # Method fields ('*') and reverse relations read no column of their own
+            if path.split('__')[0] in model_fields:
+                columns.append(path)
+        return tuple(columns)
+
+
+class CommentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     
     class Meta:
@@ -15,28 +75,188 @@ class LikeSerializer(serializers.ModelSerializer):
         fields = ('id', 'user', 'post', 'created_at')
         read_only_fields = ('id', 'user', 'post', 'created_at')
 
-class PostSerializer(serializers.ModelSerializer):
+class FollowSerializer(serializers.ModelSerializer):
+    followee_username = serializers.CharField(source='followee.username', read_only=True)
+
+    class Meta:
+        model = Follow
+        fields = ('id', 'followee', 'followee_username', 'created_at')
+        read_only_fields = ('id', 'created_at')
+
+    def validate_followee(self, value):
+        if value.id == self.context['request'].user.id:
+            raise serializers.ValidationError('You cannot follow yourself')
+        return value
+
+class PostSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     comments = CommentSerializer(many=True, read_only=True)
-    like_count = serializers.SerializerMethodField()
+    recent_comments = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
         fields = ('id', 'title', 'content', 'author', 'author_username', 'created_at', 
-                 'updated_at', 'comments', 'like_count', 'is_liked')
-        read_only_fields = ('id', 'author', 'created_at', 'updated_at', 'like_count', 'is_liked')
+                 'updated_at', 'comments', 'recent_comments', 'like_count', 'comment_count',
+                 'is_liked')
+        read_only_fields = ('id', 'author', 'created_at', 'updated_at', 'like_count',
+                            'comment_count', 'is_liked')
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # The full comment list is only embedded on ?expand=comments
+        if not self.context.get('expand_comments'):
+            fields.pop('comments', None)
+        return fields
+
+    def get_recent_comments(self, obj):
+        # PostViewSet attaches the preview for a whole page in one query
+        comments = getattr(obj, 'recent_comments', None)
+        if comments is None:
+            comments = obj.comments.select_related('author')[:settings.POSTS_COMMENT_PREVIEW_SIZE]
+        return CommentSerializer(comments, many=True).data
 
-    def get_like_count(self, obj):
-        return obj.like_count
-    
     def get_is_liked(self, obj):
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
+        # Use the Exists() subquery annotated by PostViewSet when present
+        viewer_has_liked = getattr(obj, 'viewer_has_liked', None)
+        if viewer_has_liked is not None:
+            return viewer_has_liked
         return user.id in obj.liked_by
 
     def create(self, validated_data):
         # Set the author to the current authenticated user
-        validated_data['author'] = self.context['request'].user
-        return super().create(validated_data) 
\ No newline at end of file
+        validated_data['author_id'] = self.context['request'].user.id
+        return super().create(validated_data) 
+
+class ReadSerializer:
+    """
+    Read-only stand-in for a ModelSerializer on hot list endpoints.
+
+    The fields and their order come from ``serializer_class``, but each one is
+    compiled into a plain accessor, so an object becomes a dict without going
+    through DRF's per-field get_attribute/to_representation. Plain model
+    fields, foreign keys and ISO 8601 datetimes are read directly; other
+    fields fall back to their own to_representation, and method fields call
+    the serializer's ``get_<name>``. A ``get_<name>`` defined here takes
+    precedence. The output is the same as ``serializer_class(...).data``.
+
+    Compiled fields are shared by every instance with the same
+    ``fields_key()``, so the ModelSerializer's fields are only built once.
+    """
+    serializer_class = None
+    _compiled = {}
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        self.serializer = self.serializer_class(context=self.context)
+        key = (type(self), self.fields_key())
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled, shareable = self.compile_fields()
+            if shareable:
+                self._compiled[key] = compiled
+        # Each compiled field makes its accessor for this instance, so methods
+        # see the current context and datetimes the current timezone
+        self.accessors = [(name, make(self)) for name, make in compiled]
+
+    def fields_key(self):
+        """The context values that change which fields the serializer has."""
+        return self.context.get('fields')
+
+    def serialize(self, objects):
+        accessors = self.accessors
+        return [{name: get(obj) for name, get in accessors} for obj in objects]
+
+    def compile_fields(self):
+        compiled, shareable = [], True
+        for name, field in self.serializer.fields.items():
+            if field.write_only:
+                continue
+            make = self.compile(name, field)
+            # A fallback field stays bound to this instance's serializer
+            shareable = shareable and getattr(make, 'shareable', True)
+            compiled.append((name, make))
+        return compiled, shareable
+
+    def compile(self, name, field):
+        if hasattr(self, f'get_{name}'):
+            return attrgetter(f'get_{name}')
+        if isinstance(field, serializers.SerializerMethodField):
+            return attrgetter(f'serializer.{field.method_name}')
+
+        kind = type(field)
+        if kind is serializers.PrimaryKeyRelatedField and field.pk_field is None and len(field.source_attrs) == 1:
+            # The foreign key column, without loading the related object
+            get = attrgetter(f'{field.source}_id')
+            return lambda read_serializer: get
+        get = attrgetter('.'.join(field.source_attrs))
+        if kind is serializers.DateTimeField and self.iso_datetimes(field):
+            return lambda read_serializer: self.datetime_accessor(get, field)
+
+        if kind is serializers.IntegerField:
+            convert = int
+        elif kind is serializers.CharField:
+            convert = str
+        elif kind is serializers.BooleanField:
+            convert = bool
+        else:
+            convert = field.to_representation
+
+        def accessor(obj):
+            value = get(obj)
+            return None if value is None else convert(value)
+        make = lambda read_serializer: accessor
+        make.shareable = convert is not field.to_representation
+        return make
+
+    def iso_datetimes(self, field):
+        output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+        return output_format is not None and output_format.lower() == 'iso-8601' and not hasattr(field, 'timezone')
+
+    @staticmethod
+    def datetime_accessor(get, field):
+        field_timezone = field.default_timezone()
+
+        def accessor(obj):
+            value = get(obj)
+            if value is None:
+                return None
+            # Same as DateTimeField.to_representation for aware values
+            if field_timezone is None or value.tzinfo is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            return value[:-6] + 'Z' if value.endswith('+00:00') else value
+        return accessor
+
+
+class CommentReadSerializer(ReadSerializer):
+    serializer_class = CommentSerializer
+
+
+class LikeReadSerializer(ReadSerializer):
+    serializer_class = LikeSerializer
+
+
+class PostReadSerializer(ReadSerializer):
+    serializer_class = PostSerializer
+
+    def __init__(self, context=None):
+        # Embedded comments always render in full, whatever ?fields= says
+        self.comment_serializer = CommentReadSerializer()
+        super().__init__(context)
+
+    def fields_key(self):
+        # PostSerializer.get_fields drops `comments` unless expanded
+        return bool(self.context.get('expand_comments')), super().fields_key()
+
+    def get_comments(self, obj):
+        return self.comment_serializer.serialize(obj.comments.all())
+
+    def get_recent_comments(self, obj):
+        comments = getattr(obj, 'recent_comments', None)
+        if comments is None:
+            comments = obj.comments.select_related('author')[:settings.POSTS_COMMENT_PREVIEW_SIZE]
+        return self.comment_serializer.serialize(comments)
@@ -0,0 +1,1400 @@
+import asyncio
+import json
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from uuid import UUID
+from unittest import addModuleCleanup, mock, skipUnless
+
+from asgiref.sync import iscoroutinefunction
+from cryptography.hazmat.primitives.asymmetric import ed25519
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Exists, OuterRef
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, resolve
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.routers import DefaultRouter
+from rest_framework.test import APIRequestFactory, APITestCase, APITransactionTestCase
+from rest_framework_simplejwt.tokens import AccessToken
+
+from core.denylist import Denylist
+from core.jwks import KeySet, KeySetTokenBackend, public_jwk
+from core.parsers import ORJSONParser
+from core.pgpool.pool import ConnectionPool, PoolTimeout
+from core.renderers import ORJSONRenderer
+from core.shedding import LoadShedder
+from core.throttling import buckets
+
+from .authentication import ClaimsUser, token_cache
+from .like_buffer import LikeBuffer, like_buffer
+from .models import Post, Comment, Like, Follow, TimelineEntry
+from .tokens import AccessToken as KeySetAccessToken
+from .serializers import (
+    CommentReadSerializer, CommentSerializer, LikeReadSerializer, LikeSerializer,
+    PostReadSerializer, PostSerializer,
+)
+from .views import AsyncPostViewSet
+
+# URLconf for AsyncPostViewTests: the async viewset regardless of POSTS_ASYNC_VIEWS
+async_router = DefaultRouter()
+async_router.register(r'posts', AsyncPostViewSet, basename='post')
+urlpatterns = [path('api/', include(async_router.urls))]
+
+
+
+def setUpModule():
+    # Only ThrottleTests enforce rate limits
+    rates = throttle_rates()
+    rates.enable()
+    addModuleCleanup(rates.disable)
+
+
+def throttle_rates(**rates):
+    return override_settings(REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'DEFAULT_THROTTLE_RATES': rates})
+
+class PostQueryCountTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def create_activity(self, posts, comments_per_post, likes_per_post):
+        for i in range(posts):
+            author = User.objects.create_user(username=f'author{Post.objects.count()}')
+            post = Post.objects.create(title=f'Post {i}', content='Content', author=author)
+            for j in range(comments_per_post):
+                commenter = User.objects.create_user(username=f'commenter{post.id}_{j}')
+                Comment.objects.create(post=post, author=commenter, content='Nice')
+            for j in range(likes_per_post):
+                liker = User.objects.create_user(username=f'liker{post.id}_{j}')
+                Like.objects.create(post=post, user=liker)
+            Post.objects.filter(pk=post.pk).update(
+                like_count=likes_per_post, comment_count=comments_per_post
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        self.create_activity(posts=1, comments_per_post=1, likes_per_post=1)
+        baseline = self.count_queries('/api/posts/')
+
+        self.create_activity(posts=8, comments_per_post=4, likes_per_post=5)
+        self.client.post(f'/api/posts/{Post.objects.first().id}/like/')
+
+        # The posts page and the comments prefetch
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/posts/')
+        self.assertEqual(self.count_queries('/api/posts/'), baseline)
+        self.assertEqual(len(response.data['results']), 9)
+
+        # Legacy page-number mode adds the COUNT
+        with self.assertNumQueries(3):
+            self.client.get('/api/posts/?page=1')
+
+    def test_retrieve_query_count_is_constant(self):
+        self.create_activity(posts=1, comments_per_post=6, likes_per_post=7)
+        post = Post.objects.get()
+        self.client.post(f'/api/posts/{post.id}/like/')
+
+        # The validator lookups (the post's state and the previews, reused) and the post
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/posts/{post.id}/')
+        self.assertEqual(response.data['like_count'], 8)
+        self.assertTrue(response.data['is_liked'])
+        self.assertEqual(len(response.data['recent_comments']), 3)
+
+        # The validator also reads the embedded comments' authors
+        with self.assertNumQueries(4):
+            response = self.client.get(f'/api/posts/{post.id}/?expand=comments')
+        self.assertEqual(len(response.data['comments']), 6)
+        self.assertTrue(all(c['author_username'] for c in response.data['comments']))
+
+    def test_annotated_values_match_model(self):
+        self.create_activity(posts=3, comments_per_post=2, likes_per_post=3)
+        liked = Post.objects.last()
+        self.client.post(f'/api/posts/{liked.id}/like/')
+
+        response = self.client.get('/api/posts/')
+        for item in response.data['results']:
+            post = Post.objects.get(pk=item['id'])
+            self.assertEqual(item['like_count'], post.likes.count())
+            self.assertEqual(item['comment_count'], post.comments.count())
+            self.assertEqual(item['is_liked'], self.user.id in post.liked_by)
+            self.assertEqual(item['author_username'], post.author.username)
+
+
+class CommentPreviewTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def test_feed_embeds_only_the_most_recent_comments(self):
+        busy = Post.objects.create(title='Busy', content='Content', author=self.user)
+        quiet = Post.objects.create(title='Quiet', content='Content', author=self.user)
+        for i in range(5):
+            self.client.post(f'/api/posts/{busy.id}/comment/', {'content': f'Comment {i}'})
+        self.client.post(f'/api/posts/{quiet.id}/comment/', {'content': 'Only'})
+
+        response = self.client.get('/api/posts/')
+        items = {item['id']: item for item in response.data['results']}
+        self.assertNotIn('comments', items[busy.id])
+        self.assertEqual(items[busy.id]['comment_count'], 5)
+        self.assertEqual(
+            [c['content'] for c in items[busy.id]['recent_comments']],
+            ['Comment 4', 'Comment 3', 'Comment 2'],
+        )
+        self.assertEqual([c['content'] for c in items[quiet.id]['recent_comments']], ['Only'])
+
+    def test_expand_comments_embeds_the_full_list(self):
+        post = Post.objects.create(title='Busy', content='Content', author=self.user)
+        for i in range(5):
+            self.client.post(f'/api/posts/{post.id}/comment/', {'content': f'Comment {i}'})
+
+        response = self.client.get('/api/posts/?expand=comments')
+        item = response.data['results'][0]
+        self.assertEqual(len(item['comments']), 5)
+        self.assertEqual(item['recent_comments'], item['comments'][:3])
+
+
+class PostCounterTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.post = Post.objects.create(title='Post', content='Content', author=self.user)
+
+    def assertCounters(self, like_count, comment_count):
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, like_count)
+        self.assertEqual(self.post.comment_count, comment_count)
+
+    def test_like_and_unlike_maintain_like_count(self):
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertCounters(1, 0)
+
+        # Repeats are no-ops that report the current state
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'liked': True, 'like_count': 1})
+        self.assertCounters(1, 0)
+
+        self.client.post(f'/api/posts/{self.post.id}/unlike/')
+        self.assertCounters(0, 0)
+
+        response = self.client.post(f'/api/posts/{self.post.id}/unlike/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'liked': False, 'like_count': 0})
+        self.assertCounters(0, 0)
+
+    def test_like_state_is_per_user(self):
+        other = User.objects.create_user(username='other')
+        Like.objects.like(self.post.pk, other.pk)
+
+        response = self.client.post(f'/api/posts/{self.post.id}/like/')
+        self.assertEqual(response.data, {'liked': True, 'like_count': 2})
+        response = self.client.post(f'/api/posts/{self.post.id}/unlike/')
+        self.assertEqual(response.data, {'liked': False, 'like_count': 1})
+
+    @skipUnless(connection.vendor == 'postgresql', 'single-statement like/unlike is PostgreSQL-only')
+    def test_like_and_unlike_are_one_statement(self):
+        for action in ('like', 'like', 'unlike', 'unlike'):
+            with self.assertNumQueries(1):
+                self.client.post(f'/api/posts/{self.post.id}/{action}/')
+        self.assertCounters(0, 0)
+
+    def test_like_missing_post(self):
+        self.assertEqual(self.client.post('/api/posts/999/like/').status_code, 404)
+        self.assertEqual(self.client.post('/api/posts/999/unlike/').status_code, 404)
+        self.assertEqual(self.client.post('/api/posts/abc/like/').status_code, 404)
+        self.assertFalse(Like.objects.exists())
+
+    def test_comments_maintain_comment_count(self):
+        self.client.post(f'/api/posts/{self.post.id}/comment/', {'content': 'First'})
+        response = self.client.post(f'/api/posts/{self.post.id}/comment/', {'content': 'Second'})
+        self.assertCounters(0, 2)
+
+        self.client.delete(f'/api/posts/{self.post.id}/comments/{response.data["id"]}/')
+        self.assertCounters(0, 1)
+
+    def test_rebuild_command_repairs_drift(self):
+        other = User.objects.create_user(username='other')
+        Like.objects.create(post=self.post, user=other)
+        Comment.objects.create(post=self.post, author=other, content='Untracked')
+        Post.objects.filter(pk=self.post.pk).update(like_count=42)
+        empty = Post.objects.create(title='Empty', content='Content', author=other)
+        Post.objects.filter(pk=empty.pk).update(comment_count=3)
+
+        call_command('rebuild_post_counters', batch_size=1, stdout=StringIO())
+
+        self.assertCounters(1, 1)
+        empty.refresh_from_db()
+        self.assertEqual((empty.like_count, empty.comment_count), (0, 0))
+
+
+class KeysetPaginationTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_feed_pages_cover_every_post_once_in_order(self):
+        posts = [Post.objects.create(title=f'Post {i}', content='Content', author=self.user) for i in range(25)]
+        # Ties on created_at are broken by id
+        Post.objects.filter(pk__in=[p.pk for p in posts[5:15]]).update(created_at=posts[5].created_at)
+
+        expected = list(Post.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/posts/'), expected)
+
+    def test_new_posts_do_not_shift_the_next_page(self):
+        for i in range(15):
+            Post.objects.create(title=f'Post {i}', content='Content', author=self.user)
+        first = self.client.get('/api/posts/')
+        Post.objects.create(title='Newer', content='Content', author=self.user)
+
+        second = self.client.get(first.data['next'])
+        first_ids = [item['id'] for item in first.data['results']]
+        second_ids = [item['id'] for item in second.data['results']]
+        self.assertEqual(len(first_ids) + len(second_ids), 15)
+        self.assertFalse(set(first_ids) & set(second_ids))
+        self.assertIsNone(second.data['next'])
+
+    def test_comment_thread_is_paginated(self):
+        post = Post.objects.create(title='Post', content='Content', author=self.user)
+        for i in range(12):
+            Comment.objects.create(post=post, author=self.user, content=f'Comment {i}')
+
+        ids = self.walk(f'/api/posts/{post.id}/comments/')
+        self.assertEqual(ids, list(post.comments.values_list('id', flat=True)))
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/posts/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+
+class TokenCacheTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.url = '/api/posts/'
+
+    def authorize(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_repeat_requests_skip_verification_and_user_query(self):
+        self.authorize(AccessToken.for_user(self.user))
+
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+        self.assertEqual(len(second.captured_queries), len(first.captured_queries) - 1)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+        self.assertEqual(token_cache.stats()['misses'], 1)
+
+    def test_entries_expire_with_the_token(self):
+        token = AccessToken.for_user(self.user)
+        token.set_exp(lifetime=timedelta(seconds=-1))
+        self.authorize(token)
+
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(token_cache.stats()['size'], 0)
+
+    def test_cache_is_bounded(self):
+        self.addCleanup(setattr, token_cache, 'max_entries', token_cache.max_entries)
+        token_cache.max_entries = 2
+        tokens = [str(AccessToken.for_user(self.user)) for _ in range(3)]
+        for token in tokens:
+            self.authorize(token)
+            self.client.get(self.url)
+
+        self.assertEqual(token_cache.stats()['size'], 2)
+        self.assertIsNone(token_cache.get(tokens[0]))
+        self.assertIsNotNone(token_cache.get(tokens[2]))
+
+
+@override_settings(JWT_AUTH_CLAIMS_ONLY=True)
+class ClaimsOnlyAuthenticationTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='password', email='v@example.com')
+        token = AccessToken.for_user(self.user)
+        token['username'] = self.user.username
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_requests_do_not_load_the_user(self):
+        post = Post.objects.create(title='Post', content='Content', author=self.user)
+
+        # The validator lookup, the post and the comment preview, with no query
+        # for the principal even though the token has not been seen before
+        with self.assertNumQueries(3):
+            response = self.client.get(f'/api/posts/{post.id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_writes_use_the_principal_id(self):
+        response = self.client.post('/api/posts/', {'title': 'Mine', 'content': 'Content'})
+        self.assertEqual(response.status_code, 201)
+        post = Post.objects.get(pk=response.data['id'])
+        self.assertEqual(post.author, self.user)
+
+        self.assertEqual(self.client.post(f'/api/posts/{post.id}/like/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/posts/{post.id}/comment/', {'content': 'Hi'}).status_code, 201)
+        self.assertEqual(self.client.patch(f'/api/posts/{post.id}/', {'title': 'Edited'}).status_code, 200)
+        self.assertTrue(self.client.get(f'/api/posts/{post.id}/').data['is_liked'])
+
+    def test_unknown_attributes_load_the_user_once(self):
+        principal = ClaimsUser({'user_id': self.user.id, 'username': 'viewer'})
+        with self.assertNumQueries(0):
+            self.assertEqual((principal.id, principal.pk, principal.username), (self.user.id, self.user.id, 'viewer'))
+            self.assertEqual(principal, self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(principal.email, 'v@example.com')
+            self.assertEqual(principal.is_staff, False)
+
+
+@override_settings(JWT_AUTH_CLAIMS_ONLY=True)
+class DeletedUserWriteTests(APITransactionTestCase):
+    # Foreign keys are checked when the transaction commits, which APITestCase never does
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.author = User.objects.create_user(username='author')
+        self.post = Post.objects.create(title='Post', content='Content', author=self.author)
+        user = User.objects.create_user(username='deleted')
+        token = AccessToken.for_user(user)
+        token['username'] = user.username
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        user.delete()
+
+    def test_writes_fail_authentication(self):
+        for url, data in (
+            ('/api/posts/', {'title': 'Mine', 'content': 'Content'}),
+            (f'/api/posts/{self.post.id}/like/', {}),
+            (f'/api/posts/{self.post.id}/comment/', {'content': 'Hi'}),
+            ('/api/follows/', {'followee': self.author.id}),
+        ):
+            with self.subTest(url=url):
+                response = self.client.post(url, data)
+                # Like any failed authentication here, rather than a foreign key error
+                self.assertEqual(response.status_code, 403)
+                self.assertEqual(response.data['detail'], 'User not found')
+        self.assertEqual(Post.objects.count(), 1)
+        self.assertFalse(Comment.objects.exists())
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.post = Post.objects.create(title='Post', content='Content', author=self.user)
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_post_returns_304_without_loading_it(self):
+        url = f'/api/posts/{self.post.id}/'
+        response = self.client.get(url)
+        self.assertIn('private', response['Cache-Control'])
+        self.assertIn('no-cache', response['Cache-Control'])
+        self.assertNotIn('no-store', response['Cache-Control'])
+        self.assertIn('Authorization', response['Vary'])
+        # A rename changes no timestamp, so there is no Last-Modified to trust
+        self.assertNotIn('Last-Modified', response)
+
+        # The post's state and the previews' authors
+        with self.assertNumQueries(2):
+            revalidated = self.revalidate(url, response)
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_renamed_authors_change_the_validators(self):
+        commenter = User.objects.create_user(username='commenter')
+        Comment.objects.create(post=self.post, author=commenter, content='Hi')
+        for url in (f'/api/posts/{self.post.id}/', f'/api/posts/{self.post.id}/?expand=comments',
+                    f'/api/posts/{self.post.id}/comments/', '/api/posts/', '/api/posts/timeline/',
+                    '/api/posts/search/?q=Post'):
+            # The comment thread doesn't render the post's author
+            for user in (commenter,) if url.endswith('/comments/') else (self.user, commenter):
+                with self.subTest(url=url, user=user.username):
+                    response = self.client.get(url)
+                    self.assertEqual(self.revalidate(url, response).status_code, 304)
+                    User.objects.filter(pk=user.pk).update(username=f'{user.username}-{response["ETag"][1:9]}')
+                    self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_likes_comments_and_edits_change_the_validators(self):
+        url = f'/api/posts/{self.post.id}/'
+        for change in (
+            lambda: self.client.post(f'/api/posts/{self.post.id}/like/'),
+            lambda: self.client.post(f'/api/posts/{self.post.id}/comment/', {'content': 'Hi'}),
+            lambda: self.client.patch(url, {'title': 'Edited'}),
+            lambda: self.client.post(f'/api/posts/{self.post.id}/unlike/'),
+        ):
+            response = self.client.get(url)
+            change()
+            self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_comment_thread_revalidates(self):
+        url = f'/api/posts/{self.post.id}/comments/'
+        self.client.post(f'/api/posts/{self.post.id}/comment/', {'content': 'Hi'})
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        comment = Comment.objects.get()
+        self.client.patch(f'/api/posts/{self.post.id}/comments/{comment.id}/', {'content': 'Edited'})
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_feed_page_revalidates_without_serializing(self):
+        response = self.client.get('/api/posts/')
+        # The page and its previews, whose authors the response renders
+        with self.assertNumQueries(2):
+            self.assertEqual(self.revalidate('/api/posts/', response).status_code, 304)
+
+        Post.objects.create(title='Newer', content='Content', author=self.user)
+        self.assertEqual(self.revalidate('/api/posts/', response).status_code, 200)
+
+    def test_validators_are_per_viewer(self):
+        url = f'/api/posts/{self.post.id}/'
+        response = self.client.get(url)
+        self.client.force_authenticate(user=User.objects.create_user(username='other'))
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_missing_post(self):
+        self.assertEqual(self.client.get('/api/posts/999/').status_code, 404)
+
+    def test_non_numeric_pk(self):
+        for url in ('/api/posts/abc/', '/api/posts/abc/comments/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def test_returned_connections_are_reused(self):
+        pool = ConnectionPool(size=2)
+        connection = pool.checkout(FakeConnection)
+        pool.checkin(connection)
+
+        self.assertIs(pool.checkout(FakeConnection), connection)
+        self.assertEqual(pool.stats()['created'], 1)
+        self.assertEqual(pool.stats()['reused'], 1)
+
+    def test_overflow_connections_are_closed_on_return(self):
+        pool = ConnectionPool(size=1, overflow=1)
+        first, second = pool.checkout(FakeConnection), pool.checkout(FakeConnection)
+        pool.checkin(first)
+        pool.checkin(second)
+
+        self.assertTrue(second.closed)
+        self.assertEqual(pool.stats()['idle'], 1)
+
+    def test_exhausted_pool_times_out(self):
+        pool = ConnectionPool(size=1, timeout=0.01)
+        pool.checkout(FakeConnection)
+
+        with self.assertRaises(PoolTimeout):
+            pool.checkout(FakeConnection)
+        self.assertEqual(pool.stats()['timeouts'], 1)
+
+    def test_closed_and_expired_connections_are_replaced(self):
+        pool = ConnectionPool(size=2, recycle=0)
+        connection = pool.checkout(FakeConnection)
+        pool.checkin(connection)
+
+        self.assertIsNot(pool.checkout(FakeConnection), connection)
+        self.assertTrue(connection.closed)
+
+    def test_broken_connections_are_discarded(self):
+        pool = ConnectionPool(size=1)
+        connection = pool.checkout(FakeConnection)
+        pool.checkin(connection, reusable=False)
+
+        self.assertEqual(pool.stats(), dict(pool.stats(), checked_out=0, idle=0, discarded=1))
+
+    def test_stale_connections_are_pinged_outside_the_lock(self):
+        pool = ConnectionPool(size=1, ping_after=0)
+        connection = pool.checkout(FakeConnection)
+        pool.checkin(connection)
+        others_got_through = []
+
+        def ping():
+            other = threading.Thread(target=lambda: others_got_through.append(pool.stats()))
+            other.start()
+            other.join(1)
+            raise OSError('server closed the connection')
+
+        connection.cursor = ping
+        self.assertIsNot(pool.checkout(FakeConnection), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual(len(others_got_through), 1)
+        self.assertEqual(pool.stats()['checked_out'], 1)
+
+
+class HealthCheckTests(APITestCase):
+    def test_reports_database_status(self):
+        response = self.client.get('/health/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], 'healthy')
+        self.assertTrue(response.json()['database']['connected'])
+
+
+@override_settings(ROOT_URLCONF='posts.tests')
+class AsyncPostViewTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.token = str(AccessToken.for_user(self.user))
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        self.post = Post.objects.create(title='Post', content='Content', author=self.user)
+        for i in range(4):
+            Comment.objects.create(post=self.post, author=self.user, content=f'Comment {i}')
+        Like.objects.create(post=self.post, user=self.user)
+
+    def assertSameAsSync(self, url):
+        response = self.client.get(url)
+        with override_settings(ROOT_URLCONF='core.urls'):
+            expected = self.client.get(url)
+        self.assertEqual(response.status_code, expected.status_code)
+        self.assertEqual(response.json(), expected.json())
+        return response
+
+    def test_hot_endpoints_are_coroutines(self):
+        self.assertTrue(iscoroutinefunction(resolve('/api/posts/').func))
+        self.assertTrue(iscoroutinefunction(resolve(f'/api/posts/{self.post.id}/likes/').func))
+
+    def test_responses_match_the_sync_views(self):
+        for url in ('/api/posts/', f'/api/posts/{self.post.id}/', f'/api/posts/{self.post.id}/likes/',
+                    f'/api/posts/{self.post.id}/comments/', '/api/posts/?page=1',
+                    f'/api/posts/{self.post.id}/?expand=comments', '/api/posts/timeline/',
+                    '/api/posts/timeline/?expand=comments', '/api/posts/?fields=id,is_liked',
+                    f'/api/posts/{self.post.id}/?omit=content', f'/api/posts/{self.post.id}/comments/?fields=id',
+                    '/api/posts/timeline/?fields=title'):
+            with self.subTest(url=url):
+                self.assertSameAsSync(url)
+
+    def test_list_query_count(self):
+        self.client.get('/api/posts/')
+        # Token and user are cached now: page + previews
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+    def test_conditional_get(self):
+        url = f'/api/posts/{self.post.id}/'
+        response = self.client.get(url)
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.assertEqual(self.client.get('/api/posts/999/').status_code, 404)
+        for url in ('/api/posts/abc/', '/api/posts/abc/comments/'):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_like_and_unlike(self):
+        post = Post.objects.create(title='Other', content='Content', author=self.user)
+        url = f'/api/posts/{post.id}'
+
+        for _ in range(2):
+            self.assertEqual(self.client.post(f'{url}/like/').data, {'liked': True, 'like_count': 1})
+        for _ in range(2):
+            self.assertEqual(self.client.post(f'{url}/unlike/').data, {'liked': False, 'like_count': 0})
+        self.assertEqual(self.client.post('/api/posts/999/like/').status_code, 404)
+
+    def test_sync_actions_still_work(self):
+        response = self.client.post('/api/posts/', {'title': 'New', 'content': 'Content'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['author'], self.user.id)
+
+    def test_authentication(self):
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer nope')
+        self.assertEqual(self.client.get('/api/posts/').status_code, 403)
+        self.client.credentials()
+        self.assertEqual(self.client.get('/api/posts/').status_code, 403)
+
+    async def test_concurrent_requests(self):
+        headers = {'Authorization': f'Bearer {self.token}'}
+        responses = await asyncio.gather(*(
+            self.async_client.get(f'/api/posts/{self.post.id}/', headers=headers) for _ in range(5)
+        ))
+        self.assertEqual([response.status_code for response in responses], [200] * 5)
+
+
+@override_settings(POSTS_LIKE_BUFFER=True)
+class LikeBufferTests(APITestCase):
+    def setUp(self):
+        # Flushed explicitly instead of by the background thread
+        self.addCleanup(setattr, like_buffer, 'interval', like_buffer.interval)
+        like_buffer.interval = 0
+        like_buffer.clear()
+        self.addCleanup(like_buffer.clear)
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.post = Post.objects.create(title='Post', content='Content', author=self.user)
+        self.url = f'/api/posts/{self.post.id}'
+
+    def test_likes_are_written_on_flush(self):
+        response = self.client.post(f'{self.url}/like/')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data, {'liked': True, 'like_count': 1})
+        self.assertFalse(Like.objects.exists())
+
+        self.assertEqual(like_buffer.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertTrue(Like.objects.filter(post=self.post, user=self.user).exists())
+
+        self.client.post(f'{self.url}/unlike/')
+        like_buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 0)
+        self.assertFalse(Like.objects.exists())
+
+    def test_events_are_deduplicated_per_user_and_post(self):
+        for action in ('like', 'unlike', 'like', 'like'):
+            self.client.post(f'{self.url}/{action}/')
+        others = [User.objects.create_user(username=f'other{i}') for i in range(3)]
+        for other in others:
+            like_buffer.record(self.post.pk, other.pk, True)
+
+        self.assertEqual(like_buffer.stats()['pending'], 4)
+        # posts, users, insert, counter update, plus the savepoint pair; other
+        # databases read the existing likes before inserting
+        with self.assertNumQueries(6 if connection.vendor == 'postgresql' else 7):
+            self.assertEqual(like_buffer.flush(), 4)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 4)
+
+        stats = like_buffer.stats()
+        self.assertEqual((stats['events'], stats['flushes'], stats['last_batch_size']), (7, 1, 4))
+        self.assertGreater(stats['last_lag_ms'], 0)
+
+    def test_reads_overlay_the_viewers_pending_like(self):
+        detail = self.client.get(f'{self.url}/')
+        self.client.post(f'{self.url}/like/')
+
+        for response in (self.client.get(f'{self.url}/'), self.client.get('/api/posts/')):
+            data = response.data if 'id' in response.data else response.data['results'][0]
+            self.assertTrue(data['is_liked'])
+            self.assertEqual(data['like_count'], 1)
+        # The viewer's cached copy is no longer valid either
+        self.assertEqual(self.client.get(f'{self.url}/', HTTP_IF_NONE_MATCH=detail['ETag']).status_code, 200)
+
+        self.client.force_authenticate(user=User.objects.create_user(username='other'))
+        self.assertFalse(self.client.get(f'{self.url}/').data['is_liked'])
+
+    def test_counters_only_move_by_the_rows_changed(self):
+        other = User.objects.create_user(username='other')
+        Like.objects.like(self.post.pk, other.pk)
+        like_buffer.record(self.post.pk, other.pk, True)
+        like_buffer.record(self.post.pk, self.user.pk, False)
+        like_buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+        like_buffer.record(self.post.pk, self.user.pk, True)
+        like_buffer.record(self.post.pk, other.pk, False)
+        like_buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertEqual(list(Like.objects.values_list('user_id', flat=True)), [self.user.pk])
+
+    def test_batch_stays_pending_until_committed(self):
+        like_buffer.record(self.post.pk, self.user.pk, True)
+        like_many = Like.objects.like_many
+        seen = []
+
+        def record_meanwhile(pairs):
+            seen.append(like_buffer.pending(self.post.pk, self.user.pk))
+            like_buffer.record(self.post.pk, self.user.pk, False)
+            return like_many(pairs)
+
+        with mock.patch.object(Like.objects, 'like_many', side_effect=OSError):
+            with self.assertRaises(OSError):
+                like_buffer.flush()
+        self.assertTrue(like_buffer.pending(self.post.pk, self.user.pk))
+
+        with mock.patch.object(Like.objects, 'like_many', side_effect=record_meanwhile):
+            like_buffer.flush()
+        # The unlike recorded during the flush is flushed next time
+        self.assertEqual(seen, [True])
+        self.assertIs(like_buffer.pending(self.post.pk, self.user.pk), False)
+        like_buffer.flush()
+        self.assertIsNone(like_buffer.pending(self.post.pk, self.user.pk))
+        self.assertFalse(Like.objects.exists())
+
+    def test_deleted_posts_are_skipped(self):
+        self.client.post(f'{self.url}/like/')
+        self.post.delete()
+        like_buffer.flush()
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(self.client.post(f'{self.url}/like/').status_code, 404)
+
+    def test_flusher_starts_once_per_process(self):
+        buffer = LikeBuffer(interval=60)
+        self.addCleanup(buffer.clear)
+        with mock.patch('posts.like_buffer.threading.Thread') as thread:
+            buffer.record(self.post.pk, self.user.pk, True)
+            buffer.record(self.post.pk, self.user.pk, False)
+            self.assertEqual(thread.call_count, 1)
+
+            # What a forked worker runs: it has no flusher thread of its own yet
+            buffer._forget_flusher()
+            buffer.record(self.post.pk, self.user.pk, True)
+            self.assertEqual(thread.call_count, 2)
+
+
+@override_settings(POSTS_TIMELINE_FANOUT_LIMIT=2)
+class TimelineTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.author = User.objects.create_user(username='author', password='password')
+        self.celebrity = User.objects.create_user(username='celebrity', password='password')
+        self.stranger = User.objects.create_user(username='stranger', password='password')
+        for fan in range(3):
+            Follow.objects.create(follower=User.objects.create_user(username=f'fan{fan}'), followee=self.celebrity)
+        self.client.force_authenticate(user=self.user)
+        for followee in (self.author, self.celebrity):
+            self.assertEqual(self.client.post('/api/follows/', {'followee': followee.id}).status_code, 201)
+
+    def publish(self, user, count):
+        self.client.force_authenticate(user=user)
+        ids = [self.client.post('/api/posts/', {'title': f'Post {i}', 'content': 'Content'}).data['id']
+               for i in range(count)]
+        self.client.force_authenticate(user=self.user)
+        return ids
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_timeline_merges_fanned_out_and_pulled_posts(self):
+        for user, count in ((self.author, 8), (self.celebrity, 8), (self.user, 3), (self.stranger, 2)):
+            self.publish(user, count)
+        # Fanned out to the viewer, the author and nobody else
+        self.assertEqual(TimelineEntry.objects.filter(author=self.author).count(), 16)
+        # More followers than the limit: read from the author's posts instead
+        self.assertFalse(TimelineEntry.objects.filter(author=self.celebrity).exists())
+        Post.objects.filter(author=self.celebrity).update(created_at=Post.objects.earliest('created_at').created_at)
+
+        expected = list(Post.objects.exclude(author=self.stranger).order_by('-created_at', '-id')
+                        .values_list('id', flat=True))
+        self.assertEqual(self.walk('/api/posts/timeline/'), expected)
+
+    def test_timeline_page_query_count(self):
+        self.publish(self.author, 12)
+        self.publish(self.celebrity, 12)
+        # Timeline entries, pulled posts and the comment previews
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/posts/timeline/')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(self.client.get('/api/posts/timeline/', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        other = User.objects.create_user(username='other', password='password')
+        earlier = self.publish(other, 3)
+        self.assertEqual(self.walk('/api/posts/timeline/'), [])
+
+        self.assertEqual(self.client.post('/api/follows/', {'followee': other.id}).status_code, 201)
+        self.assertEqual(self.client.post('/api/follows/', {'followee': other.id}).status_code, 200)
+        self.assertEqual(self.walk('/api/posts/timeline/'), earlier[::-1])
+        self.assertEqual(len(self.client.get('/api/follows/').data['results']), 3)
+
+        self.assertEqual(self.client.delete(f'/api/follows/{other.id}/').status_code, 204)
+        self.assertEqual(self.walk('/api/posts/timeline/'), [])
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user, author=other).exists())
+        self.assertEqual(self.client.delete(f'/api/follows/{other.id}/').status_code, 404)
+
+    def test_cannot_follow_yourself_or_missing_users(self):
+        self.assertEqual(self.client.post('/api/follows/', {'followee': self.user.id}).status_code, 400)
+        self.assertEqual(self.client.post('/api/follows/', {'followee': 999}).status_code, 400)
+
+    def test_deleted_posts_leave_the_timeline(self):
+        post_id, = self.publish(self.author, 1)
+        Post.objects.filter(pk=post_id).delete()
+        self.assertFalse(TimelineEntry.objects.exists())
+
+
+class SearchTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+        self.tuning = Post.objects.create(title='Database tuning', content='Indexes and query plans',
+                                          author=self.user)
+        self.pasta = Post.objects.create(title='Cooking pasta', content='Boil the water first',
+                                         author=self.user)
+
+    def search(self, query):
+        response = self.client.get('/api/posts/search/', {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return [item['id'] for item in response.data['results']]
+
+    def walk(self, url):
+        seen = []
+        while url:
+            response = self.client.get(url)
+            seen.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return seen
+
+    def test_query_is_required(self):
+        for url in ('/api/posts/search/', '/api/posts/search/?q=%20'):
+            self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_search_matches_title_and_content(self):
+        self.assertEqual(self.search('tuning'), [self.tuning.id])
+        self.assertEqual(self.search('water'), [self.pasta.id])
+        self.assertEqual(self.search('astronomy'), [])
+
+    def test_results_are_paginated(self):
+        # Varying how often the term appears varies the rank
+        ids = {Post.objects.create(title=f'Post {i}', content='database ' * (i % 4 + 1), author=self.user).id
+               for i in range(23)}
+        seen = self.walk('/api/posts/search/?q=database')
+        self.assertEqual(len(seen), 24)
+        self.assertEqual(set(seen), ids | {self.tuning.id})
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search is PostgreSQL-only')
+    def test_ranking_and_stemming(self):
+        mention = Post.objects.create(title='Notes', content='Some tuning tips', author=self.user)
+        # A title match outranks a content match; "tuned" and "tuning" share a stem
+        self.assertEqual(self.search('tuned'), [self.tuning.id, mention.id])
+        self.assertEqual(self.search('tuning -database'), [mention.id])
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search is PostgreSQL-only')
+    def test_vector_follows_updates(self):
+        self.client.patch(f'/api/posts/{self.pasta.id}/', {'title': 'Cooking risotto'})
+        self.assertEqual(self.search('risotto'), [self.pasta.id])
+        self.assertEqual(self.search('pasta'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'trigram matching is PostgreSQL-only')
+    def test_short_queries_match_partial_words(self):
+        self.assertEqual(self.search('pas'), [self.pasta.id])
+
+    @skipUnless(connection.vendor == 'postgresql', 'GIN indexes are PostgreSQL-only')
+    def test_search_uses_the_gin_indexes(self):
+        with connection.cursor() as cursor:
+            # The tables are far too small for the planner to prefer an index on its own
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        plans = [Post.objects.search(query, 4, 1000).explain() for query in ('tuning', 'pas')]
+        self.assertIn('post_search_idx', plans[0])
+        self.assertIn('post_title_trgm_idx', plans[1])
+
+
+SEED_SQL = """
+INSERT INTO auth_user (password, is_superuser, username, first_name, last_name, email,
+                       is_staff, is_active, date_joined)
+SELECT '', false, 'seed' || g, '', '', '', false, true, now() FROM generate_series(1, 1000) g;
+
+INSERT INTO posts_post (title, content, author_id, created_at, updated_at, like_count,
+                        comment_count, last_activity_at, fanned_out)
+SELECT 'Post ' || g, 'Content', (SELECT min(id) FROM auth_user) + g % 1000,
+       now() - g * interval '1 minute', now(), 0, 0, now(), true
+FROM generate_series(1, 20000) g;
+
+INSERT INTO posts_comment (post_id, author_id, content, created_at, updated_at)
+SELECT (SELECT min(id) FROM posts_post) + g % 20000, (SELECT min(id) FROM auth_user) + g % 997,
+       'Comment', now() - g * interval '1 second', now()
+FROM generate_series(1, 60000) g;
+
+INSERT INTO posts_like (post_id, user_id, created_at)
+SELECT (SELECT min(id) FROM posts_post) + g % 20000, (SELECT min(id) FROM auth_user) + g % 991,
+       now() - g * interval '1 second'
+FROM generate_series(1, 80000) g
+ON CONFLICT DO NOTHING;
+
+INSERT INTO posts_follow (follower_id, followee_id, created_at)
+SELECT (SELECT min(id) FROM auth_user) + g % 1000, (SELECT min(id) FROM auth_user) + (g * 7) % 1000, now()
+FROM generate_series(1, 20000) g
+ON CONFLICT DO NOTHING;
+
+INSERT INTO posts_timelineentry (owner_id, post_id, author_id, created_at)
+SELECT f.follower_id, p.id, p.author_id, p.created_at
+FROM posts_follow f JOIN posts_post p ON p.author_id = f.followee_id;
+
+ANALYZE;
+"""
+
+
+@skipUnless(connection.vendor == 'postgresql', 'query plans are PostgreSQL-specific')
+class QueryPlanTests(APITestCase):
+    """The planner picks the composite indexes for each access path on a realistically sized dataset."""
+
+    @classmethod
+    def setUpTestData(cls):
+        with connection.cursor() as cursor:
+            cursor.execute(SEED_SQL)
+        cls.user = User.objects.order_by('id').first()
+        cls.post = Post.objects.order_by('id').first()
+
+    def setUp(self):
+        self.client.force_authenticate(user=self.user)
+
+    def explain(self, sql, params=()):
+        # QuerySet.explain() can't wrap the window-function filter of latest_per_post
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN {sql}', params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+
+    def assertUsesIndex(self, queryset, index):
+        plan = self.explain(*queryset.query.sql_with_params())
+        self.assertIn(index, plan)
+        self.assertNotIn('Seq Scan on posts_', plan)
+        return plan
+
+    def test_feed(self):
+        self.assertUsesIndex(Post.objects.all()[:11], 'post_created_id_idx')
+
+    def test_posts_by_author(self):
+        self.assertUsesIndex(Post.objects.filter(author=self.user)[:11], 'post_author_created_id_idx')
+
+    def test_comment_thread_and_previews(self):
+        self.assertUsesIndex(self.post.comments.all()[:11], 'comment_post_created_id_idx')
+        post_ids = Post.objects.values_list('id', flat=True)[:10]
+        self.assertUsesIndex(Comment.objects.latest_per_post(list(post_ids), 3), 'comment_post_created_id_idx')
+
+    def test_likes_of_a_post(self):
+        self.assertUsesIndex(self.post.likes.all(), 'like_post_created_idx')
+
+    def test_viewer_liked_check_reads_only_the_index(self):
+        liked = Exists(Like.objects.filter(post=OuterRef('pk'), user=self.user))
+        self.assertUsesIndex(Post.objects.filter(pk=self.post.pk).annotate(liked=liked),
+                             'Index Only Scan using posts_like_post_id_user_id')
+
+    def test_timeline(self):
+        self.assertUsesIndex(TimelineEntry.objects.filter(owner=self.user)[:11], 'timeline_owner_created_idx')
+        pulled = Post.objects.filter(author__in=Follow.objects.filter(follower=self.user).values('followee'),
+                                     fanned_out=False)
+        self.assertUsesIndex(pulled[:11], 'post_pull_created_id_idx')
+
+    def test_endpoints_never_scan_a_posts_table(self):
+        urls = ['/api/posts/', f'/api/posts/?author={self.user.id}', f'/api/posts/{self.post.id}/',
+                f'/api/posts/{self.post.id}/comments/', f'/api/posts/{self.post.id}/likes/',
+                '/api/posts/timeline/']
+        for url in urls:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(url).status_code, 200)
+            for query in queries:
+                if not query['sql'].startswith(('SAVEPOINT', 'RELEASE')):
+                    self.assertNotIn('Seq Scan on posts_', self.explain(query['sql']), query['sql'])
+
+
+class ORJSONTests(APITestCase):
+    def render_both(self, data, accepted_media_type=None):
+        fast = ORJSONRenderer().render(data, accepted_media_type)
+        self.assertEqual(fast, JSONRenderer().render(data, accepted_media_type))
+        return fast
+
+    def test_renders_the_same_bytes_as_drf(self):
+        self.render_both({
+            'aware': datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+            'offset': datetime(2024, 5, 1, 12, 30, tzinfo=dt_timezone(timedelta(hours=2))),
+            'naive': datetime(2024, 5, 1, 12, 30),
+            'date': date(2024, 5, 1),
+            'time': time(8, 15, 30, 500),
+            'duration': timedelta(minutes=90),
+            'decimal': Decimal('12.50'),
+            'uuid': UUID('12345678-1234-5678-1234-567812345678'),
+            'lazy': gettext_lazy('This field is required.'),
+            'text': 'café \u2028 \u2029 \U0001f600 "quoted" \\ </script>',
+            'nested': [{'a': None, 'b': True}, (1, 2.5, -3)],
+            'huge': 2 ** 70,
+            'queryset': User.objects.none(),
+        })
+        self.assertEqual(self.render_both(None), b'')
+        self.assertIn(b'\n    ', self.render_both({'a': [1]}, 'application/json; indent=4'))
+
+    def test_api_responses_are_unchanged(self):
+        user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=user)
+        post = Post.objects.create(title='Post \u2028', content='Café', author=user)
+        Comment.objects.create(post=post, author=user, content='Comment')
+        for url in ('/api/posts/', f'/api/posts/{post.id}/?expand=comments'):
+            response = self.client.get(url)
+            self.assertEqual(response.content, JSONRenderer().render(response.data))
+
+    def test_parser(self):
+        parser = ORJSONParser()
+        self.assertEqual(parser.parse(BytesIO('{"title": "café", "n": [1, 2.5]}'.encode())),
+                         {'title': 'café', 'n': [1, 2.5]})
+        self.assertEqual(parser.parse(BytesIO(b'{"n": 1180591620717411303424}')), {'n': 2 ** 70})
+        for body in (b'', b'{"title": ', b'{"n": NaN}'):
+            with self.subTest(body=body), self.assertRaises(ParseError):
+                parser.parse(BytesIO(body))
+
+    def test_json_requests(self):
+        user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=user)
+        response = self.client.post('/api/posts/', {'title': 'Tîtle', 'content': 'Content'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['title'], 'Tîtle')
+        response = self.client.post('/api/posts/', b'{"title":', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+
+class ReadSerializerTests(APITestCase):
+    """Golden tests: the read serializers render exactly what the ModelSerializers do."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        other = User.objects.create_user(username='ôther', password='password')
+        for i in range(4):
+            post = Post.objects.create(title=f'Post {i} ✓', content='Content\n"quoted"', author=other if i % 2 else self.user)
+            for j in range(i):
+                Comment.objects.create(post=post, author=self.user if j % 2 else other, content=f'Comment {j}')
+            if i % 2:
+                Like.objects.create(post=post, user=self.user)
+            Like.objects.create(post=post, user=other)
+        self.request = APIRequestFactory().get('/')
+        self.request.user = self.user
+
+    def assertSameOutput(self, read_serializer, serializer):
+        self.assertEqual(JSONRenderer().render(read_serializer.serialize(serializer.instance)),
+                         JSONRenderer().render(serializer.data))
+
+    def test_posts(self):
+        for expand in (False, True):
+            context = {'request': self.request, 'expand_comments': expand}
+            posts = list(Post.objects.select_related('author').prefetch_related('comments').annotate(
+                viewer_has_liked=Exists(Like.objects.filter(post=OuterRef('pk'), user=self.user)),
+            ))
+            # With and without previews attached by the view
+            posts[0].recent_comments = list(posts[0].comments.all()[:1])
+            with self.subTest(expand=expand):
+                self.assertSameOutput(PostReadSerializer(context), PostSerializer(posts, many=True, context=context))
+
+    def test_posts_without_annotations(self):
+        context = {'request': self.request}
+        posts = list(Post.objects.all())
+        self.assertSameOutput(PostReadSerializer(context), PostSerializer(posts, many=True, context=context))
+
+    def test_comments_and_likes(self):
+        comments = list(Comment.objects.select_related('author'))
+        self.assertSameOutput(CommentReadSerializer(), CommentSerializer(comments, many=True))
+        self.assertSameOutput(LikeReadSerializer(), LikeSerializer(list(Like.objects.all()), many=True))
+
+    def test_datetimes_follow_the_current_timezone(self):
+        comments = list(Comment.objects.select_related('author'))
+        for zone, suffix in (('UTC', 'Z'), ('Europe/Paris', ':00')):
+            with self.subTest(zone=zone), timezone.override(zone):
+                self.assertSameOutput(CommentReadSerializer(), CommentSerializer(comments, many=True))
+                self.assertTrue(CommentReadSerializer().serialize(comments)[0]['created_at'].endswith(suffix))
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.client.force_authenticate(user=self.user)
+        for i in range(3):
+            post = Post.objects.create(title=f'Post {i}', content='Content', author=self.user)
+            for j in range(i):
+                self.client.post(f'/api/posts/{post.id}/comment/', {'content': f'Comment {j}'})
+        self.client.post(f'/api/posts/{post.id}/like/')
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.data, [query['sql'] for query in context.captured_queries]
+
+    def test_fields_select_the_rendered_fields(self):
+        full, _ = self.get('/api/posts/')
+        for query, names in (('fields=title,id', {'id', 'title'}),
+                             ('omit=content,recent_comments', set(full['results'][0]) - {'content', 'recent_comments'})):
+            with self.subTest(query=query):
+                data, _ = self.get(f'/api/posts/?{query}')
+                self.assertEqual(data['results'], [{name: item[name] for name in names} for item in full['results']])
+
+    def test_unrendered_fields_are_not_loaded(self):
+        # Only the page: no author join, like subquery, content or comment previews
+        data, queries = self.get('/api/posts/?fields=id,title&expand=comments')
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('auth_user', queries[0])
+        self.assertNotIn('posts_like', queries[0])
+        self.assertNotIn('content', queries[0])
+
+        post = Post.objects.latest('id')
+        data, queries = self.get(f'/api/posts/{post.id}/?fields=title,is_liked')
+        self.assertEqual(data, {'title': post.title, 'is_liked': True})
+        # The validator lookup and the post
+        self.assertEqual(len(queries), 2)
+
+        data, queries = self.get('/api/posts/timeline/?omit=author_username,recent_comments,content')
+        self.assertEqual(len(data['results']), 3)
+        self.assertTrue(all('auth_user' not in sql and 'content' not in sql for sql in queries))
+
+    def test_comment_fields(self):
+        post = Post.objects.latest('id')
+        data, queries = self.get(f'/api/posts/{post.id}/comments/?fields=content')
+        self.assertEqual(data['results'], [{'content': 'Comment 1'}, {'content': 'Comment 0'}])
+        self.assertNotIn('auth_user', queries[-1])
+        self.assertEqual(self.client.get(f'/api/posts/{post.id}/comments/?omit=author').status_code, 200)
+
+    def test_invalid_fieldsets(self):
+        for query in ('fields=title,secret', 'omit=secret', 'fields=', 'fields=id&omit=title'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/posts/?{query}').status_code, 400)
+
+    def test_writes_render_every_field(self):
+        response = self.client.post('/api/posts/?fields=id', {'title': 'New', 'content': 'Content'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['title'], 'New')
+
+
+class KeySetTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.jwks_file = tempfile.NamedTemporaryFile('w', suffix='.json')
+        self.addCleanup(self.jwks_file.close)
+
+    def signing_key(self):
+        key = ed25519.Ed25519PrivateKey.generate()
+        return key, public_jwk(key.public_key(), 'EdDSA')
+
+    def publish(self, *jwks):
+        self.jwks_file.seek(0)
+        self.jwks_file.truncate()
+        json.dump({'keys': list(jwks)}, self.jwks_file)
+        self.jwks_file.flush()
+
+    def sign(self, key, jwk):
+        backend = KeySetTokenBackend('EdDSA', key, kid=jwk['kid'])
+        return backend.encode({'token_type': 'access', 'user_id': self.user.id, 'jti': jwk['kid'],
+                               'exp': int((timezone.now() + timedelta(minutes=5)).timestamp())})
+
+    def test_requests_verify_with_the_published_keys(self):
+        key, jwk = self.signing_key()
+        self.publish(jwk)
+        backend = KeySetTokenBackend('EdDSA', key_set=KeySet(self.jwks_file.name))
+
+        with mock.patch.object(KeySetAccessToken, '_token_backend', backend):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.sign(key, jwk)}')
+            self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+            # Tokens shared-secret signed are refused
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+            self.assertEqual(self.client.get('/api/posts/').status_code, 403)
+
+    def test_new_keys_are_loaded_on_first_use(self):
+        old_key, old_jwk = self.signing_key()
+        new_key, new_jwk = self.signing_key()
+        self.publish(old_jwk)
+        key_set = KeySet(self.jwks_file.name, retry_interval=0)
+        key_set.reload()
+        backend = KeySetTokenBackend('EdDSA', key_set=key_set)
+
+        self.publish(new_jwk, old_jwk)
+        # The refresher thread reloads while the request waits
+        self.assertEqual(backend.decode(self.sign(new_key, new_jwk))['user_id'], self.user.id)
+        self.assertEqual(backend.decode(self.sign(old_key, old_jwk))['user_id'], self.user.id)
+        self.assertEqual(key_set.stats()['keys'], sorted([old_jwk['kid'], new_jwk['kid']]))
+        self.assertEqual(key_set.stats()['loads'], 2)
+
+    def test_failed_reloads_keep_the_keys(self):
+        key, jwk = self.signing_key()
+        self.publish(jwk)
+        key_set = KeySet(self.jwks_file.name, retry_interval=0)
+        key_set.reload()
+
+        self.jwks_file.seek(0)
+        self.jwks_file.truncate()
+        self.jwks_file.write('{')
+        self.jwks_file.flush()
+        with self.assertLogs('core.jwks', 'ERROR'):
+            self.assertFalse(key_set.reload())
+        self.assertIsNotNone(key_set.get(jwk['kid']))
+        self.assertEqual(key_set.stats()['failures'], 1)
+
+        # Unknown kids retry at most every retry_interval
+        key_set.retry_interval = 60
+        with mock.patch.object(key_set, '_ensure_refresher'), mock.patch.object(key_set, 'fetch') as fetch:
+            self.assertIsNone(key_set.get('unknown'))
+        fetch.assert_not_called()
+
+    def test_event_loop_never_waits_for_a_reload(self):
+        key, jwk = self.signing_key()
+        self.publish(jwk)
+        key_set = KeySet(self.jwks_file.name)
+
+        async def lookup():
+            return key_set.get(jwk['kid'])
+
+        with mock.patch.object(key_set, '_ensure_refresher'), mock.patch.object(key_set, 'fetch') as fetch:
+            self.assertIsNone(asyncio.run(lookup()))
+        fetch.assert_not_called()
+
+        key_set.start()
+        self.assertIsNotNone(key_set.get(jwk['kid']))
+        self.assertEqual(key_set.stats()['loads'], 1)
+
+
+class RevocationTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create_user(username='viewer', password='password')
+        self.log = []
+        self.denylist = Denylist('http://auth/revocations/')
+        self.denylist._ensure_poller = mock.Mock()
+        self.denylist.fetch = lambda after: [entry for entry in self.log if entry['id'] > after][:2]
+        patcher = mock.patch('posts.authentication.denylist', self.denylist)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def revoke(self, token):
+        self.log.append({'id': len(self.log) + 1, 'jti': token['jti'], 'exp': token['exp']})
+
+    def test_revoked_tokens_are_refused_even_when_cached(self):
+        token = AccessToken.for_user(self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+        for claims_only in (False, True):
+            with self.subTest(claims_only=claims_only), self.settings(JWT_AUTH_CLAIMS_ONLY=claims_only):
+                self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+        self.assertEqual(token_cache.stats()['size'], 1)
+
+        self.revoke(token)
+        self.assertTrue(self.denylist.sync())
+        self.assertEqual(self.client.get('/api/posts/').status_code, 403)
+
+    def test_log_is_followed_incrementally_and_pruned(self):
+        tokens = [AccessToken.for_user(self.user) for _ in range(3)]
+        tokens[0].set_exp(lifetime=-timedelta(seconds=1))
+        for token in tokens:
+            self.revoke(token)
+
+        self.denylist.sync()
+        self.assertEqual(self.denylist.stats()['cursor'], 3)
+        # Expired tokens are dropped: they are refused anyway
+        self.assertNotIn(tokens[0]['jti'], self.denylist)
+        self.assertIn(tokens[2]['jti'], self.denylist)
+
+        self.denylist.fetch = mock.Mock(side_effect=OSError('unreachable'))
+        with self.assertLogs('core.denylist', 'WARNING'):
+            self.assertFalse(self.denylist.sync())
+        self.assertEqual(len(self.denylist), 2)
+        self.assertEqual(self.denylist.stats()['failures'], 1)
+
+    def test_start_syncs_before_polling(self):
+        token = AccessToken.for_user(self.user)
+        self.revoke(token)
+        self.denylist.start()
+        self.denylist._ensure_poller.assert_called_once_with()
+        self.assertEqual(self.denylist.stats()['syncs'], 1)
+        self.assertIn(token['jti'], self.denylist)
+
+    def test_late_commits_behind_the_cursor_are_read(self):
+        early, late = AccessToken.for_user(self.user), AccessToken.for_user(self.user)
+        # Log id 2 commits before id 1
+        self.log.append({'id': 2, 'jti': late['jti'], 'exp': late['exp']})
+        self.denylist.sync()
+        self.assertEqual(self.denylist.stats()['cursor'], 2)
+
+        self.log.insert(0, {'id': 1, 'jti': early['jti'], 'exp': early['exp']})
+        self.denylist.sync()
+        self.assertIn(early['jti'], self.denylist)
+        self.assertEqual(self.denylist.stats()['cursor'], 2)
+
+
+class ThrottleTests(APITestCase):
+    def setUp(self):
+        buckets.clear()
+        token_cache.clear()
+        self.user = User.objects.create_user(username='writer', password='password')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.post = Post.objects.create(title='Post', content='Content', author=self.user)
+
+    def test_writes_are_limited_per_user(self):
+        with throttle_rates(posts_write='3/min', posts_write_ip='100/min'):
+            self.assertEqual(self.client.post(f'/api/posts/{self.post.id}/like/').status_code, 200)
+            self.assertEqual(self.client.post(f'/api/posts/{self.post.id}/comment/',
+                                              {'content': 'Hi'}).status_code, 201)
+            self.assertEqual(self.client.post('/api/posts/', {'title': 'T', 'content': 'C'}).status_code, 201)
+            response = self.client.post(f'/api/posts/{self.post.id}/unlike/')
+            self.assertEqual(response.status_code, 429)
+            self.assertEqual(response['Retry-After'], '20')
+            # Reads aren't limited
+            self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+            other = User.objects.create_user(username='other', password='password')
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(other)}')
+            self.assertEqual(self.client.post(f'/api/posts/{self.post.id}/like/').status_code, 200)
+
+    def test_writes_are_limited_per_address(self):
+        with throttle_rates(posts_write='100/min', posts_write_ip='1/min'):
+            self.assertEqual(self.client.post(f'/api/posts/{self.post.id}/like/').status_code, 200)
+            self.assertEqual(self.client.post(f'/api/posts/{self.post.id}/like/').status_code, 429)
+
+
+class LoadSheddingTests(APITestCase):
+    def shedding(self, **limits):
+        shedder = LoadShedder(**limits)
+        patcher = mock.patch('core.shedding.load_shedder', shedder)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return shedder
+
+    def test_requests_beyond_the_concurrency_limit_are_shed(self):
+        shedder = self.shedding(max_concurrency=2, retry_after=3)
+        shedder.in_flight = 2
+        response = self.client.get('/api/posts/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response['Retry-After'], '3')
+        # Health checks always get through
+        self.assertEqual(self.client.get('/health/').status_code, 200)
+
+        shedder.in_flight = 1
+        self.assertEqual(self.client.get('/api/posts/').status_code, 403)
+        self.assertEqual(shedder.stats(), {'in_flight': 1, 'latency': mock.ANY, 'served': 1, 'shed': 1})
+
+    def test_requests_queued_too_long_are_shed(self):
+        self.shedding(max_queue_time=2)
+        started = timezone.now().timestamp()
+        self.assertEqual(self.client.get('/api/posts/', HTTP_X_REQUEST_START=f't={started - 5:.3f}').status_code, 503)
+        self.assertEqual(self.client.get('/api/posts/', HTTP_X_REQUEST_START=f't={started:.3f}').status_code, 403)
+        self.assertEqual(self.client.get('/api/posts/', HTTP_X_REQUEST_START='garbage').status_code, 403)
+
+    def test_slow_requests_shed_concurrent_ones(self):
+        shedder = self.shedding(max_latency=1, smoothing=1)
+        shedder.in_flight = 2
+        shedder.release(3)
+        self.assertEqual(self.client.get('/api/posts/').status_code, 503)
+        # A request running alone still gets through, and brings the average down
+        shedder.in_flight = 0
+        self.assertEqual(self.client.get('/api/posts/').status_code, 403)
+        shedder.in_flight = 1
+        self.assertEqual(self.client.get('/api/posts/').status_code, 403)
+
+    async def test_async_requests_are_shed(self):
+        shedder = self.shedding(max_concurrency=1)
+        shedder.in_flight = 1
+        response = await self.async_client.get('/api/posts/')
+        self.assertEqual(response.status_code, 503)
@@ -0,0 +1,19 @@
+from core.throttling import IPThrottle, UserThrottle
+
+
+class WriteThrottle(UserThrottle):
+    scope = 'posts_write'
+
+
+class WriteIPThrottle(IPThrottle):
+    scope = 'posts_write_ip'
+
+
+class WriteThrottleMixin:
+    """Rate limits the viewset's ``write_actions`` per user and per client address."""
+    write_actions = ('create',)
+
+    def get_throttles(self):
+        if self.action in self.write_actions:
+            return [WriteThrottle(), WriteIPThrottle()]
+        return super().get_throttles()
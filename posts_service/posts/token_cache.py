@@ -0,0 +1,81 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class TokenCache:
+    """
+    Bounded, in-process LRU of verified access tokens.
+
+    Entries are keyed by the SHA-256 digest of the raw token and expire at the
+    token's ``exp`` claim, or after ``max_ttl`` seconds if that comes first so
+    that changes to the user eventually show up. A ``max_entries`` of 0
+    disables caching.
+    """
+
+    def __init__(self, max_entries=10000, max_ttl=300):
+        self.max_entries = max_entries
+        self.max_ttl = max_ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode('utf-8')).digest()
+
+    def get(self, token):
+        key = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, token, value, exp):
+        if self.max_entries <= 0:
+            return
+        now = time.time()
+        expires_at = min(exp, now + self.max_ttl)
+        if expires_at <= now:
+            return
+        key = self.digest(token)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, predicate):
+        # Drop every entry whose value matches, e.g. all tokens of one user
+        with self._lock:
+            stale = [key for key, (_, value) in self._entries.items() if predicate(value)]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+            }
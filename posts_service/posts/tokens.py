@@ -0,0 +1,24 @@
+from django.conf import settings
+from rest_framework_simplejwt import tokens
+
+from core.denylist import Denylist
+from core.jwks import KeySet, KeySetTokenBackend
+
+# The auth service's published keys, when tokens are signed asymmetrically
+key_set = KeySet(
+    settings.JWT_JWKS_URL,
+    refresh_interval=settings.JWT_JWKS_REFRESH_INTERVAL,
+    retry_interval=settings.JWT_JWKS_RETRY_INTERVAL,
+) if settings.JWT_JWKS_URL else None
+
+token_backend = KeySetTokenBackend(settings.JWT_ALGORITHM, settings.JWT_SECRET_KEY, key_set=key_set)
+
+# Ids of revoked tokens, from the auth service's revocation log
+denylist = Denylist(
+    settings.JWT_REVOCATION_URL,
+    poll_interval=settings.JWT_REVOCATION_POLL_INTERVAL,
+) if settings.JWT_REVOCATION_URL else None
+
+
+class AccessToken(tokens.AccessToken):
+    _token_backend = token_backend
@@ -1,9 +1,14 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework_nested import routers
 from . import views
 
 router = routers.DefaultRouter()
-router.register(r'posts', views.PostViewSet, basename='post')
+if settings.POSTS_ASYNC_VIEWS:
+    router.register(r'posts', views.AsyncPostViewSet, basename='post')
+else:
+    router.register(r'posts', views.PostViewSet, basename='post')
+router.register(r'follows', views.FollowViewSet, basename='follow')
 
 # Create a nested router for comments
 posts_router = routers.NestedDefaultRouter(router, r'posts', lookup='post')
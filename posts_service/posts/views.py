@@ -1,16 +1,50 @@
-from rest_framework import viewsets, permissions, status
+from rest_framework import mixins, viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
-from .models import Post, Comment, Like
-from .serializers import PostSerializer, CommentSerializer, LikeSerializer
-from .authentication import JWTAuthentication
-from django.db import IntegrityError
+from rest_framework.exceptions import ValidationError
+from .models import Post, Comment, Like, Follow, TimelineEntry
+from .serializers import (
+    PostSerializer, CommentSerializer, FollowSerializer,
+    PostReadSerializer, CommentReadSerializer, LikeReadSerializer, sparse_fieldset,
+)
+from .authentication import JWTAuthentication, require_existing_user
+from .asyncviews import AsyncViewSetMixin
+from .like_buffer import like_buffer
+from .pagination import SearchPagination, TimelinePagination
+from .throttling import WriteThrottleMixin
+from .conditional import (
+    aconditional_view, conditional_view, not_modified, apply_cache_policy, page_etag,
+    post_etag, post_comments, apost_comments, comments_page_etag,
+)
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Prefetch, Q, prefetch_related_objects
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 
-class PostViewSet(viewsets.ModelViewSet):
+def comments_queryset(request, comments):
+    # Only what the comments' ?fields= or ?omit= renders, plus the keyset
+    # position and the ETag validator
+    fields = sparse_fieldset(request, CommentSerializer)
+    if fields is None or 'author_username' in fields:
+        comments = comments.select_related('author')
+    if fields is not None:
+        comments = comments.only('id', 'created_at', 'updated_at', *CommentSerializer.sparse_columns(fields))
+    return comments
+
+class PostViewSet(WriteThrottleMixin, viewsets.ModelViewSet):
     serializer_class = PostSerializer
+    # Renders pages of posts with the same output as PostSerializer, faster
+    read_serializer_class = PostReadSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
+    write_actions = ('create', 'like', 'unlike', 'comment')
+    # Actions whose response is rendered with PostSerializer
+    serialized_actions = ('list', 'retrieve', 'update', 'partial_update')
+    # Columns loaded even when ?fields= leaves them out: the keyset position,
+    # the ETag validators and the like count the viewer's pending likes adjust
+    required_columns = ('id', 'created_at', 'updated_at', 'last_activity_at', 'like_count')
 
     def get_queryset(self):
         # Users can see all posts but can only modify their own
@@ -20,99 +54,444 @@ class PostViewSet(viewsets.ModelViewSet):
         author = self.request.query_params.get('author')
         if author:
             queryset = queryset.filter(author=author)
+
+        if self.action in self.serialized_actions:
+            queryset = self.annotate_for_serializer(queryset)
             
         return queryset
 
+    def viewer_has_liked(self, post_ref='pk'):
+        return Exists(Like.objects.filter(post=OuterRef(post_ref), user=self.request.user.id))
+
+    def expand_comments(self):
+        return 'comments' in self.request.query_params.get('expand', '').split(',')
+
+    def requested_fields(self):
+        return sparse_fieldset(self.request, PostSerializer)
+
+    def renders(self, name):
+        fields = self.requested_fields()
+        return fields is None or name in fields
+
+    def embeds_comments(self):
+        return self.expand_comments() and self.renders('comments')
+
+    def shows_likes(self):
+        # like_count is adjusted for the viewer's pending likes through viewer_has_liked
+        return self.renders('is_liked') or self.renders('like_count')
+
+    def annotate_for_serializer(self, queryset):
+        # Load everything PostSerializer needs up front so a page of posts costs
+        # a fixed number of queries regardless of comments and likes, without
+        # the search lexemes, which can be larger than the post itself. With
+        # ?fields= or ?omit=, what won't be rendered isn't loaded either.
+        queryset = queryset.defer('search_vector')
+        if self.renders('author_username'):
+            queryset = queryset.select_related('author')
+        if self.shows_likes():
+            queryset = queryset.annotate(viewer_has_liked=self.viewer_has_liked())
+        if self.embeds_comments():
+            queryset = queryset.prefetch_related(self.comments_prefetch())
+        return self.only_rendered(queryset)
+
+    def only_rendered(self, queryset, prefix='', *columns):
+        fields = self.requested_fields()
+        if fields is None:
+            return queryset
+        columns += tuple(prefix + column for column in self.required_columns + PostSerializer.sparse_columns(fields))
+        return queryset.only(*columns)
+
+    def comments_prefetch(self):
+        return Prefetch('comments', queryset=Comment.objects.select_related('author'))
+
+    def recent_comments_queryset(self, posts):
+        size = settings.POSTS_COMMENT_PREVIEW_SIZE
+        return Comment.objects.latest_per_post([post.pk for post in posts], size).select_related('author')
+
+    def attach_recent_comments(self, posts, recent=None):
+        if not self.renders('recent_comments'):
+            return
+        if self.embeds_comments():
+            # Already prefetched in full
+            for post in posts:
+                post.recent_comments = post.comments.all()[:settings.POSTS_COMMENT_PREVIEW_SIZE]
+            return
+
+        previews = {post.pk: [] for post in posts}
+        if recent is None:
+            recent = self.recent_comments_queryset(posts) if posts else []
+        for comment in recent:
+            previews[comment.post_id].append(comment)
+        for post in posts:
+            post.recent_comments = previews[post.pk]
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['expand_comments'] = self.expand_comments()
+        context['fields'] = self.requested_fields()
+        return context
+
+    def get_read_serializer(self):
+        return self.read_serializer_class(self.get_serializer_context())
+
+    def apply_pending_likes(self, posts):
+        if not self.shows_likes():
+            return
+        # Read-your-writes: show the viewer's buffered likes before they are flushed
+        for post in posts:
+            liked = like_buffer.pending(post.pk, self.request.user.id)
+            if liked is not None and liked != post.viewer_has_liked:
+                post.viewer_has_liked = liked
+                post.like_count = max(post.like_count + (1 if liked else -1), 0)
+
+    def get_object(self):
+        obj = super().get_object()
+        if self.action == 'retrieve':
+            # The previews were loaded for the ETag
+            self.attach_recent_comments([obj], post_comments(self.request, obj.pk))
+            self.apply_pending_likes([obj])
+        return obj
+
+    def list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        self.attach_recent_comments(page)
+
+        # The page rows and previews are enough to validate the response, so
+        # a matching If-None-Match skips serialization entirely
+        etag = page_etag(request, page)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        return self.page_response(page, etag)
+
+    def page_response(self, page, etag):
+        self.apply_pending_likes(page)
+        response = self.get_paginated_response(self.get_read_serializer().serialize(page))
+        response['ETag'] = etag
+        return apply_cache_policy(response)
+
+    @conditional_view(etag_func=post_etag)
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        # Fan-out-on-write, except for authors with too many followers
+        followers = Follow.objects.fan_out_targets(self.request.user.id, settings.POSTS_TIMELINE_FANOUT_LIMIT)
+        with require_existing_user(self.request.user), transaction.atomic():
+            post = serializer.save(author_id=self.request.user.id, fanned_out=followers is not None)
+            if followers is not None:
+                TimelineEntry.objects.fan_out(post, followers)
+
+    @action(detail=False, methods=['get'], pagination_class=TimelinePagination)
+    def timeline(self, request):
+        page = self.timeline_posts(self.paginator.paginate_sources(self.timeline_sources(), request, view=self))
+
+        if self.embeds_comments():
+            prefetch_related_objects(page, self.comments_prefetch())
+        self.attach_recent_comments(page)
+
+        etag = page_etag(request, page)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        return self.page_response(page, etag)
+
+    @action(detail=False, methods=['get'], pagination_class=SearchPagination)
+    def search(self, request):
+        page = self.paginate_queryset(self.search_queryset())
+        self.attach_recent_comments(page)
+
+        etag = page_etag(request, page)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        return self.page_response(page, etag)
+
+    def search_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': 'This query parameter is required.'})
+        queryset = Post.objects.search(
+            query, settings.POSTS_SEARCH_SHORT_QUERY_LENGTH, settings.POSTS_SEARCH_MAX_CANDIDATES,
+        )
+        return self.annotate_for_serializer(queryset)
+
+    def timeline_sources(self):
+        # The viewer's materialized timeline, plus the posts of followed
+        # authors (and their own) that weren't fanned out
+        user_id = self.request.user.id
+        entries = TimelineEntry.objects.filter(owner=user_id).select_related(
+            'post__author' if self.renders('author_username') else 'post',
+        ).defer('post__search_vector')
+        entries = self.only_rendered(entries, 'post__', 'created_at', 'post')
+        followed = Follow.objects.filter(follower=user_id).values('followee')
+        pulled = Post.objects.filter(Q(author__in=followed) | Q(author=user_id), fanned_out=False)
+        if self.renders('author_username'):
+            pulled = pulled.select_related('author')
+        pulled = self.only_rendered(pulled.defer('search_vector').annotate(post_id=F('id')))
+        if self.shows_likes():
+            entries = entries.annotate(viewer_has_liked=self.viewer_has_liked('post_id'))
+            pulled = pulled.annotate(viewer_has_liked=self.viewer_has_liked())
+        return entries, pulled
+
+    def timeline_posts(self, rows):
+        posts = []
+        for row in rows:
+            if isinstance(row, TimelineEntry):
+                if self.shows_likes():
+                    row.post.viewer_has_liked = row.viewer_has_liked
+                row = row.post
+            posts.append(row)
+        return posts
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
-        if instance.author != request.user:
+        if instance.author_id != request.user.id:
             return Response({"detail": "You can only modify your own posts"}, status=403)
         return super().update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        if instance.author != request.user:
+        if instance.author_id != request.user.id:
             return Response({"detail": "You can only delete your own posts"}, status=403)
         return super().destroy(request, *args, **kwargs)
 
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
-        post = self.get_object()
-        user = request.user
-        
-        try:
-            # Try to create a like
-            like = Like.objects.create(user=user, post=post)
-            serializer = LikeSerializer(like)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        except IntegrityError:
-            # User already liked the post
-            return Response(
-                {"detail": "You have already liked this post"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        if settings.POSTS_LIKE_BUFFER:
+            return self.buffered_like_response(self.liked_post(self.post_id()).first(), liked=True)
+        # Idempotent: liking twice leaves one like and reports the same state
+        return self.like_response(self.add_like(), liked=True)
 
     @action(detail=True, methods=['post'])
     def unlike(self, request, pk=None):
-        post = self.get_object()
-        user = request.user
-        
+        if settings.POSTS_LIKE_BUFFER:
+            return self.buffered_like_response(self.liked_post(self.post_id()).first(), liked=False)
+        return self.like_response(Like.objects.unlike(self.post_id(), request.user.id), liked=False)
+
+    def add_like(self):
+        with require_existing_user(self.request.user):
+            return Like.objects.like(self.post_id(), self.request.user.id)
+
+    def liked_post(self, post_id):
+        # The write is deferred; this read only validates the post and reports its state
+        return Post.objects.filter(pk=post_id).annotate(viewer_has_liked=self.viewer_has_liked())
+
+    def buffered_like_response(self, post, liked):
+        if post is None:
+            raise Http404
+        like_buffer.record(post.pk, self.request.user.id, liked)
+        self.apply_pending_likes([post])
+        return Response({'liked': liked, 'like_count': post.like_count}, status=status.HTTP_202_ACCEPTED)
+
+    def post_id(self):
         try:
-            like = Like.objects.get(user=user, post=post)
-            like.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        except Like.DoesNotExist:
-            return Response(
-                {"detail": "You haven't liked this post"}, 
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            return int(self.kwargs['pk'])
+        except ValueError:
+            raise Http404
+
+    def like_response(self, result, liked):
+        if result is None:
+            raise Http404
+        _, like_count = result
+        return Response({'liked': liked, 'like_count': like_count})
 
     @action(detail=True, methods=['get'])
     def likes(self, request, pk=None):
         post = self.get_object()
-        likes = post.likes.all()
-        serializer = LikeSerializer(likes, many=True)
-        return Response(serializer.data)
+        return Response(LikeReadSerializer().serialize(post.likes.all()))
 
     @action(detail=True, methods=['post'])
     def comment(self, request, pk=None):
         post = self.get_object()
         serializer = CommentSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save(author=request.user, post=post)
+            with require_existing_user(request.user), transaction.atomic():
+                serializer.save(author_id=request.user.id, post=post)
+                Post.adjust_counter(post.pk, 'comment_count', 1)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['get'])
     def comments(self, request, pk=None):
         post = self.get_object()
-        comments = post.comments.all()
-        serializer = CommentSerializer(comments, many=True)
+        comments = comments_queryset(self.request, post.comments.all())
+        page = self.paginate_queryset(comments)
+        if page is not None:
+            return self.comments_response(page, paginated=True)
+        return self.comments_response(list(comments), paginated=False)
+
+    def comments_response(self, comments, paginated):
+        # Validated like the pages of posts, from the fetched comments and their authors
+        etag = comments_page_etag(self.request, comments)
+        response = not_modified(self.request, etag)
+        if response is not None:
+            return response
+
+        serializer = CommentReadSerializer({'fields': sparse_fieldset(self.request, CommentSerializer)})
+        data = serializer.serialize(comments)
+        response = self.get_paginated_response(data) if paginated else Response(data)
+        response['ETag'] = etag
+        return apply_cache_policy(response)
+
+class AsyncPostViewSet(AsyncViewSetMixin, PostViewSet):
+    """
+    PostViewSet with the read-heavy endpoints and like/unlike written as
+    coroutines, routed instead of PostViewSet when the service runs under ASGI
+    (POSTS_ASYNC_VIEWS). The remaining actions are inherited unchanged and
+    run in a thread.
+    """
+
+    async def aattach_recent_comments(self, posts):
+        recent = None
+        if posts and self.renders('recent_comments') and not self.embeds_comments():
+            recent = [comment async for comment in self.recent_comments_queryset(posts)]
+        self.attach_recent_comments(posts, recent)
+
+    async def list(self, request, *args, **kwargs):
+        page = await self.apaginate_queryset(self.filter_queryset(self.get_queryset()))
+        await self.aattach_recent_comments(page)
+
+        etag = page_etag(request, page)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        return self.page_response(page, etag)
+
+    @aconditional_view(etag_func=post_etag)
+    async def retrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        self.attach_recent_comments([instance], await apost_comments(request, instance.pk))
+        self.apply_pending_likes([instance])
+        serializer = self.get_serializer(instance)
         return Response(serializer.data)
 
-class CommentViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['get'], pagination_class=TimelinePagination)
+    async def timeline(self, request):
+        rows = await self.paginator.apaginate_sources(self.timeline_sources(), request, view=self)
+        page = self.timeline_posts(rows)
+
+        if self.embeds_comments():
+            await sync_to_async(prefetch_related_objects)(page, self.comments_prefetch())
+        await self.aattach_recent_comments(page)
+
+        etag = page_etag(request, page)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        return self.page_response(page, etag)
+
+    @action(detail=False, methods=['get'], pagination_class=SearchPagination)
+    async def search(self, request):
+        page = await self.apaginate_queryset(self.search_queryset())
+        await self.aattach_recent_comments(page)
+
+        etag = page_etag(request, page)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        return self.page_response(page, etag)
+
+    # Django has no async cursor for raw SQL, so the statement runs in a thread
+    @action(detail=True, methods=['post'])
+    async def like(self, request, pk=None):
+        if settings.POSTS_LIKE_BUFFER:
+            return self.buffered_like_response(await self.liked_post(self.post_id()).afirst(), liked=True)
+        return self.like_response(await sync_to_async(self.add_like)(), liked=True)
+
+    @action(detail=True, methods=['post'])
+    async def unlike(self, request, pk=None):
+        if settings.POSTS_LIKE_BUFFER:
+            return self.buffered_like_response(await self.liked_post(self.post_id()).afirst(), liked=False)
+        result = await sync_to_async(Like.objects.unlike)(self.post_id(), request.user.id)
+        return self.like_response(result, liked=False)
+
+    @action(detail=True, methods=['get'])
+    async def likes(self, request, pk=None):
+        post = await self.aget_object()
+        likes = [like async for like in post.likes.all()]
+        return Response(LikeReadSerializer().serialize(likes))
+
+    @action(detail=True, methods=['get'])
+    async def comments(self, request, pk=None):
+        post = await self.aget_object()
+        comments = comments_queryset(self.request, post.comments.all())
+        page = await self.apaginate_queryset(comments)
+        if page is not None:
+            return self.comments_response(page, paginated=True)
+        return self.comments_response([comment async for comment in comments], paginated=False)
+
+class FollowViewSet(mixins.ListModelMixin, mixins.CreateModelMixin, mixins.DestroyModelMixin,
+                    viewsets.GenericViewSet):
+    """The authors the current user follows, addressed by the followee's id."""
+    serializer_class = FollowSerializer
+    authentication_classes = [JWTAuthentication]
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_field = 'followee'
+
+    def get_queryset(self):
+        return Follow.objects.filter(follower=self.request.user.id).select_related('followee')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        followee = serializer.validated_data['followee']
+        # Idempotent: following twice keeps one follow
+        with require_existing_user(request.user), transaction.atomic():
+            follow, created = Follow.objects.get_or_create(follower_id=request.user.id, followee=followee)
+            if created:
+                TimelineEntry.objects.backfill(request.user.id, followee.id, settings.POSTS_TIMELINE_BACKFILL)
+        return Response(self.get_serializer(follow).data,
+                        status=status.HTTP_201_CREATED if created else status.HTTP_200_OK)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            TimelineEntry.objects.filter(owner=instance.follower_id, author=instance.followee_id).delete()
+
+class CommentViewSet(WriteThrottleMixin, viewsets.ModelViewSet):
     serializer_class = CommentSerializer
     authentication_classes = [JWTAuthentication]
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Comment.objects.filter(post_id=self.kwargs['post_pk'])
+        return comments_queryset(self.request, Comment.objects.filter(post_id=self.kwargs['post_pk']))
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = sparse_fieldset(self.request, CommentSerializer)
+        return context
 
     def perform_create(self, serializer):
         post = Post.objects.get(pk=self.kwargs['post_pk'])
-        serializer.save(author=self.request.user, post=post)
+        with require_existing_user(self.request.user), transaction.atomic():
+            serializer.save(author_id=self.request.user.id, post=post)
+            Post.adjust_counter(post.pk, 'comment_count', 1)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            comment = serializer.save()
+            Post.touch(comment.post_id)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            instance.delete()
+            Post.adjust_counter(instance.post_id, 'comment_count', -1)
 
     def update(self, request, *args, **kwargs):
         instance = self.get_object()
-        if instance.author != request.user:
+        if instance.author_id != request.user.id:
             return Response({"detail": "You can only modify your own comments"}, status=403)
         return super().update(request, *args, **kwargs)
 
     def destroy(self, request, *args, **kwargs):
         instance = self.get_object()
-        if instance.author != request.user:
+        if instance.author_id != request.user.id:
             return Response({"detail": "You can only delete your own comments"}, status=403)
         return super().destroy(request, *args, **kwargs) 
\ No newline at end of file
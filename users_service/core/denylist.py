@@ -0,0 +1,135 @@
+import heapq
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+class Denylist:
+    """
+    Ids (jti) of revoked tokens, each kept until the token expires.
+
+    ``jti in denylist`` is a single dict lookup. Revocations are followed
+    from the auth service's revocation log at ``source``: a background
+    thread fetches the entries logged since the last one it saw every
+    ``poll_interval`` seconds, so a revocation reaches every process within
+    about that long. Entries are dropped once their token has expired and
+    would be rejected anyway, so the set only grows with the tokens revoked
+    within one token lifetime. A failed fetch keeps the entries already
+    known and is retried at the next poll.
+
+    Log ids are assigned before the revocation commits, so an entry can
+    become visible behind the cursor. Each sync therefore reads again from
+    the cursor it had ``replay_window`` seconds earlier.
+    """
+
+    def __init__(self, source=None, poll_interval=2, timeout=5, replay_window=30):
+        self.source = source
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.replay_window = replay_window
+        self._expiries = {}
+        # (exp, jti) pairs, soonest expiry first
+        self._heap = []
+        self._cursor = 0
+        # (monotonic time, cursor) at each sync within the replay window, oldest first
+        self._cursors = deque()
+        self._synced_at = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self.syncs = 0
+        self.failures = 0
+        # A forked worker doesn't inherit the parent's thread. Reset it on
+        # fork rather than comparing pids, which would cost a system call
+        # per check.
+        os.register_at_fork(after_in_child=self._forget_poller)
+
+    def __contains__(self, jti):
+        if self._thread is None:
+            self._ensure_poller()
+        return jti in self._expiries
+
+    def __len__(self):
+        return len(self._expiries)
+
+    def add(self, jti, exp):
+        with self._lock:
+            if jti not in self._expiries:
+                self._expiries[jti] = exp
+                heapq.heappush(self._heap, (exp, jti))
+
+    def prune(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                _, jti = heapq.heappop(self._heap)
+                del self._expiries[jti]
+
+    def start(self):
+        """Sync once, so revocations are known from the first request on, and keep polling."""
+        if not self.syncs and not self.failures:
+            self.sync()
+        self._ensure_poller()
+
+    def sync(self):
+        """Add the revocations logged since the last sync."""
+        now = time.monotonic()
+        self._cursors.append((now, self._cursor))
+        while len(self._cursors) > 1 and self._cursors[1][0] <= now - self.replay_window:
+            self._cursors.popleft()
+        after = self._cursors[0][1]
+        try:
+            while True:
+                entries = self.fetch(after)
+                if not entries:
+                    break
+                for entry in entries:
+                    self.add(entry['jti'], entry['exp'])
+                after = entries[-1]['id']
+                self._cursor = max(self._cursor, after)
+        except Exception as ex:
+            self.failures += 1
+            logger.warning('Syncing revocations from %s failed: %s', self.source, ex)
+            return False
+        finally:
+            self.prune()
+        self._synced_at = time.monotonic()
+        self.syncs += 1
+        return True
+
+    def fetch(self, after):
+        """The log entries after ``after``, oldest first: [{'id', 'jti', 'exp'}]."""
+        response = requests.get(self.source, params={'after': after}, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['revocations']
+
+    def stats(self):
+        return {
+            'source': self.source,
+            'revoked': len(self._expiries),
+            'cursor': self._cursor,
+            'syncs': self.syncs,
+            'failures': self.failures,
+            'age': None if self._synced_at is None else time.monotonic() - self._synced_at,
+        }
+
+    def _ensure_poller(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='revocation-sync', daemon=True)
+            self._thread.start()
+
+    def _forget_poller(self):
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run(self):
+        while True:
+            self.sync()
+            time.sleep(self.poll_interval)
@@ -0,0 +1,32 @@
+from django.db import DatabaseError, connection
+from django.http import JsonResponse
+
+from users.tokens import denylist, key_set
+
+from .pgpool import pool_stats
+
+
+def database_status():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        connected = True
+    except DatabaseError:
+        connected = False
+    return {
+        'connected': connected,
+        'vendor': connection.vendor,
+        'conn_max_age': connection.settings_dict['CONN_MAX_AGE'],
+        'pool': pool_stats().get(connection.alias),
+    }
+
+
+def health_check(request):
+    database = database_status()
+    return JsonResponse({
+        'status': 'healthy' if database['connected'] else 'unhealthy',
+        'service': 'users_service',
+        'database': database,
+        'jwks': key_set.stats() if key_set else None,
+        'revocations': denylist.stats() if denylist else None,
+    }, status=200 if database['connected'] else 503)
@@ -0,0 +1,31 @@
+import io
+
+import orjson
+from django.conf import settings
+from rest_framework.parsers import JSONParser
+
+from .renderers import ORJSONRenderer
+
+
+class ORJSONParser(JSONParser):
+    """
+    JSONParser that decodes UTF-8 bodies with orjson.
+
+    Bodies orjson rejects are handed to the stdlib parser, which has the
+    final say. Invalid JSON still gets DRF's usual ParseError, and the few
+    documents only the stdlib accepts (e.g. integers beyond 64 bits) are
+    still parsed.
+    """
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if not self.strict or encoding.lower() not in ('utf-8', 'utf8'):
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        try:
+            return orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return super().parse(io.BytesIO(body), media_type, parser_context)
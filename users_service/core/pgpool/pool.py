@@ -0,0 +1,183 @@
+import os
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Bounded pool of raw DB-API connections for one process.
+
+    Up to ``size`` idle connections are kept for reuse, and ``overflow`` more
+    may be opened under load. Those extra connections are closed as soon as
+    they're returned. When all ``size + overflow`` are checked out, callers
+    wait up to ``timeout`` seconds and then get PoolTimeout. Connections older
+    than ``recycle`` seconds are replaced. Connections that sat idle for more
+    than ``ping_after`` seconds are checked with a ``SELECT 1`` before being
+    handed out.
+    """
+
+    def __init__(self, size=5, overflow=0, timeout=10, recycle=300, ping_after=30):
+        self.size = size
+        self.overflow = overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        # (connection, created_at, returned_at), most recently returned last
+        self._idle = deque()
+        self._created_at = {}
+        self._checked_out = 0
+        self._cond = threading.Condition()
+        self.created = 0
+        self.reused = 0
+        self.discarded = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    @property
+    def max_connections(self):
+        return self.size + self.overflow
+
+    def checkout(self, connect):
+        """Return an open connection, calling ``connect()`` if none is idle."""
+        deadline = None
+        while True:
+            with self._cond:
+                while True:
+                    # An idle connection or a free slot is reserved before the lock is released
+                    if self._idle:
+                        idle = self._idle.pop()
+                        self._checked_out += 1
+                        break
+                    if self._checked_out < self.max_connections:
+                        self._checked_out += 1
+                        idle = None
+                        break
+                    if deadline is None:
+                        self.waits += 1
+                        deadline = time.monotonic() + self.timeout
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        raise PoolTimeout(
+                            f'No database connection available within {self.timeout}s '
+                            f'({self.max_connections} in use)'
+                        )
+                    self._cond.wait(remaining)
+            if idle is None:
+                break
+            # Ping outside the lock, so a slow or unreachable server doesn't
+            # hold up every other checkout and checkin
+            connection = idle[0]
+            usable = self._usable(*idle)
+            with self._cond:
+                if usable:
+                    self.reused += 1
+                    return connection
+                self._checked_out -= 1
+                self._discard(connection)
+                self._cond.notify()
+
+        # Open the new connection outside the lock so other threads can
+        # check out and return idle ones meanwhile
+        try:
+            connection = connect()
+        except BaseException:
+            with self._cond:
+                self._checked_out -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created_at[id(connection)] = time.monotonic()
+            self.created += 1
+        return connection
+
+    def checkin(self, connection, reusable=True):
+        with self._cond:
+            self._checked_out -= 1
+            created_at = self._created_at.get(id(connection), time.monotonic())
+            if reusable and len(self._idle) < self.size and not self._expired(created_at):
+                self._idle.append((connection, created_at, time.monotonic()))
+            else:
+                self._discard(connection)
+            self._cond.notify()
+
+    def close_idle(self):
+        with self._cond:
+            while self._idle:
+                self._discard(self._idle.pop()[0])
+
+    def stats(self):
+        with self._cond:
+            return {
+                'size': self.size,
+                'overflow': self.overflow,
+                'checked_out': self._checked_out,
+                'idle': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+                'discarded': self.discarded,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+            }
+
+    def _expired(self, created_at):
+        return self.recycle is not None and time.monotonic() - created_at > self.recycle
+
+    def _usable(self, connection, created_at, returned_at):
+        if connection.closed or self._expired(created_at):
+            return False
+        if time.monotonic() - returned_at < self.ping_after:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            connection.rollback()
+        except Exception:
+            return False
+        return True
+
+    def _discard(self, connection):
+        self._created_at.pop(id(connection), None)
+        self.discarded += 1
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+_pools_pid = None
+
+
+def get_pool(key, options):
+    """Return this process's pool for a database (alias and connection parameters)."""
+    global _pools_pid
+    with _pools_lock:
+        # Connections must never be shared across a fork (e.g. preloaded gunicorn workers)
+        if _pools_pid != os.getpid():
+            _pools.clear()
+            _pools_pid = os.getpid()
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(**options)
+        return pool
+
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values()) if _pools_pid == os.getpid() else []
+    for pool in pools:
+        pool.close_idle()
+
+
+def pool_stats():
+    """Stats of this process's pools by database alias."""
+    with _pools_lock:
+        pools = dict(_pools) if _pools_pid == os.getpid() else {}
+    return {alias: pool.stats() for (alias, _), pool in pools.items()}
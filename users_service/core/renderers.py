@@ -0,0 +1,31 @@
+import orjson
+from rest_framework.renderers import JSONRenderer
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that produces the same bytes several times faster with orjson.
+
+    Only DRF's default compact, UTF-8 output takes the fast path. Indented
+    output, as used by the browsable API or requested with ``; indent=``,
+    goes through the stdlib renderer. So does anything orjson refuses, such
+    as integers beyond 64 bits. Types orjson doesn't handle natively, like
+    Decimal, timedelta and lazy translation strings, are converted by DRF's
+    own encoder.
+    """
+    # DRF writes UTC datetimes with a Z suffix instead of +00:00
+    options = orjson.OPT_UTC_Z
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if self.ensure_ascii or not self.compact or indent is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping of U+2028 and U+2029 as JSONRenderer
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
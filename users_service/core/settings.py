@@ -103,9 +103,37 @@ DATABASES = {
         'PASSWORD': os.environ.get('SQL_PASSWORD', 'postgres'),
         'HOST': os.environ.get('SQL_HOST', 'db'),
         'PORT': os.environ.get('SQL_PORT', '5432'),
+        # Keep connections open across requests instead of reconnecting every
+        # time, and check a reused connection is still alive before using it
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.environ.get('DATABASE_CONN_HEALTH_CHECKS', 'True').lower() in ('1', 'true'),
     }
 }
 
+# Under ASGI each request's ORM calls run on a thread of their own, so
+# persistent connections would pile up one per thread instead of being
+# reused; there connections are only reused through the pool below
+if os.environ.get('DJANGO_ASGI', 'False').lower() in ('1', 'true'):
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+# Optional per-process connection pool for PostgreSQL (see core/pgpool). Each
+# gunicorn worker holds at most DATABASE_POOL_SIZE + DATABASE_POOL_OVERFLOW
+# connections, so the service needs HPA maxReplicas x GUNICORN_WORKERS x that
+# many slots of the server's max_connections.
+if (os.environ.get('DATABASE_POOL', 'False').lower() in ('1', 'true')
+        and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql'):
+    DATABASES['default'].update({
+        'ENGINE': 'core.pgpool',
+        # Django hands the connection back to the pool at the end of each request
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'size': int(os.environ.get('DATABASE_POOL_SIZE', 4)),
+            'overflow': int(os.environ.get('DATABASE_POOL_OVERFLOW', 0)),
+            'timeout': float(os.environ.get('DATABASE_POOL_TIMEOUT', 10)),
+            'recycle': int(os.environ.get('DATABASE_POOL_RECYCLE', 300)),
+        },
+    })
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -157,6 +185,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # Same JSON as DRF's renderer and parser, encoded and decoded with orjson
+    'DEFAULT_RENDERER_CLASSES': [
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 # JWT settings
@@ -168,8 +206,34 @@ SIMPLE_JWT = {
     'SIGNING_KEY': JWT_SECRET_KEY,
     'VERIFYING_KEY': None,
     'AUTH_HEADER_TYPES': ('Bearer',),
+    # Verified with the keys below (users/tokens.py)
+    'AUTH_TOKEN_CLASSES': ('users.tokens.AccessToken',),
 }
 
+# Token verification. HS256 checks tokens with the shared JWT_SECRET_KEY.
+# RS256 and EdDSA check them with the auth service's public keys, read from
+# the JWKS document at JWT_JWKS_URL (a URL or a file path) and refreshed every
+# JWT_JWKS_REFRESH_INTERVAL seconds; a token signed by a key not seen yet
+# reloads it, at most every JWT_JWKS_RETRY_INTERVAL seconds.
+JWT_ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+JWT_JWKS_URL = os.environ.get('JWT_JWKS_URL')
+JWT_JWKS_REFRESH_INTERVAL = int(os.environ.get('JWT_JWKS_REFRESH_INTERVAL', 300))
+JWT_JWKS_RETRY_INTERVAL = int(os.environ.get('JWT_JWKS_RETRY_INTERVAL', 30))
+if JWT_ALGORITHM != 'HS256' and not JWT_JWKS_URL:
+    raise Exception(f"JWT_JWKS_URL is required to verify tokens signed with {JWT_ALGORITHM}")
+
+# Token revocation. The ids of revoked tokens are followed from the auth
+# service's revocation log at JWT_REVOCATION_URL, reloaded every
+# JWT_REVOCATION_POLL_INTERVAL seconds, and refused until they expire.
+# Unset, revoked tokens stay valid here until they expire.
+JWT_REVOCATION_URL = os.environ.get('JWT_REVOCATION_URL')
+JWT_REVOCATION_POLL_INTERVAL = float(os.environ.get('JWT_REVOCATION_POLL_INTERVAL', 2))
+
+# In-process cache of verified access tokens (0 entries disables it).
+# Entries live until the token's exp, capped at JWT_AUTH_CACHE_TTL seconds.
+JWT_AUTH_CACHE_SIZE = int(os.environ.get('JWT_AUTH_CACHE_SIZE', 10000))
+JWT_AUTH_CACHE_TTL = int(os.environ.get('JWT_AUTH_CACHE_TTL', 300))
+
 # CORS settings - only needed for internal services and gateway
 CORS_ALLOWED_ORIGINS = [
     "http://ingress-nginx-controller.ingress-nginx.svc.cluster.local",
@@ -191,6 +255,29 @@ CORS_ALLOW_HEADERS = [
     'X-Requested-With',
 ]
 
+# Batch user lookup: maximum ids per request and how long clients may cache GET responses
+USERS_BATCH_MAX_IDS = int(os.environ.get('USERS_BATCH_MAX_IDS', 500))
+USERS_BATCH_CACHE_SECONDS = int(os.environ.get('USERS_BATCH_CACHE_SECONDS', 60))
+
+# Profile cache: an in-process LRU in front of an optional shared cache.
+# Set PROFILE_CACHE_SHARED_ALIAS=profiles and point PROFILE_CACHE_BACKEND/LOCATION
+# at a shared store (e.g. django.core.cache.backends.redis.RedisCache) to share
+# entries between pods. Local entries are short-lived because invalidations
+# only reach the local tier of the pod that handled the write.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'profiles': {
+        'BACKEND': os.environ.get('PROFILE_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('PROFILE_CACHE_LOCATION', 'profiles'),
+    },
+}
+PROFILE_CACHE_LOCAL_SIZE = int(os.environ.get('PROFILE_CACHE_LOCAL_SIZE', 10000))
+PROFILE_CACHE_LOCAL_TTL = int(os.environ.get('PROFILE_CACHE_LOCAL_TTL', 30))
+PROFILE_CACHE_SHARED_ALIAS = os.environ.get('PROFILE_CACHE_SHARED_ALIAS') or None
+PROFILE_CACHE_SHARED_TTL = int(os.environ.get('PROFILE_CACHE_SHARED_TTL', 300))
+
 # Authentication service URL
 AUTH_SERVICE_URL = os.environ.get('AUTH_SERVICE_URL', 'http://auth_service:8000')
 
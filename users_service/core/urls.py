@@ -17,7 +17,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from . import health
+
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('health/', health.health_check, name='health_check'),
     path('api/users/', include('users.urls')),
 ]
@@ -1,17 +1,28 @@
 import requests
 import os
+import copy
 import logging
 from django.conf import settings
 from rest_framework import authentication
 from rest_framework import exceptions
-from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth.models import User
 import jwt
 from jwt.exceptions import PyJWTError
 
+from .token_cache import TokenCache
+from .tokens import AccessToken, denylist
+
 logger = logging.getLogger(__name__)
 
+# Verified tokens and their users, so repeat requests skip the signature check
+# and the user query
+token_cache = TokenCache(
+    max_entries=settings.JWT_AUTH_CACHE_SIZE,
+    max_ttl=settings.JWT_AUTH_CACHE_TTL,
+)
+
 class JWTAuthentication(authentication.BaseAuthentication):
     def authenticate(self, request):
         auth_header = request.headers.get('Authorization')
@@ -23,17 +34,28 @@ class JWTAuthentication(authentication.BaseAuthentication):
 
         try:
             token = auth_header.split(' ')[1]
-            
-            # Use proper token validation
-            access_token = AccessToken(token)
-            user_id = access_token['user_id']
-            
-            # Try to find the user
-            try:
-                user = User.objects.get(id=user_id)
-                return (user, None)
-            except User.DoesNotExist:
-                raise exceptions.AuthenticationFailed('User not found')
+
+            cached = token_cache.get(token)
+            if cached is None:
+                # Use proper token validation
+                access_token = AccessToken(token)
+                user_id = access_token['user_id']
+
+                # Try to find the user
+                try:
+                    user = User.objects.get(id=user_id)
+                except User.DoesNotExist:
+                    raise exceptions.AuthenticationFailed('User not found')
+
+                cached = (access_token.payload, user)
+                token_cache.set(token, cached, access_token['exp'])
+
+            claims, user = cached
+            # Checked on every request: a cached token may have been revoked since
+            if denylist is not None and claims.get(api_settings.JTI_CLAIM) in denylist:
+                raise TokenError('Token has been revoked')
+            # Hand out a copy so request-level changes never leak into the cache
+            return (copy.copy(user), None)
                 
         except TokenError as e:
             logger.error(f"Token error: {str(e)}")
@@ -0,0 +1,216 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+
+from .serializers import UserSerializer
+
+
+class ProfileCache:
+    """
+    Read-through cache of profile data (UserSerializer output) keyed by user id.
+
+    Lookups go through a bounded in-process LRU, then an optional shared Django
+    cache backend, then the database. Concurrent misses for the same user in a
+    process wait for a single load, and the shared tier takes a short-lived
+    lock so only one process reloads a hot key at a time. Each user has a
+    generation, bumped by invalidate() in this process and in the shared tier,
+    so a load that started before an invalidation isn't stored after it.
+    """
+    key_prefix = 'profile:'
+
+    def __init__(self, local_size=10000, local_ttl=30, shared_alias=None, shared_ttl=300,
+                 lock_timeout=5):
+        self.local_size = local_size
+        self.local_ttl = local_ttl
+        self.shared_alias = shared_alias
+        self.shared_ttl = shared_ttl
+        self.lock_timeout = lock_timeout
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._local = OrderedDict()
+        self._inflight = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias] if self.shared_alias else None
+
+    def get(self, user_id):
+        """Return the profile dict for user_id, or None if the user doesn't exist."""
+        return self.get_many([user_id]).get(user_id)
+
+    def get_many(self, user_ids):
+        found = {}
+        pending = []
+        for user_id in user_ids:
+            data = self._get_local(user_id)
+            if data is None:
+                pending.append(user_id)
+            else:
+                found[user_id] = data
+        with self._lock:
+            self.local_hits += len(found)
+
+        if pending and self.shared is not None:
+            shared = self.shared.get_many([self.key(user_id) for user_id in pending])
+            for user_id in list(pending):
+                data = shared.get(self.key(user_id))
+                if data is not None:
+                    found[user_id] = data
+                    self._set_local(user_id, data)
+                    pending.remove(user_id)
+                    with self._lock:
+                        self.shared_hits += 1
+
+        if pending:
+            with self._lock:
+                self.misses += len(pending)
+            if len(pending) == 1:
+                data = self._load_once(pending[0])
+                if data is not None:
+                    found[pending[0]] = data
+            else:
+                generations = self._generations_of(pending)
+                loaded = self.load_many(pending)
+                for user_id, data in loaded.items():
+                    self._store(user_id, data, generations[user_id])
+                found.update(loaded)
+        return found
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._local.pop(user_id, None)
+            self._generations[user_id] = self._generations.get(user_id, 0) + 1
+        shared = self.shared
+        if shared is not None:
+            shared.delete(self.key(user_id))
+            generation_key = f'{self.key(user_id)}:generation'
+            # Outlives any load in flight, so it can't fall back to an old value
+            shared.add(generation_key, 0, self.shared_ttl)
+            shared.incr(generation_key)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+            self.local_hits = self.shared_hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.local_hits + self.shared_hits + self.misses
+            return {
+                'size': len(self._local),
+                'local_hits': self.local_hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_ratio': (self.local_hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+    def key(self, user_id):
+        return f'{self.key_prefix}{user_id}'
+
+    def load_many(self, user_ids):
+        users = User.objects.filter(id__in=user_ids).only('id', 'username', 'date_joined')
+        return {user.id: dict(UserSerializer(user).data) for user in users}
+
+    def _load_once(self, user_id):
+        # Single-flight: the first caller loads, concurrent callers wait for it
+        with self._lock:
+            event = self._inflight.get(user_id)
+            leader = event is None
+            if leader:
+                event = self._inflight[user_id] = threading.Event()
+
+        if not leader:
+            event.wait(self.lock_timeout)
+            data = self._get_local(user_id)
+            return data if data is not None else self.load_many([user_id]).get(user_id)
+
+        try:
+            generation = self._generations_of([user_id])[user_id]
+            data = self._load_shared_once(user_id)
+            if data is not None:
+                self._store(user_id, data, generation)
+            return data
+        finally:
+            with self._lock:
+                del self._inflight[user_id]
+            event.set()
+
+    def _load_shared_once(self, user_id):
+        shared = self.shared
+        if shared is None:
+            return self.load_many([user_id]).get(user_id)
+
+        lock_key = f'{self.key(user_id)}:lock'
+        locked = shared.add(lock_key, 1, self.lock_timeout)
+        if not locked:
+            # Another process is loading this user; give it a moment
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                data = shared.get(self.key(user_id))
+                if data is not None:
+                    return data
+        try:
+            return self.load_many([user_id]).get(user_id)
+        finally:
+            # After a timed out wait the lock is still another process's
+            if locked:
+                shared.delete(lock_key)
+
+    def _generations_of(self, user_ids):
+        """The current (local, shared) generation of each user."""
+        with self._lock:
+            local = {user_id: self._generations.get(user_id, 0) for user_id in user_ids}
+        shared = {}
+        if self.shared is not None:
+            shared = self.shared.get_many([f'{self.key(user_id)}:generation' for user_id in user_ids])
+        return {
+            user_id: (local[user_id], shared.get(f'{self.key(user_id)}:generation', 0))
+            for user_id in user_ids
+        }
+
+    def _store(self, user_id, data, generation):
+        # Loaded before an invalidation: the next lookup reloads it instead
+        if self._generations_of([user_id])[user_id] != generation:
+            return
+        self._set_local(user_id, data, generation[0])
+        if self.shared is not None:
+            self.shared.set(self.key(user_id), data, self.shared_ttl)
+
+    def _get_local(self, user_id):
+        with self._lock:
+            entry = self._local.get(user_id)
+            if entry is None:
+                return None
+            expires_at, data = entry
+            if expires_at <= time.monotonic():
+                del self._local[user_id]
+                return None
+            self._local.move_to_end(user_id)
+            return data
+
+    def _set_local(self, user_id, data, generation=None):
+        if self.local_size <= 0:
+            return
+        with self._lock:
+            if generation is not None and self._generations.get(user_id, 0) != generation:
+                return
+            self._local[user_id] = (time.monotonic() + self.local_ttl, data)
+            self._local.move_to_end(user_id)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+
+profile_cache = ProfileCache(
+    local_size=settings.PROFILE_CACHE_LOCAL_SIZE,
+    local_ttl=settings.PROFILE_CACHE_LOCAL_TTL,
+    shared_alias=settings.PROFILE_CACHE_SHARED_ALIAS,
+    shared_ttl=settings.PROFILE_CACHE_SHARED_TTL,
+)
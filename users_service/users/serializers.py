@@ -1,7 +1,50 @@
 from django.contrib.auth.models import User
-from rest_framework import serializers
+from rest_framework import permissions, serializers
 
-class UserSerializer(serializers.ModelSerializer):
+
+def sparse_fieldset(request, serializer_class):
+    """
+    The names of the serializer_class fields a GET asks for with ``?fields=``
+    (only these) or ``?omit=`` (all but these), comma-separated, or None when
+    it asks for neither. Writes always get every field.
+    """
+    if request.method not in permissions.SAFE_METHODS:
+        return None
+    only, omit = request.query_params.get('fields'), request.query_params.get('omit')
+    if only is None and omit is None:
+        return None
+    if only is not None and omit is not None:
+        raise serializers.ValidationError({'fields': 'Use either fields or omit, not both.'})
+
+    param = 'fields' if only is not None else 'omit'
+    names = {name.strip() for name in request.query_params[param].split(',')} - {''}
+    available = serializer_class.Meta.fields
+    unknown = names.difference(available)
+    if unknown:
+        raise serializers.ValidationError({param: f"Unknown fields: {', '.join(sorted(unknown))}."})
+    if param == 'fields':
+        if not names:
+            raise serializers.ValidationError({'fields': 'Name at least one field.'})
+        return frozenset(names)
+    return frozenset(available).difference(names)
+
+
+class SparseFieldsetMixin:
+    """
+    Renders only the fields in the ``fields`` context entry (as returned by
+    sparse_fieldset), when it is set. Nested serializers always render in full.
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = self.context.get('fields')
+        parent = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if selected is None or parent is not None:
+            return fields
+        return {name: field for name, field in fields.items() if name in selected}
+
+
+class UserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'date_joined')
@@ -15,7 +58,7 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
-class PublicUserSerializer(serializers.ModelSerializer):
+class PublicUserSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     """
     A limited serializer for public user data, exposing only the ID and username.
     Used when returning user data to non-authenticated requests or other users.
@@ -1,3 +1,264 @@
-from django.test import TestCase
+from cryptography.hazmat.primitives.asymmetric import rsa
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from core.denylist import Denylist
+from core.jwks import KeySet, KeySetTokenBackend, public_jwk
+
+import threading
+import time
+from unittest import mock
+
+from .authentication import token_cache
+from .profile_cache import profile_cache
+from . import tokens
+
+
+class TokenCacheTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        profile_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='password')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_repeat_requests_skip_the_user_query(self):
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+        # The authentication query; the profile itself is cached afterwards
+        self.assertEqual(len(first.captured_queries), 2)
+        self.assertEqual(len(second.captured_queries), 0)
+        self.assertEqual(token_cache.stats()['hits'], 1)
+
+    def test_update_drops_cached_user(self):
+        self.client.get('/api/users/me/')
+        self.client.put('/api/users/me/', {'username': 'alicia'})
+
+        response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['username'], 'alicia')
+
+
+class UsersBatchTests(APITestCase):
+    def setUp(self):
+        profile_cache.clear()
+        self.users = [User.objects.create_user(username=f'user{i}') for i in range(3)]
+
+    def test_get_resolves_ids_in_one_query(self):
+        ids = [self.users[2].id, 999, self.users[0].id, self.users[2].id]
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/batch/', {'ids': ','.join(map(str, ids))})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'], [
+            {'id': self.users[2].id, 'username': 'user2'},
+            {'id': self.users[0].id, 'username': 'user0'},
+        ])
+        self.assertEqual(response.data['missing'], [999])
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+
+    def test_post_accepts_a_json_list(self):
+        response = self.client.post('/api/users/batch/', {'ids': [u.id for u in self.users]}, format='json')
+        self.assertEqual(len(response.data['results']), 3)
+        self.assertEqual(response.data['missing'], [])
+        self.assertIn('no-store', response['Cache-Control'])
+
+    def test_rejects_bad_input(self):
+        self.assertEqual(self.client.get('/api/users/batch/').status_code, 400)
+        self.assertEqual(self.client.get('/api/users/batch/', {'ids': '1,x'}).status_code, 400)
+        with self.settings(USERS_BATCH_MAX_IDS=2):
+            self.assertEqual(self.client.get('/api/users/batch/', {'ids': '1,2,3'}).status_code, 400)
+        for body in ([1, 2], 3, 'ids'):
+            with self.subTest(body=body):
+                self.assertEqual(self.client.post('/api/users/batch/', body, format='json').status_code, 400)
+
+
+class ProfileCacheTests(APITestCase):
+    def setUp(self):
+        profile_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='password')
+        self.url = f'/api/users/{self.user.id}/'
+
+    def test_reads_are_served_from_memory(self):
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+            self.client.get('/api/users/batch/', {'ids': str(self.user.id)})
+
+        self.assertEqual(response.data, {'id': self.user.id, 'username': 'alice'})
+        self.assertEqual(profile_cache.stats()['hit_ratio'], 2 / 3)
+
+    def test_missing_user(self):
+        self.assertEqual(self.client.get('/api/users/999/').status_code, 404)
+
+    def test_writes_invalidate(self):
+        self.client.get(self.url)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        self.client.patch('/api/users/me/', {'username': 'alicia'})
+        self.assertEqual(self.client.get(self.url).data['username'], 'alicia')
+
+        self.client.delete('/api/users/me/')
+        self.client.credentials()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+
+    def test_shared_tier_survives_local_eviction(self):
+        with mock.patch.object(profile_cache, 'shared_alias', 'profiles'):
+            self.client.get(self.url)
+            profile_cache.clear()
+            with self.assertNumQueries(0):
+                self.assertEqual(self.client.get(self.url).data['username'], 'alice')
+            self.assertEqual(profile_cache.stats()['shared_hits'], 1)
+            profile_cache.invalidate(self.user.id)
+
+    def test_concurrent_misses_load_once(self):
+        calls = []
+
+        def slow_load(user_ids):
+            calls.append(user_ids)
+            time.sleep(0.1)
+            return {user_id: {'id': user_id, 'username': 'alice'} for user_id in user_ids}
+
+        with mock.patch.object(profile_cache, 'load_many', side_effect=slow_load):
+            threads = [threading.Thread(target=profile_cache.get, args=(self.user.id,)) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(calls, [[self.user.id]])
+
+    def test_load_racing_an_invalidation_is_not_stored(self):
+        load_many = profile_cache.load_many
+
+        def stale_load(user_ids):
+            loaded = load_many(user_ids)
+            profile_cache.invalidate(self.user.id)
+            return loaded
+
+        with mock.patch.object(profile_cache, 'shared_alias', 'profiles'):
+            with mock.patch.object(profile_cache, 'load_many', side_effect=stale_load):
+                self.client.get(self.url)
+            with self.assertNumQueries(1):
+                self.client.get(self.url)
+            profile_cache.invalidate(self.user.id)
+
+    def test_keeps_another_process_lock(self):
+        shared = caches['profiles']
+        lock_key = f'{profile_cache.key(self.user.id)}:lock'
+        shared.add(lock_key, 1, 60)
+        with mock.patch.multiple(profile_cache, shared_alias='profiles', lock_timeout=0.1):
+            self.assertEqual(self.client.get(self.url).data['username'], 'alice')
+            self.assertEqual(shared.get(lock_key), 1)
+            shared.delete(lock_key)
+            profile_cache.invalidate(self.user.id)
+
+
+class ConditionalGetTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        profile_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='password')
+        self.url = f'/api/users/{self.user.id}/'
+
+    def test_unchanged_profile_returns_304_from_memory(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response['Cache-Control'], 'public, no-cache')
+
+        with self.assertNumQueries(0):
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+
+    def test_update_changes_the_etag(self):
+        response = self.client.get(self.url)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        me = self.client.get('/api/users/me/')
+        self.assertIn('private', me['Cache-Control'])
+        self.assertEqual(self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=me['ETag']).status_code, 304)
+
+        self.client.patch('/api/users/me/', {'username': 'alicia'})
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+        self.assertEqual(self.client.get('/api/users/me/', HTTP_IF_NONE_MATCH=me['ETag']).status_code, 200)
+
+    def test_batch_revalidates(self):
+        url = f'/api/users/batch/?ids={self.user.id}'
+        response = self.client.get(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+
+class SparseFieldsetTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        profile_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='password')
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_fields_and_omit(self):
+        self.assertEqual(self.client.get('/api/users/me/?fields=username').data, {'username': 'alice'})
+        self.assertEqual(self.client.get('/api/users/me/?omit=date_joined').data, {'id': self.user.id, 'username': 'alice'})
+        self.assertEqual(self.client.get(f'/api/users/{self.user.id}/?fields=username').data, {'username': 'alice'})
+        response = self.client.get(f'/api/users/batch/?ids={self.user.id}&omit=username')
+        self.assertEqual(response.data['results'], [{'id': self.user.id}])
+
+    def test_trimmed_responses_have_their_own_etag(self):
+        full = self.client.get('/api/users/me/')
+        trimmed = self.client.get('/api/users/me/?fields=id', HTTP_IF_NONE_MATCH=full['ETag'])
+        self.assertEqual(trimmed.status_code, 200)
+        self.assertNotEqual(trimmed['ETag'], full['ETag'])
+
+    def test_invalid_fieldsets(self):
+        for url in ('/api/users/me/?fields=password', f'/api/users/{self.user.id}/?fields=date_joined',
+                    f'/api/users/batch/?ids={self.user.id}&fields=id&omit=username'):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 400)
+
+    def test_writes_render_every_field(self):
+        response = self.client.patch('/api/users/me/?fields=id', {'username': 'alicia'})
+        self.assertEqual(response.data['username'], 'alicia')
+        self.assertIn('date_joined', response.data)
+
+
+class KeySetAuthenticationTests(APITestCase):
+    def setUp(self):
+        token_cache.clear()
+        profile_cache.clear()
+        self.user = User.objects.create_user(username='alice', password='password')
+
+    def test_tokens_verify_with_the_auth_service_keys(self):
+        key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        jwk = public_jwk(key.public_key(), 'RS256')
+        signer = KeySetTokenBackend('RS256', key, kid=jwk['kid'])
+        verifier = KeySetTokenBackend('RS256', key_set=KeySet(keys=[jwk]))
+
+        with mock.patch.object(tokens.AccessToken, '_token_backend', signer):
+            token = str(tokens.AccessToken.for_user(self.user))
+        with mock.patch.object(tokens.AccessToken, '_token_backend', verifier):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(self.client.get('/api/users/me/').data['username'], 'alice')
+
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+            self.assertEqual(self.client.get('/api/users/me/').status_code, 403)
+
+
+class RevocationTests(APITestCase):
+    def test_revoked_tokens_are_refused_even_when_cached(self):
+        token_cache.clear()
+        profile_cache.clear()
+        user = User.objects.create_user(username='alice', password='password')
+        token = AccessToken.for_user(user)
+        denylist = Denylist('http://auth/revocations/')
+        denylist._ensure_poller = mock.Mock()
+        denylist.fetch = lambda after: [{'id': 1, 'jti': token['jti'], 'exp': token['exp']}][after:]
+
+        with mock.patch('users.authentication.denylist', denylist):
+            self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+            self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+            self.assertTrue(denylist.sync())
+            self.assertEqual(self.client.get('/api/users/me/').status_code, 403)
@@ -3,5 +3,6 @@ from . import views
 
 urlpatterns = [
     path('me/', views.UserDetailView.as_view(), name='user-detail'),
+    path('batch/', views.get_users_batch, name='users-batch'),
     path('<int:user_id>/', views.get_user_by_id, name='user-by-id'),
 ] 
\ No newline at end of file
@@ -1,18 +1,48 @@
-from django.shortcuts import render, get_object_or_404
+import hashlib
+import json
+
+from django.conf import settings
+from django.shortcuts import render
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
 from rest_framework import status, generics
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import TokenError
-from .serializers import UserSerializer, PublicUserSerializer
-from .authentication import JWTAuthentication
+from .serializers import UserSerializer, PublicUserSerializer, sparse_fieldset
+from .authentication import JWTAuthentication, token_cache
+from .tokens import AccessToken
+from .profile_cache import profile_cache
 from django.contrib.auth.models import User
 
 # Create your views here.
 
 
+def public_profile(profile, fields=None):
+    # Project cached UserSerializer data onto the PublicUserSerializer fields
+    return project(profile, PublicUserSerializer.Meta.fields, fields)
+
+
+def project(profile, names, fields=None):
+    # Cached profiles are complete; ?fields= and ?omit= trim them per response
+    return {name: profile[name] for name in names if fields is None or name in fields}
+
+
+def conditional_response(request, data, **cache_control):
+    """
+    Respond with data and an ETag derived from it, or with a 304 when the
+    client's If-None-Match already matches. The data comes from the profile
+    cache, so validating costs no database round trip.
+    """
+    etag = '"%s"' % hashlib.md5(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+    response = get_conditional_response(request, etag=etag) or Response(data)
+    response['ETag'] = etag
+    patch_cache_control(response, **cache_control)
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def verify_token(request):
@@ -38,15 +68,53 @@ def verify_token(request):
 @permission_classes([AllowAny])  # Anyone can fetch basic user info
 def get_user_by_id(request, user_id):
     try:
-        user = get_object_or_404(User, id=user_id)
-        serializer = PublicUserSerializer(user)
-        return Response(serializer.data)
-    except User.DoesNotExist:
-        return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+        fields = sparse_fieldset(request, PublicUserSerializer)
+        profile = profile_cache.get(user_id)
+        if profile is None:
+            return Response({'detail': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+        return conditional_response(request, public_profile(profile, fields), public=True, no_cache=True)
+    except ValidationError:
+        raise
     except Exception:
         return Response({'detail': 'Error retrieving user'}, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET', 'POST'])
+@permission_classes([AllowAny])  # Same public data as get_user_by_id
+def get_users_batch(request):
+    """
+    Resolve many users at once: GET ?ids=1,2,3 or POST {"ids": [1, 2, 3]}.
+    Cached profiles are served from memory and the rest load in one query.
+    Ids that don't exist are listed under "missing".
+    """
+    if request.method == 'POST':
+        raw_ids = request.data.get('ids') if isinstance(request.data, dict) else None
+    else:
+        raw_ids = [part for part in request.query_params.get('ids', '').split(',') if part]
+
+    if not isinstance(raw_ids, list) or not raw_ids:
+        return Response({'detail': 'ids must be a non-empty list of user ids'},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        # Deduplicate while keeping the caller's order
+        ids = list(dict.fromkeys(int(user_id) for user_id in raw_ids))
+    except (TypeError, ValueError):
+        return Response({'detail': 'ids must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+    if len(ids) > settings.USERS_BATCH_MAX_IDS:
+        return Response({'detail': f'At most {settings.USERS_BATCH_MAX_IDS} ids per request'},
+                        status=status.HTTP_400_BAD_REQUEST)
+
+    fields = sparse_fieldset(request, PublicUserSerializer)
+    profiles = profile_cache.get_many(ids)
+    data = {
+        'results': [public_profile(profiles[user_id], fields) for user_id in ids if user_id in profiles],
+        'missing': [user_id for user_id in ids if user_id not in profiles],
+    }
+    if request.method == 'GET':
+        return conditional_response(request, data, public=True, max_age=settings.USERS_BATCH_CACHE_SECONDS)
+    return Response(data)
+
+
 class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = UserSerializer
     authentication_classes = [JWTAuthentication]
@@ -56,6 +124,21 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
         # Return the authenticated user
         return self.request.user
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fields'] = sparse_fieldset(self.request, UserSerializer)
+        return context
+
+    def retrieve(self, request, *args, **kwargs):
+        fields = sparse_fieldset(request, UserSerializer)
+        profile = profile_cache.get(request.user.id)
+        if profile is None:
+            return super().retrieve(request, *args, **kwargs)
+        profile = project(profile, UserSerializer.Meta.fields, fields)
+        response = conditional_response(request, profile, private=True, no_cache=True)
+        patch_vary_headers(response, ('Authorization',))
+        return response
+
     def update(self, request, *args, **kwargs):
         user = self.get_object()
         serializer = self.get_serializer(user, data=request.data, partial=True)
@@ -67,10 +150,18 @@ class UserDetailView(generics.RetrieveUpdateDestroyAPIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             serializer.save()
+            self.forget_cached_user(user.id)
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def delete(self, request, *args, **kwargs):
         user = self.get_object()
+        user_id = user.id
         user.delete()
+        self.forget_cached_user(user_id)
         return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def forget_cached_user(self, user_id):
+        # Tokens cached by the authenticator still carry the old user
+        token_cache.discard(lambda entry: entry[1].id == user_id)
+        profile_cache.invalidate(user_id)